@@ -4,10 +4,15 @@ from aiogram import Bot, Dispatcher
 from logging_config import setup_logging
 from config import load_config
 from middlewares.timing import TimingMW
+from middlewares.db_session import DbSessionMiddleware
 from routes import router as main_router
 from routes.options import router as options_router
 from options.registry import load_all_options
+from screens.templates import preload_screen_templates
 from middlewares.user_registration import UserRegistrationMiddleware
+from services.delivery import get_delivery
+from services.message_store import get_message_store
+from services.sheets_outbox import SheetsOutboxFlusher
 from text_handlers import load_all_text_handlers, _REGISTRY
 
 
@@ -22,9 +27,12 @@ async def main():
     load_all_options()
     load_all_text_handlers("text_handlers")  # <-- ВАЖНО: до start_polling
     logging.info("Text handlers at start: %s", list(_REGISTRY.keys()))
+    # 2) компилируем шаблоны всех экранов; если у экрана нет шаблона — не стартуем
+    preload_screen_templates()
 
     dp = Dispatcher()
     dp.update.middleware(TimingMW())
+    dp.update.middleware(DbSessionMiddleware())  # одна сессия БД на апдейт
     dp.message.middleware(UserRegistrationMiddleware())
     dp.callback_query.middleware(UserRegistrationMiddleware())
 
@@ -33,6 +41,13 @@ async def main():
     # затем универсальный обработчик опций
     dp.include_router(options_router)
 
+    # фоновая запись в Google Sheets из outbox
+    sheets_flusher = SheetsOutboxFlusher()
+    sheets_flusher.start()
+    # фоновая запись указателей на главные экраны в БД
+    message_store = get_message_store()
+    message_store.start()
+
     try:
         await dp.start_polling(bot)
     except (asyncio.CancelledError, KeyboardInterrupt):
@@ -41,6 +56,10 @@ async def main():
         logging.exception("Fatal error in polling")
         raise
     finally:
+        # досылаем то, что уже стоит в очереди доставки и в outbox, дописываем указатели экранов
+        await get_delivery().stop()
+        await sheets_flusher.stop()
+        await message_store.stop()
         logging.info("Bot stopped.")
 
 
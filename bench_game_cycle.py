@@ -0,0 +1,415 @@
+# bench_game_cycle.py
+"""
+Бенчмарк игрового цикла (commands.run_game_cycle) на синтетическом мире.
+
+Запуск:
+    python bench_game_cycle.py --users 300 --districts 80 --actions 3000 --out bench_before.json
+    # ... оптимизация ...
+    python bench_game_cycle.py --users 300 --districts 80 --actions 3000 --compare bench_before.json
+
+Что делает:
+- генерирует мир в отдельной БД (по умолчанию — SQLite во временном каталоге; --db-url —
+  например, локальный Postgres): игроки, районы, политики, pending-заявки
+  attack/defend/support/influence/scout, on_point-атаки и «спорные» районы
+  (on_point атака и оборона в одном районе);
+- гоняет полный цикл; бот и Google Sheets заменены заглушками (сообщения и RAW-строки
+  только считаются), XLSX и маркер цикла пишутся в рабочий каталог бенчмарка;
+- по каждому шагу (StepTimer) меряет время, число SQL-запросов и пиковый RSS;
+- --repeat N — N прогонов на одном и том же мире (seed), в сводке медиана;
+- --out — JSON-отчёт, --compare — сравнение с прошлым отчётом.
+
+Боевую БД не трогает: DATABASE_URL подменяется до импорта модулей бота.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROJECT_DIR = Path(__file__).resolve().parent
+
+log = logging.getLogger("bench_game_cycle")
+
+
+# ===========================
+#     Заглушки бота/Sheets
+# ===========================
+class _BenchMessage:
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+
+
+class _BenchBot:
+    """Вместо aiogram.Bot: ничего не отправляет, только считает."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **_: Any) -> _BenchMessage:
+        self.sent += 1
+        return _BenchMessage(self.sent)
+
+    async def edit_message_text(self, **_: Any) -> _BenchMessage:
+        self.sent += 1
+        return _BenchMessage(self.sent)
+
+
+class _BenchSheets:
+    """Вместо utils.raw_body_input.add_raw_rows: номера строк без похода в Sheets."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def add_raw_rows(self, payloads: List[Dict[str, Any]]) -> List[int]:
+        start = self.rows
+        self.rows += len(payloads)
+        return list(range(start + 1, self.rows + 1))
+
+
+# ===========================
+#        Счётчики
+# ===========================
+class _StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def install(self) -> None:
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        # на классе Engine — видит и движок цикла, который commands создаёт сам
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_: Any) -> None:
+        self.count += 1
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss: КБ в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _make_step_timer(base_cls, records: List[Dict[str, Any]], counter: _StatementCounter):
+    """StepTimer цикла, который вдобавок к логу пишет замер шага в records."""
+    depth = {"value": 0}
+
+    class BenchStepTimer(base_cls):
+        def __enter__(self):
+            self._depth = depth["value"]
+            depth["value"] += 1
+            self._statements = counter.count
+            return super().__enter__()
+
+        def __exit__(self, exc_type, exc, tb):
+            result = super().__exit__(exc_type, exc, tb)
+            depth["value"] -= 1
+            records.append({
+                "name": self.name,
+                "depth": self._depth,
+                "wall_s": round(time.perf_counter() - self._start, 4),
+                "statements": counter.count - self._statements,
+                "peak_rss_mb": _peak_rss_mb(),
+                "ok": exc_type is None,
+            })
+            return result
+
+    return BenchStepTimer
+
+
+# ===========================
+#     Генератор мира
+# ===========================
+async def build_world(engine, args: argparse.Namespace) -> Dict[str, int]:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    from db.models import (
+        Action, ActionStatus, ActionType, Base, District, Politician, User, user_scouts_districts,
+    )
+
+    rnd = random.Random(args.seed)
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def created_at() -> datetime:
+        return t0 + timedelta(minutes=rnd.randint(0, 10_000))
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    factory = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    async with factory() as session:
+        users = [
+            User(
+                tg_id=10_000 + i, username=f"bench{i}", in_game_name=f"Игрок {i}",
+                ideology=rnd.randint(-5, 5), faction=rnd.choice([None, "A", "B", "C"]),
+                money=rnd.randint(0, 50), influence=rnd.randint(0, 5), information=rnd.randint(0, 5),
+                force=rnd.randint(0, 10),
+                base_money=rnd.randint(-2, 10), base_influence=rnd.randint(0, 3),
+                base_information=rnd.randint(0, 2), base_force=rnd.randint(0, 2),
+                available_actions=rnd.randint(0, 5),
+            )
+            for i in range(args.users)
+        ]
+        session.add_all(users)
+        await session.flush()
+
+        districts = [
+            District(
+                name=f"Район {i}", owner_id=rnd.choice(users).id, control_points=rnd.randint(0, 60),
+                resource_multiplier=rnd.choice([0.4, 0.7, 1.0, 1.2]),
+                base_money=rnd.randint(50, 150), base_force=rnd.randint(0, 3),
+            )
+            for i in range(args.districts)
+        ]
+        session.add_all(districts)
+        await session.flush()
+
+        politicians = [
+            Politician(name=f"Политик {i}", role_and_influence="bench", district_id=d.id,
+                       ideology=rnd.randint(-5, 5))
+            for i, d in enumerate(districts) if rnd.random() < args.politicians
+        ]
+        politicians.append(Politician(name="Свободный политик", role_and_influence="bench", district_id=None))
+        session.add_all(politicians)
+        await session.flush()
+
+        # основные заявки
+        kinds = ["attack"] * 4 + ["defend"] * 3 + ["influence"] * 2 + ["scout"]
+        actions: List[Action] = []
+        for _ in range(args.actions):
+            kind = rnd.choice(kinds)
+            actions.append(Action(
+                owner_id=rnd.choice(users).id, kind=kind, status=ActionStatus.PENDING,
+                district_id=rnd.choice(districts).id,
+                type={"scout": ActionType.SCOUT_DISTRICT, "influence": ActionType.INFLUENCE}.get(kind, ActionType.INDIVIDUAL),
+                force=rnd.randint(0, 4), money=rnd.randint(0, 10), influence=rnd.randint(0, 3),
+                information=rnd.randint(-1, 3), is_positive=rnd.choice([True, False, None]),
+                on_point=kind in ("attack", "defend") and rnd.random() < args.on_point,
+                created_at=created_at(),
+            ))
+        session.add_all(actions)
+        await session.flush()
+
+        # спорные районы: on_point атака и оборона в одном районе
+        contested = rnd.sample(districts, min(args.contested, len(districts)))
+        on_point_pairs = [
+            Action(
+                owner_id=rnd.choice(users).id, kind=kind, status=ActionStatus.PENDING,
+                district_id=d.id, type=ActionType.INDIVIDUAL, on_point=True,
+                force=rnd.randint(1, 4), money=rnd.randint(0, 10), created_at=created_at(),
+            )
+            for d in contested for kind in ("attack", "defend")
+        ]
+        session.add_all(on_point_pairs)
+        actions.extend(on_point_pairs)
+        await session.flush()
+
+        # поддержки к атакам/оборонам
+        parents = [a for a in actions if a.kind in ("attack", "defend") and a.id is not None]
+        supports = [
+            Action(
+                owner_id=rnd.choice(users).id, kind=p.kind, status=ActionStatus.PENDING,
+                district_id=p.district_id, type=ActionType.SUPPORT, parent_action_id=p.id,
+                force=rnd.randint(0, 3), money=rnd.randint(0, 5), created_at=created_at(),
+            )
+            for p in (rnd.choice(parents) for _ in range(int(len(parents) * args.supports)))
+        ] if parents else []
+        session.add_all(supports)
+
+        # уже открытые разведки (их закрывает шаг 3)
+        pairs = {(rnd.choice(users).id, rnd.choice(districts).id) for _ in range(args.users // 5)}
+        if pairs:
+            await session.execute(
+                user_scouts_districts.insert(), [{"user_id": u, "district_id": d} for u, d in pairs]
+            )
+        await session.commit()
+
+    return {
+        "users": len(users),
+        "districts": len(districts),
+        "politicians": len(politicians),
+        "actions": len(actions),
+        "supports": len(supports),
+        "contested": len(contested),
+    }
+
+
+# ===========================
+#          Прогон
+# ===========================
+async def run_bench(args: argparse.Namespace) -> Dict[str, Any]:
+    import commands
+    from services.delivery import get_delivery
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    bot, sheets = _BenchBot(), _BenchSheets()
+    # commands импортирует бота лениво (from app import bot) — подставляем модуль-заглушку
+    app_stub = types.ModuleType("app")
+    app_stub.bot = bot
+    sys.modules["app"] = app_stub
+    commands.add_raw_rows = sheets.add_raw_rows
+
+    counter = _StatementCounter()
+    counter.install()
+    base_timer = commands.StepTimer
+
+    runs: List[Dict[str, Any]] = []
+    world: Dict[str, int] = {}
+    engine = create_async_engine(commands.DATABASE_URL)
+    try:
+        for i in range(args.repeat):
+            world = await build_world(engine, args)
+            records: List[Dict[str, Any]] = []
+            commands.StepTimer = _make_step_timer(base_timer, records, counter)
+            sent_before, rows_before, statements_before = bot.sent, sheets.rows, counter.count
+            started = time.perf_counter()
+            try:
+                await commands.run_game_cycle()
+            finally:
+                commands.StepTimer = base_timer
+            runs.append({
+                "total_wall_s": round(time.perf_counter() - started, 4),
+                "total_statements": counter.count - statements_before,
+                "peak_rss_mb": _peak_rss_mb(),
+                "messages_sent": bot.sent - sent_before,
+                "raw_rows": sheets.rows - rows_before,
+                "steps": records,
+            })
+            log.info("Прогон %d/%d: %.3fs, %d SQL", i + 1, args.repeat,
+                     runs[-1]["total_wall_s"], runs[-1]["total_statements"])
+    finally:
+        await get_delivery().stop()
+        await engine.dispose()
+
+    return {
+        "params": {k: getattr(args, k) for k in ("users", "districts", "actions", "politicians",
+                                                   "supports", "on_point", "contested", "seed", "repeat")},
+        "db": commands.DATABASE_URL.split("://", 1)[0],
+        "world": world,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "summary": summarize(runs),
+        "runs": runs,
+    }
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Медиана по прогонам; шаги — по имени, в порядке первого прогона."""
+    steps: Dict[str, Dict[str, Any]] = {}
+    for run in runs:
+        for rec in run["steps"]:
+            s = steps.setdefault(rec["name"], {"depth": rec["depth"], "wall_s": [], "statements": [], "peak_rss_mb": []})
+            for k in ("wall_s", "statements", "peak_rss_mb"):
+                s[k].append(rec[k])
+    return {
+        "total_wall_s": statistics.median(r["total_wall_s"] for r in runs),
+        "total_statements": statistics.median(r["total_statements"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "steps": {
+            name: {
+                "depth": s["depth"],
+                "wall_s": round(statistics.median(s["wall_s"]), 4),
+                "statements": statistics.median(s["statements"]),
+                "peak_rss_mb": max(s["peak_rss_mb"]),
+            }
+            for name, s in steps.items()
+        },
+    }
+
+
+# ===========================
+#          Отчёт
+# ===========================
+def _delta(after: float, before: Optional[float]) -> str:
+    if before is None:
+        return ""
+    if not before:
+        return f"{before:g} → {after:g}"
+    return f"{before:g} → {after:g} ({(after - before) / before * 100:+.0f}%)"
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    summary = report["summary"]
+    base = (baseline or {}).get("summary", {})
+    base_steps = base.get("steps", {})
+    if baseline and baseline.get("params") != report["params"]:
+        print("! параметры мира отличаются от базового отчёта — сравнение условное")
+
+    print(f"Мир: {report['world']}  БД: {report['db']}  прогонов: {report['params']['repeat']}")
+    width = max([len(n) + 2 * s["depth"] for n, s in summary["steps"].items()] + [10])
+    print(f"{'шаг':<{width}}  {'время, s':>10}  {'SQL':>7}  {'RSS, MB':>8}")
+    for name, s in summary["steps"].items():
+        label = "  " * s["depth"] + name
+        print(f"{label:<{width}}  {s['wall_s']:>10.4f}  {s['statements']:>7g}  {s['peak_rss_mb']:>8.1f}")
+        b = base_steps.get(name)
+        if b:
+            print(f"{'':<{width}}  время {_delta(s['wall_s'], b['wall_s'])}; SQL {_delta(s['statements'], b['statements'])}")
+    print(f"ИТОГО: {summary['total_wall_s']:.4f}s, SQL {summary['total_statements']:g}, пиковый RSS {summary['peak_rss_mb']} MB")
+    if base:
+        print(f"  было: время {_delta(summary['total_wall_s'], base.get('total_wall_s'))}; "
+              f"SQL {_delta(summary['total_statements'], base.get('total_statements'))}; "
+              f"RSS {_delta(summary['peak_rss_mb'], base.get('peak_rss_mb'))}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Бенчмарк игрового цикла на синтетическом мире")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--districts", type=int, default=50)
+    p.add_argument("--actions", type=int, default=1000, help="основные pending-заявки (без поддержек)")
+    p.add_argument("--politicians", type=float, default=0.7, help="доля районов с политиком")
+    p.add_argument("--supports", type=float, default=0.25, help="поддержек на одну атаку/оборону")
+    p.add_argument("--on-point", type=float, default=0.08, help="доля атак/оборон «на точку»")
+    p.add_argument("--contested", type=int, default=5, help="районов с on_point атакой и обороной")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--db-url", help="по умолчанию — SQLite в рабочем каталоге (ВСЕ ТАБЛИЦЫ ПЕРЕСОЗДАЮТСЯ)")
+    p.add_argument("--workdir", help="куда писать БД, XLSX и маркер цикла (по умолчанию — временный каталог)")
+    p.add_argument("--out", help="куда сохранить JSON-отчёт")
+    p.add_argument("--compare", help="JSON-отчёт прошлого прогона для сравнения")
+    p.add_argument("--verbose", action="store_true", help="не глушить лог цикла")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    out = Path(args.out).resolve() if args.out else None
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="bench_cycle_")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    # до импорта db.session/commands: их движки читают DATABASE_URL при импорте
+    os.environ["DATABASE_URL"] = args.db_url or f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    os.environ.setdefault("COMBAT_RATES_PATH", str(PROJECT_DIR / "config" / "combat_rates.json"))
+    os.environ.setdefault("TEMPLATE_ROOT", str(PROJECT_DIR / "templates"))
+    os.environ.setdefault("DEFAULT_LOCALIZATION", "ru")
+    os.environ.setdefault("BOT_TOKEN", "0:bench")  # config.load_config требует; в сеть бот не ходит
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.chdir(workdir)
+
+    # до импорта commands (там свой basicConfig): без --verbose лог цикла не мешает отчёту
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+    )
+    log.setLevel(logging.INFO)
+
+    report = asyncio.run(run_bench(args))
+    print_report(report, baseline)
+    if out:
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Отчёт: {out}")
+    print(f"Рабочий каталог: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
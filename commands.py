@@ -13,27 +13,28 @@
   и квантуется шагом 0.1 в диапазоне [0.4..1.2].
 - Оставшаяся оборона после атак → в control_points района.
 - Базовая оборона на цикл формируется из control_points района.
-- Новости пишутся в XLSX (по UTC-таймстампу цикла). Уведомления игрокам — через бота (если доступен).
+- Новости копятся в журнале цикла и пишутся в XLSX одним проходом в конце (по UTC-таймстампу цикла).
+- Уведомления игрокам копятся в сводке цикла и уходят через бота (если доступен) одним сообщением на игрока в конце.
 - Добавлено подробное логирование всех шагов.
 """
 
 import asyncio
-import json
 import logging
 import os
 import time
 from collections import defaultdict
-from dataclasses import dataclass
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from openpyxl import Workbook, load_workbook
-from sqlalchemy import delete, select, update
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from openpyxl import Workbook
+from sqlalchemy import case, delete, event, func, or_, select, true, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from db.instrumentation import instrument_engine, sql_scope
 from db.models import (
     Base,
     User,
@@ -44,8 +45,21 @@ from db.models import (
     ActionType,
     user_scouts_districts,
 )
-from services.notify import notify_user
-from utils.raw_body_input import add_raw_row
+from services.combat import (
+    ATTACK_KIND,
+    DEFENSE_KIND,
+    ActionSnapshot,
+    CombatRates,
+    CombatResult,
+    CombatSnapshot,
+    DistrictSnapshot,
+    PlayerSnapshot,
+    resolve_combat,
+)
+from services.cycle_digest import CycleDigest
+from services.cycle_journal import CycleJournal, acquire_cycle_lock, release_cycle_lock, renew_cycle_lock
+from services.cycle_metrics import CYCLE_METRICS_PROM, CycleMetrics
+from utils.raw_body_input import add_raw_rows, raw_row_payload
 
 
 # ===========================
@@ -54,14 +68,24 @@ from utils.raw_body_input import add_raw_row
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./game.db")
 COMBAT_RATES_PATH = os.getenv("COMBAT_RATES_PATH", "./config/combat_rates.json")
 
-ATTACK_KIND = "attack"
-DEFENSE_KIND = "defend"
 SCOUT_KINDS = {"scout"}
 
 ORDER_ATTACKS_ASC = True  # порядок атак по created_at
 
+# Транзакции цикла (CYCLE_TX_MODE):
+# - steps (по умолчанию) — каждый шаг коммитится вместе со своей записью в журнале
+#   (services.cycle_journal); упавший цикл продолжается с первого невыполненного шага;
+# - savepoint — весь цикл в одной транзакции, commit() шага только отпускает SAVEPOINT;
+# - single — одна транзакция без SAVEPOINT: commit() шага — только flush.
+# В savepoint/single итоговый COMMIT один, упавший цикл откатывается целиком, а RAW-протоколы,
+# XLSX новостей и сводка игрокам уходят только после COMMIT.
+CYCLE_TX_MODE = os.getenv("CYCLE_TX_MODE", "steps").lower()
+_CYCLE_TX_JOIN_MODES = {"savepoint": "create_savepoint", "single": "rollback_only"}
+
 # XLSX-выгрузка новостей
 CYCLE_TS: Optional[str] = None
+# номер попытки цикла по журналу: у продолженного цикла файлы получают суффикс _attemptN
+CYCLE_ATTEMPT = 1
 CYCLE_XLSX_PATH: Optional[Path] = None
 NEWS_HEADERS = ["created_at_utc", "tag", "title", "body", "action_id", "district_id"]
 
@@ -75,8 +99,18 @@ logging.basicConfig(
 log = logging.getLogger("game_cycle")
 
 
+CYCLE_METRICS: Optional[CycleMetrics] = None
+# внешние действия, отложенные до COMMIT транзакции шага/цикла (None — вне транзакции, выполнять сразу)
+CYCLE_AFTER_COMMIT: Optional[List[Callable[[], Awaitable[None]]]] = None
+
+
+def _count_metric(counter: str, n: int = 1) -> None:
+    if CYCLE_METRICS is not None:
+        CYCLE_METRICS.count(counter, n)
+
+
 class StepTimer:
-    """Простой контекстный менеджер для логирования длительности шага."""
+    """Контекстный менеджер шага: логирует длительность и ведёт метрики шага в CYCLE_METRICS."""
 
     def __init__(self, name: str, level: int = logging.INFO):
         self.name = name
@@ -85,11 +119,19 @@ class StepTimer:
 
     def __enter__(self):
         self._start = time.perf_counter()
+        # в метриках цикла (services.cycle_metrics) шаг копит свои счётчики
+        self._step = CYCLE_METRICS.start_step(self.name) if CYCLE_METRICS else None
+        # область учёта SQL (db.instrumentation, SQL_INSTRUMENTATION=1): N+1 и медленные запросы шага
+        self._sql_scope = sql_scope(f"cycle:{self.name}")
+        self._sql_scope.__enter__()
         log.log(self.level, f"▶ {self.name} — старт")
         return self
 
     def __exit__(self, exc_type, exc, tb):
         dur = time.perf_counter() - self._start
+        self._sql_scope.__exit__(exc_type, exc, tb)
+        if self._step is not None and CYCLE_METRICS is not None:
+            CYCLE_METRICS.finish_step(self._step, ok=exc_type is None)
         if exc_type is None:
             log.log(self.level, f"✓ {self.name} — завершено за {dur:.3f}s")
         else:
@@ -107,50 +149,143 @@ def _quantize_tenth(x: float, lo: float = 0.40, hi: float = 1.20) -> float:
     return float(Decimal(str(x)).quantize(Decimal("0.1"), rounding=ROUND_HALF_UP))
 
 
-def _ensure_sheet(wb: Workbook, name: str, headers: List[str]) -> None:
-    if name not in wb.sheetnames:
-        ws = wb.create_sheet(title=name)
-        ws.append(headers)
+class CycleNewsJournal:
+    """
+    Новости цикла копятся в памяти и пишутся в XLSX один раз — в конце run_game_cycle().
+    Лист 'news' — все новости, листы 'district_{id}' — новости конкретного района.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._sheets: Dict[str, List[list]] = {"news": []}
+
+    def __len__(self) -> int:
+        return len(self._sheets["news"])
+
+    def add(self, row: list, district_id: Optional[int] = None) -> None:
+        self._sheets["news"].append(row)
+        if district_id is not None:
+            self._sheets.setdefault(f"district_{district_id}", []).append(row)
+
+    def mark(self) -> Dict[str, int]:
+        return {name: len(rows) for name, rows in self._sheets.items()}
+
+    def rollback_to(self, mark: Dict[str, int]) -> None:
+        """Отбрасывает новости, добавленные после mark (шаг откатился)."""
+        for name in list(self._sheets):
+            if name in mark:
+                del self._sheets[name][mark[name]:]
+            else:
+                del self._sheets[name]
+
+    def flush(self) -> Path:
+        """Сохраняет все накопленные строки одним проходом (openpyxl write-only)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        wb = Workbook(write_only=True)
+        for name, rows in self._sheets.items():
+            ws = wb.create_sheet(title=name)
+            ws.append(NEWS_HEADERS)
+            for row in rows:
+                ws.append(row)
+        wb.save(self.path)
+        return self.path
+
+
+CYCLE_NEWS: Optional[CycleNewsJournal] = None
 
 
-def _ensure_cycle_workbook() -> Path:
-    """Создаёт (при необходимости) XLSX для текущего цикла и возвращает путь к нему."""
-    global CYCLE_XLSX_PATH
+def _start_cycle_news() -> CycleNewsJournal:
+    """Создаёт журнал новостей для текущего цикла (файл пишется в конце цикла)."""
+    global CYCLE_NEWS, CYCLE_XLSX_PATH
     if not CYCLE_TS:
         raise RuntimeError("CYCLE_TS не задан. Устанавливается в начале run_game_cycle().")
-    path = Path(f"./exports/{CYCLE_TS}.xlsx")
-    if not path.exists():
-        path.parent.mkdir(parents=True, exist_ok=True)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "news"
-        ws.append(NEWS_HEADERS)
-        wb.save(path)
-        log.info(f"Создан файл отчёта цикла: {path}")
-    CYCLE_XLSX_PATH = path
-    return path
-
-
-@dataclass(frozen=True)
-class CombatRates:
-    attack: Dict[str, float]
-    defense: Dict[str, float]
-    on_point_bonus: int = 20
-
-    @staticmethod
-    def load(path: str) -> "CombatRates":
-        p = Path(path)
-        if not p.exists():
-            raise FileNotFoundError(f"Combat rates file not found: {p}")
-        data = json.loads(p.read_text(encoding="utf-8"))
-        log.info("Загружены курсы конверсии из %s", p)
-        log.debug("Курсы атаки: %s", data.get("attack"))
-        log.debug("Курсы обороны: %s", data.get("defense"))
-        return CombatRates(
-            attack=data.get("attack", {}),
-            defense=data.get("defense", {}),
-            on_point_bonus=int(data.get("on_point_bonus", 20)),
+    CYCLE_XLSX_PATH = Path(f"./exports/{_cycle_file_stem()}.xlsx")
+    CYCLE_NEWS = CycleNewsJournal(CYCLE_XLSX_PATH)
+    return CYCLE_NEWS
+
+
+def _cycle_file_stem() -> str:
+    """Имя файлов цикла (новости, метрики): таймстемп цикла, у повторной попытки — с её номером."""
+    return CYCLE_TS if CYCLE_ATTEMPT <= 1 else f"{CYCLE_TS}_attempt{CYCLE_ATTEMPT}"
+
+
+def _adopt_journal_cycle(journal: CycleJournal) -> None:
+    """
+    Продолженный цикл живёт под таймстемпом из журнала, а не под таймстемпом этого запуска:
+    новости и метрики попадают под тот же CYCLE_TS (с номером попытки — файлы прошлой не затираются).
+    """
+    global CYCLE_TS, CYCLE_ATTEMPT, CYCLE_XLSX_PATH
+    CYCLE_TS = journal.run.cycle_ts
+    CYCLE_ATTEMPT = journal.run.attempts
+    CYCLE_XLSX_PATH = Path(f"./exports/{_cycle_file_stem()}.xlsx")
+    if CYCLE_NEWS is not None:
+        CYCLE_NEWS.path = CYCLE_XLSX_PATH
+    if CYCLE_METRICS is not None:
+        CYCLE_METRICS.cycle_ts = CYCLE_TS
+
+
+def _flush_cycle_news() -> None:
+    if CYCLE_NEWS is None:
+        return
+    try:
+        path = CYCLE_NEWS.flush()
+        log.info("Файл отчёта цикла записан: %s (новостей: %d)", path, len(CYCLE_NEWS))
+    except Exception:
+        log.exception("Не удалось записать новости цикла в XLSX")
+
+
+CYCLE_DIGEST: Optional[CycleDigest] = None
+
+
+def queue_notice(tg_id: Optional[int], *, title: str, body: str) -> None:
+    """Кладёт уведомление игроку в сводку цикла (отправка — в конце run_game_cycle())."""
+    if CYCLE_DIGEST is None:
+        log.warning("Сводка уведомлений цикла не создана — уведомление пропущено: %s", title)
+        return
+    CYCLE_DIGEST.add(tg_id, title, body)
+    _count_metric("notifications")
+
+
+async def _send_cycle_digest() -> None:
+    if not CYCLE_DIGEST:
+        return
+    try:
+        from app import bot  # type: ignore
+    except Exception:
+        log.warning("Бот недоступен: сводка уведомлений цикла не отправлена (получателей: %d).", len(CYCLE_DIGEST))
+        return
+    try:
+        sent = await CYCLE_DIGEST.send(bot)
+        _count_metric("messages_sent", sent)
+        log.info(
+            "Сводка цикла разослана: сообщений %d, получателей %d, записей %d",
+            sent, len(CYCLE_DIGEST), CYCLE_DIGEST.entries_count,
         )
+    except Exception:
+        log.exception("Не удалось разослать сводку уведомлений цикла")
+
+
+def _write_cycle_metrics(*, ok: bool) -> None:
+    """JSON-отчёт по шагам рядом с last_cycle_finished.txt (+ Prometheus, если задан CYCLE_METRICS_PROM)."""
+    if CYCLE_METRICS is None:
+        return
+    CYCLE_METRICS.finish(ok=ok)
+    try:
+        path = CYCLE_METRICS.write_json(Path(f"cycle_metrics_{_cycle_file_stem()}.json"))
+        totals = CYCLE_METRICS.totals
+        log.info(
+            "Метрики цикла записаны: %s (SQL %d, строк прочитано %s, изменено %d)",
+            path, totals["statements"],
+            totals["rows_read"] if CYCLE_METRICS.rows_read_available is not False else "—",
+            totals["rows_written"],
+        )
+    except Exception:
+        log.exception("Не удалось записать метрики цикла")
+    if CYCLE_METRICS_PROM:
+        try:
+            CYCLE_METRICS.write_prometheus(Path(CYCLE_METRICS_PROM))
+        except Exception:
+            log.exception("Не удалось записать метрики цикла для Prometheus")
 
 
 # ===========================
@@ -165,26 +300,13 @@ async def add_news(
     district_id: Optional[int] = None,
     tag: str = "auto generated",
 ):
-    """Пишет строку новости в общий лист 'news' и (если district_id задан) в лист района."""
-    try:
-        path = _ensure_cycle_workbook()
-        wb = load_workbook(path)
-
-        # общий лист
-        _ensure_sheet(wb, "news", NEWS_HEADERS)
-        row = [now_utc().isoformat(), tag, title, body, action_id, district_id]
-        wb["news"].append(row)
-
-        # лист конкретного района
-        if district_id is not None:
-            sheet_name = f"district_{district_id}"
-            _ensure_sheet(wb, sheet_name, NEWS_HEADERS)
-            wb[sheet_name].append(row)
-
-        wb.save(path)
-        log.debug("NEWS@%s: %s | %s", district_id or "-", title, body[:120].replace("\n", " "))
-    except Exception:
-        log.exception("Не удалось записать новость в XLSX")
+    """Добавляет новость в журнал цикла: общий лист 'news' и (если district_id задан) лист района."""
+    if CYCLE_NEWS is None:
+        log.warning("Журнал новостей цикла не создан — новость пропущена: %s", title)
+        return
+    row = [now_utc().isoformat(), tag, title, body, action_id, district_id]
+    CYCLE_NEWS.add(row, district_id=district_id)
+    log.debug("NEWS@%s: %s | %s", district_id or "-", title, body[:120].replace("\n", " "))
 
 
 # ===========================
@@ -250,43 +372,19 @@ async def aggregate_supports(session: AsyncSession) -> Tuple[List[int], List[int
             touched_parents.append(parent.id)
             processed_support_ids.extend([s.id for s in group])
 
-        await session.commit()
-
+        # пополнение parent-ов уйдёт flush-ем вместе с закрытием supports — один commit
         if processed_support_ids:
             await session.execute(
                 update(Action)
                 .where(Action.id.in_(processed_support_ids))
                 .values(status=ActionStatus.DONE, updated_at=now_utc())
             )
-            await session.commit()
+        await session.commit()
 
         log.info("SUPPORT обработано: %d; родителей затронуто: %d", len(processed_support_ids), len(touched_parents))
         return processed_support_ids, touched_parents
 
 
-# ===========================
-#   RESOURCES → POINTS
-# ===========================
-def resources_to_points(kind: str, action: Action, rates: CombatRates) -> int:
-    """Конвертирует ресурсы экшена в очки (учёт on_point)."""
-    table = rates.attack if kind == ATTACK_KIND else rates.defense
-    force_w = float(table.get("force", 0))
-    money_w = float(table.get("money", 0))
-    infl_w = float(table.get("influence", 0))
-    info_w = float(table.get("information", 0))
-
-    pts = (
-        max(0, int(action.force)) * force_w
-        + max(0, int(action.money)) * money_w
-        + max(0, int(action.influence)) * infl_w
-        + max(0, int(action.information)) * info_w
-    )
-    pts = int(round(pts))
-    if action.on_point:
-        pts += rates.on_point_bonus
-    return max(0, pts)
-
-
 # ===========================
 #  CONTESTED DETECTION
 # ===========================
@@ -356,7 +454,8 @@ async def detect_contested_districts(session: AsyncSession) -> List[int]:
         uq = await session.execute(select(User.id, User.tg_id).where(User.id.in_(owner_ids)))
         users_map = {int(i): int(tg) for i, tg in uq.all() if tg is not None}
 
-        # 4) пытаемся отправить интерактивный экран; если нет — шлём простое уведомление
+        # 4) пытаемся отправить интерактивный экран (он с кнопками — идёт сразу, не в сводку);
+        #    если экрана/бота нет — кладём простое уведомление в сводку цикла
         try:
             from app import bot  # type: ignore
         except Exception:
@@ -373,362 +472,251 @@ async def detect_contested_districts(session: AsyncSession) -> List[int]:
                 AskWhoWon = None
 
         title = "⚔️ Спорный бой"
-        # Рассылка
-        if bot:
+
+        # Рассылка — внешнее действие: при CYCLE_TX_MODE=savepoint/single только после COMMIT цикла
+        async def send_ask_who_won() -> None:
             for action_id, owner_id, did in notify_actions:
                 tg_id = users_map.get(owner_id)
                 if not tg_id:
                     continue
                 body = f"В районе «{district_names.get(did, str(did))}» было несколько движений на точку. Вы победили?"
+                if not AskWhoWon:
+                    queue_notice(tg_id, title=title, body=body)
+                    continue
                 try:
-                    if AskWhoWon:
-                        await AskWhoWon().run(
-                            message=None,
-                            actor=None,
-                            state=None,
-                            title=title,
-                            body=body,
-                            action_id=action_id,
-                            bot=bot,
-                            chat_id=tg_id
-                        )
-                    else:
-                        await notify_user(bot, tg_id, title=title, body=body)
+                    await AskWhoWon().run(
+                        message=None,
+                        actor=None,
+                        state=None,
+                        title=title,
+                        body=body,
+                        action_id=action_id,
+                        bot=bot,
+                        chat_id=tg_id
+                    )
+                    _count_metric("notifications")
+                    _count_metric("messages_sent")
                 except Exception:
                     log.exception("Не удалось отправить AskWhoWon (action_id=%s, owner_id=%s)", action_id, owner_id)
 
+        await _after_cycle_commit(send_ask_who_won)
+
         return contested
 
 
 # ===========================
-#     DEFENSE POOLS
+#   COMBAT: LOAD → RESOLVE → PERSIST
 # ===========================
-async def resolve_defense_pools(session: AsyncSession, rates: CombatRates, contested: List[int]) -> Dict[int, int]:
-    """
-    Формирует стартовый пул обороны из control_points (кроме спорных),
-    затем добавляет очки из pending defense-действий (конверсия + on_point),
-    и уведомляет владельца района о каждой защите.
-    """
-    with StepTimer("Формирование обороны"):
-        # NEW: бот, если доступен
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления о защите отправляться не будут.")
-
-        contested_set = set(contested)
-
-        # 0) Стартовая оборона из control_points
-        q = await session.execute(select(District))
-        districts: List[District] = list(q.scalars().all())
-        log.info("Районов в базе: %d", len(districts))
+def _player_name(in_game_name: Optional[str], username: Optional[str], user_id: int) -> str:
+    return in_game_name or username or f"User#{user_id}"
 
-        # NEW: быстрый доступ к району по id
-        district_by_id = {d.id: d for d in districts}
 
-        # NEW: кэш пользователей
-        user_cache: Dict[int, User] = {}
-
-        async def get_user(uid: int) -> Optional[User]:
-            if uid not in user_cache:
-                uq = await session.execute(select(User).where(User.id == uid))
-                user_cache[uid] = uq.scalars().first()
-            return user_cache.get(uid)
-
-        defense_pool: Dict[int, int] = defaultdict(int)
-        seeded_from_cp: Dict[int, int] = {}
-
-        for d in districts:
-            if d.id in contested_set:
-                continue
-            if d.control_points > 0:
-                defense_pool[d.id] += int(d.control_points)
-                seeded_from_cp[d.id] = int(d.control_points)
-                d.control_points = 0
-
-        if seeded_from_cp:
-            await session.commit()
-            log.info("Старт обороны из CP: %s", seeded_from_cp)
-
-        # 1) Прибавляем оборону из pending defense-экшенов
-        stmt = (
-            select(Action)
-            .where(
-                Action.status == ActionStatus.PENDING,
-                Action.kind == DEFENSE_KIND,
-                Action.district_id.is_not(None),
-            )
-            .order_by(Action.id.asc())
+async def load_combat_snapshot(session: AsyncSession) -> CombatSnapshot:
+    """Одним набором запросов читает районы, pending attack/defend и их участников."""
+    dq = await session.execute(
+        select(District.id, District.name, District.owner_id, District.control_points)
+    )
+    districts = {
+        int(did): DistrictSnapshot(id=int(did), name=name, owner_id=int(owner_id), control_points=int(cp or 0))
+        for did, name, owner_id, cp in dq.all()
+    }
+    log.info("Районов в базе: %d", len(districts))
+
+    order_col = Action.created_at.asc() if ORDER_ATTACKS_ASC else Action.created_at.desc()
+    aq = await session.execute(
+        select(
+            Action.id, Action.kind, Action.owner_id, Action.district_id,
+            Action.force, Action.money, Action.influence, Action.information, Action.on_point,
         )
-        res = await session.execute(stmt)
-        actions: List[Action] = list(res.scalars().all())
-        log.info("Активных защит: %d", len(actions))
-
-        used_ids: List[int] = []
-        for a in actions:
-            did = a.district_id
-            if did is None or did in contested_set:
-                continue
-
-            pts = resources_to_points(DEFENSE_KIND, a, rates)
-            defense_pool[did] += pts
-            used_ids.append(a.id)
-            log.debug("DEF@%s: +%d очков (action #%s)", did, pts, a.id)
-
-            # NEW: уведомление владельцу района о КАЖДОЙ защите
-            if bot:
-                d = district_by_id.get(did)
-                if d:
-                    owner = await get_user(d.owner_id)
-                    defender = await get_user(a.owner_id)
-                    if owner and owner.tg_id and defender:
-                        defender_name = defender.in_game_name or defender.username or f"User#{defender.id}"
-                        try:
-                            await notify_user(
-                                bot,
-                                owner.tg_id,
-                                title="🛡️ Район усилен защитой",
-                                body=(
-                                    f"Ваш район <b>{d.name}</b> защищён игроком <b>{defender_name}</b> "
-                                    f"на <b>{pts}</b> очков контроля."
-                                ),
-                            )
-                        except Exception:
-                            log.exception("Не удалось отправить уведомление о защите (did=%s, action_id=%s)", did, a.id)
-
-        if used_ids:
-            await session.execute(
-                update(Action)
-                .where(Action.id.in_(used_ids))
-                .values(status=ActionStatus.DONE, updated_at=now_utc())
+        .where(
+            Action.status == ActionStatus.PENDING,
+            Action.kind.in_([ATTACK_KIND, DEFENSE_KIND]),
+            Action.district_id.is_not(None),
+        )
+        .order_by(order_col, Action.id.asc())
+    )
+    defenses: List[ActionSnapshot] = []
+    attacks: List[ActionSnapshot] = []
+    for aid, kind, owner_id, did, force, money, infl, info, on_point in aq.all():
+        snap = ActionSnapshot(
+            id=int(aid), kind=str(kind), owner_id=int(owner_id), district_id=int(did),
+            force=int(force or 0), money=int(money or 0), influence=int(infl or 0),
+            information=int(info or 0), on_point=bool(on_point),
+        )
+        (attacks if snap.kind == ATTACK_KIND else defenses).append(snap)
+    defenses.sort(key=lambda x: x.id)
+    log.info("Активных защит: %d, активных атак: %d", len(defenses), len(attacks))
+
+    user_ids = {d.owner_id for d in districts.values()} | {a.owner_id for a in defenses} | {a.owner_id for a in attacks}
+    players: Dict[int, PlayerSnapshot] = {}
+    if user_ids:
+        uq = await session.execute(
+            select(User.id, User.tg_id, User.in_game_name, User.username, User.faction)
+            .where(User.id.in_(user_ids))
+        )
+        for uid, tg_id, in_game_name, username, faction in uq.all():
+            players[int(uid)] = PlayerSnapshot(
+                id=int(uid),
+                tg_id=int(tg_id) if tg_id else None,
+                name=_player_name(in_game_name, username, uid),
+                faction=faction,
             )
-            await session.commit()
 
-        log.info("Итоги обороны по районам (очки): %s", dict(defense_pool))
-        return dict(defense_pool)
+    return CombatSnapshot(districts=districts, players=players, defenses=defenses, attacks=attacks)
 
 
-# ===========================
-#     ATTACK RESOLUTION
-# ===========================
-async def resolve_attacks(session: AsyncSession, rates: CombatRates, defense_pool: Dict[int, int], contested: List[int]):
-    """Пошагово резолвит атаки по районам, с учётом defense_pool и спорных районов."""
-    with StepTimer("Разрешение атак"):
-        # Бот для уведомлений (если есть)
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления об атаках отправляться не будут.")
+async def _after_cycle_commit(job: Callable[[], Awaitable[None]]) -> None:
+    """Внешнее действие (Sheets и т.п.): после COMMIT текущей транзакции (шага в steps, цикла — иначе)."""
+    if CYCLE_AFTER_COMMIT is None:
+        await job()
+    else:
+        CYCLE_AFTER_COMMIT.append(job)
 
-        base_stmt = (
-            select(Action)
-            .where(
-                Action.status == ActionStatus.PENDING,
-                Action.kind == ATTACK_KIND,
-                Action.district_id.is_not(None),
-            )
-        )
-        base_stmt = base_stmt.order_by(Action.created_at.asc() if ORDER_ATTACKS_ASC else Action.created_at.desc())
-        res = await session.execute(base_stmt)
-        attacks: List[Action] = list(res.scalars().all())
-        log.info("Активных атак: %d", len(attacks))
 
-        if not attacks:
-            return
+def _sqlite_explicit_begin(engine: AsyncEngine) -> None:
+    """
+    pysqlite/aiosqlite сами открывают транзакцию только перед DML, и SAVEPOINT первым
+    запросом её не откроет — тогда RELEASE фиксирует данные. Отключаем авто-BEGIN драйвера
+    и шлём BEGIN сами (рецепт из документации SQLAlchemy по SQLite).
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def _no_driver_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
 
-        by_district: Dict[int, List[Action]] = defaultdict(list)
-        for a in attacks:
-            if a.district_id:
-                by_district[a.district_id].append(a)
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
 
-        district_cache: Dict[int, District] = {}
-        user_cache: Dict[int, User] = {}
 
-        async def get_district(did: int) -> Optional[District]:
-            if did not in district_cache:
-                d = await District.get_by_id(session, did)
-                if d:
-                    district_cache[did] = d
-                else:
-                    return None
-            return district_cache[did]
-
-        async def get_user(uid: int) -> Optional[User]:
-            if uid not in user_cache:
-                q = await session.execute(select(User).where(User.id == uid))
-                user = q.scalars().first()
-                if user:
-                    user_cache[uid] = user
+@asynccontextmanager
+async def _transaction(engine: AsyncEngine, join_mode: str, commit_title: Optional[str] = None) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия на соединении с внешней транзакцией: commit() внутри её не завершает
+    (join_mode — см. _CYCLE_TX_JOIN_MODES), COMMIT — один при выходе без ошибки, иначе откат.
+    Отложенные внешние действия (_after_cycle_commit) выполняются только после COMMIT.
+    """
+    global CYCLE_AFTER_COMMIT
+    CYCLE_AFTER_COMMIT = []
+    try:
+        async with engine.connect() as conn:
+            await conn.begin()
+            work = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode=join_mode)
+            try:
+                yield work
+                await work.commit()
+                if commit_title:
+                    with StepTimer(commit_title):
+                        await conn.commit()
                 else:
-                    return None
-            return user_cache[uid]
-
-        processed_ids: List[int] = []
-        ownership_changes = 0
-
-        for district_id, attack_list in by_district.items():
-            if district_id in contested:
-                log.info("Район %s спорный — атаки пропущены (%d шт.)", district_id, len(attack_list))
-                continue
-
-            d = await get_district(district_id)
-            if not d:
-                log.warning("Не найден район %s — пропущено %d атак", district_id, len(attack_list))
-                for a in attack_list:
-                    processed_ids.append(a.id)
-                continue
-
-            current_def = int(defense_pool.get(district_id, 0))
-            log.info("Район '%s' стартовая оборона: %d", d.name, current_def)
-
-            for a in attack_list:
-                power_pts = resources_to_points(ATTACK_KIND, a, rates)
-                attacker = await get_user(a.owner_id)
-                attacker_name = (attacker.in_game_name or attacker.username or f"User#{attacker.id}") if attacker else "Неизвестный"
-                attacker_faction = (attacker.faction or "без фракции") if attacker else "неизвестно"
-
-                defender_user_before = await get_user(d.owner_id) if d.owner_id else None
-                defender_name_before = (
-                        defender_user_before.in_game_name
-                        or defender_user_before.username
-                        or (f"User#{defender_user_before.id}" if defender_user_before else "—")
-                ) if defender_user_before else "—"
-                def_before = current_def
-                log.debug("ATK@%s by %s: %d pts vs def %d", d.id, attacker_name, power_pts, current_def)
-
-                if power_pts <= current_def:
-                    current_def -= power_pts
-                    await add_news(
-                        session,
-                        title=f"Отражена атака на район '{d.name}'",
-                        body=(
-                            f"Атака игрока {attacker_name} ({power_pts} очков) была отражена. "
-                            f"Фракция атакующего: {attacker_faction}. "
-                            f"Текущая оборона района: {current_def}."
-                        ),
-                        action_id=a.id,
-                        district_id=d.id,
-                    )
+                    await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                if CYCLE_AFTER_COMMIT:
+                    log.warning("Транзакция откачена — отложенные действия отменены: %d", len(CYCLE_AFTER_COMMIT))
+                raise
+            finally:
+                await work.close()
+
+        for job in CYCLE_AFTER_COMMIT:
+            await job()
+    finally:
+        CYCLE_AFTER_COMMIT = None
+
+
+@asynccontextmanager
+async def _cycle_transaction(engine: AsyncEngine) -> AsyncIterator[Optional[AsyncSession]]:
+    """
+    Общая транзакция цикла для savepoint/single: упавший цикл откатывается целиком.
+    В steps — None: у каждого шага своя транзакция (_step_transaction).
+    """
+    if CYCLE_TX_MODE == "steps":
+        yield None
+        return
+    async with _transaction(engine, _CYCLE_TX_JOIN_MODES[CYCLE_TX_MODE], "COMMIT цикла") as session:
+        yield session
 
-                    if bot and attacker and defender_user_before:
-                        await notify_user(
-                            bot,
-                            attacker.tg_id,
-                            title="❌ Атака отражена",
-                            body=(
-                                f"Район <b>{d.name}</b> не взят. "
-                                f"Ваши очки: <b>{power_pts}</b>. "
-                                f"Оставшаяся оборона района: <b>{current_def}</b>."
-                            ),
-                        )
-                        await notify_user(
-                            bot,
-                            defender_user_before.tg_id,
-                            title="🛡️ Атака отражена",
-                            body=(f"Ваш район <b>{d.name}</b> отбил атаку ({power_pts} очков). "
-                                  f"Текущая оборона: <b>{current_def}</b>.")
-                        )
 
-                else:
-                    overflow = power_pts - current_def
-                    defender_user = defender_user_before
-
-                    d = await District.reassign_owner(session, district_id=district_id, new_owner_id=a.owner_id)
-                    district_cache[district_id] = d
-                    current_def = overflow
-                    ownership_changes += 1
-
-                    await add_news(
-                        session,
-                        title=f"Район '{d.name}' захвачен!",
-                        body=(
-                            f"Атака игрока {attacker_name} ({power_pts} очков) прорвала оборону района. "
-                            f"Фракция захватившего: {attacker_faction}. "
-                            f"Новый владелец — {attacker_name}. Остаток {overflow} очков укрепил оборону района."
-                        ),
-                        action_id=a.id,
-                        district_id=d.id,
-                    )
+@asynccontextmanager
+async def _step_transaction(engine: AsyncEngine, cycle_session: Optional[AsyncSession]) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия шага. В steps — своя транзакция: commit() внутри шага только отпускает SAVEPOINT,
+    а записи шага и его строка в журнале фиксируются одним COMMIT (упавший шаг не оставляет
+    ни данных, ни отметки — повторный запуск выполнит его заново ровно один раз).
+    В savepoint/single — общая сессия цикла.
+    """
+    if cycle_session is not None:
+        yield cycle_session
+        return
+    async with _transaction(engine, "create_savepoint") as session:
+        yield session
+
+
+async def persist_combat_result(session: AsyncSession, result: CombatResult) -> None:
+    """Пишет результат резолва пачкой: районы (владелец + CP), закрытие действий, новости; уведомления — в сводку."""
+    district_rows = [
+        {
+            "id": did,
+            "owner_id": result.owners.get(did),
+            "control_points": result.control_points.get(did),
+        }
+        for did in sorted(set(result.owners) | set(result.control_points))
+    ]
+    for row in district_rows:
+        for key in ("owner_id", "control_points"):
+            if row[key] is None:
+                del row[key]
+    if district_rows:
+        await session.execute(update(District), district_rows)
+
+    if result.closed_action_ids:
+        await session.execute(
+            update(Action)
+            .where(Action.id.in_(result.closed_action_ids))
+            .values(status=ActionStatus.DONE, updated_at=now_utc())
+        )
+    await session.commit()
+    log.info(
+        "Районов обновлено: %d (смен владельцев: %d); действий закрыто: %d",
+        len(district_rows), len(result.ownership_changes), len(result.closed_action_ids),
+    )
+    if result.control_points:
+        log.info("Новые CP районов: %s", result.control_points)
 
-                    if bot and attacker and defender_user:
-                        await notify_user(
-                            bot,
-                            attacker.tg_id,
-                            title="✅ Район захвачен",
-                            body=(
-                                f"Вы захватили район <b>{d.name}</b>! "
-                                f"Прорыв силой <b>{power_pts}</b>. "
-                                f"Остаток <b>{overflow}</b> стал обороной района."
-                            ),
-                        )
-                        await notify_user(
-                            bot,
-                            defender_user.tg_id,
-                            title="⚠️ Потеря района",
-                            body="Ваш район <b>{}</b> был атакован {} и утерян.".format(d.name, attacker_name),
-                        )
-                    try:
-                        raw_body = (
-                            f'Бой за район "{d.name}". '
-                            f'Нападающий: "{attacker_name}". '
-                            f'Оборонявшийся: "{defender_name_before}". '
-                            f'Победил: "{attacker_name}". '
-                            f'Силы: атака {power_pts} против обороны {def_before}. '
-                            f'Остаток {overflow} пошёл в оборону района.'
-                        )
-                        await asyncio.to_thread(add_raw_row, raw_body=raw_body, type_value="battle")
-                    except Exception:
-                        log.exception("Не удалось записать RAW протокол боя (district_id=%s, action_id=%s)",
-                                      district_id, a.id)
-                processed_ids.append(a.id)
-
-            defense_pool[district_id] = current_def
-            log.info("Район '%s' остаточная оборона после атак: %d", d.name, current_def)
+    for n in result.news:
+        await add_news(session, title=n.title, body=n.body, action_id=n.action_id, district_id=n.district_id)
 
-        if processed_ids:
-            await session.execute(
-                update(Action).where(Action.id.in_(processed_ids)).values(status=ActionStatus.DONE, updated_at=now_utc())
-            )
-            await session.commit()
-            log.info("Атак обработано и закрыто: %d", len(processed_ids))
+    if result.raw_rows:
+        # все протоколы боёв — одним append в RAW
+        async def append_raw_rows() -> None:
+            try:
+                _count_metric("sheets_calls")
+                await asyncio.to_thread(
+                    add_raw_rows, [raw_row_payload(raw_body=b, type_value="battle") for b in result.raw_rows]
+                )
+            except Exception:
+                log.exception("Не удалось записать RAW протоколы боёв (%d шт.)", len(result.raw_rows))
 
-        if ownership_changes:
-            log.info("Смен владельцев районов: %d", ownership_changes)
+        await _after_cycle_commit(append_raw_rows)
 
+    for notice in result.notices:
+        queue_notice(notice.tg_id, title=notice.title, body=notice.body)
 
-# ===========================
-#  LEFTOVER DEF → CONTROL
-# ===========================
-async def convert_leftover_defense_to_control_points(
-    session: AsyncSession,
-    defense_pool: Dict[int, int],
-    contested: List[int],
-) -> None:
-    """Остаток обороны → в control_points (спорные районы пропускаются)."""
-    with StepTimer("Конвертация остатка обороны в CP"):
-        if not defense_pool:
-            log.info("Defense pool пуст — нечего конвертировать.")
-            return
 
-        contested_set = set(contested)
-        updated: Dict[int, int] = {}
+async def resolve_combat_phase(session: AsyncSession, rates: CombatRates, contested: List[int]) -> CombatResult:
+    """
+    Оборона → атаки → остаток обороны в CP.
+    Данные читаются один раз, резолв идёт в памяти (services.combat), запись — пачкой.
+    """
+    with StepTimer("Загрузка снимка для резолва боёв"):
+        snapshot = await load_combat_snapshot(session)
 
-        for district_id, remaining_def in defense_pool.items():
-            if remaining_def <= 0 or district_id in contested_set:
-                continue
-            d = await District.get_by_id(session, district_id)
-            if not d:
-                continue
-            d.control_points += int(remaining_def)
-            updated[district_id] = int(remaining_def)
+    with StepTimer("Резолв боёв в памяти"):
+        result = resolve_combat(snapshot, rates, contested)
+    log.info("Итоги обороны по районам (очки): %s", result.defense_pool)
 
-        if updated:
-            await session.commit()
-            log.info("В CP начислено: %s", updated)
-        else:
-            log.info("Начислений в CP нет.")
+    with StepTimer("Сохранение результатов боёв"):
+        await persist_combat_result(session, result)
+    return result
 
 
 # ===========================
@@ -740,13 +728,6 @@ async def close_all_scouting(session: AsyncSession):
     и уведомляет пользователей, наблюдавших за районами.
     """
     with StepTimer("Закрытие разведок и сброс наблюдения"):
-        # Бот для уведомлений (если есть)
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления о завершении разведки отправляться не будут.")
-
         rows = await session.execute(
             select(
                 user_scouts_districts.c.user_id,
@@ -778,13 +759,12 @@ async def close_all_scouting(session: AsyncSession):
         log.info("Связи наблюдения очищены.")
 
         # Уведомления
-        if bot and watched:
-            user_ids = list(watched.keys())
-            q = await session.execute(select(User).where(User.id.in_(user_ids)))
-            users_map = {u.id: u for u in q.scalars().all()}
+        if watched:
+            q = await session.execute(select(User.id, User.tg_id).where(User.id.in_(list(watched.keys()))))
+            tg_by_user = {int(uid): tg_id for uid, tg_id in q.all()}
             for uid, items in watched.items():
-                user = users_map.get(uid)
-                if not user or not items:
+                tg_id = tg_by_user.get(uid)
+                if not tg_id or not items:
                     continue
                 lines = [f"• {name} (#{did})" for did, name in items]
                 body = (
@@ -792,7 +772,7 @@ async def close_all_scouting(session: AsyncSession):
                     "Список районов, за которыми вы наблюдали:\n" + "\n".join(lines) +
                     "\n\nЧтобы продолжить наблюдение, запустите новую разведку."
                 )
-                await notify_user(bot, user.tg_id, title="🔍 Разведка завершена", body=body)
+                queue_notice(tg_id, title="🔍 Разведка завершена", body=body)
 
 
 # ===========================
@@ -814,44 +794,45 @@ def ideology_multiplier(owner_ideol: int, pol_ideol: Optional[int]) -> float:
 
 
 async def recalc_resource_multipliers(session: AsyncSession):
-    """Обновляет district.resource_multiplier (кладём в шаг 0.1)."""
+    """
+    Обновляет district.resource_multiplier (кладём в шаг 0.1).
+    Один запрос District ⋈ User ⋈ Politician и один bulk UPDATE только изменившихся районов.
+    """
     with StepTimer("Пересчёт множителей ресурсов по идеологии"):
-        q = await session.execute(select(District))
-        districts: List[District] = list(q.scalars().all())
-        if not districts:
-            log.info("Районов нет — пересчитывать нечего.")
+        rows = (await session.execute(
+            select(
+                District.id,
+                District.resource_multiplier,
+                User.ideology,
+                Politician.ideology,
+            )
+            .join(User, User.id == District.owner_id)
+            .join(Politician, Politician.district_id == District.id)
+            # у района может быть несколько политиков — берём первого по id
+            .order_by(District.id, Politician.id)
+        )).all()
+        if not rows:
+            log.info("Районов с политиками нет — пересчитывать нечего.")
             return
 
-        owner_cache: Dict[int, User] = {}
-        pol_by_district: Dict[int, Optional[Politician]] = {}
-
-        for d in districts:
-            if d.owner_id not in owner_cache:
-                uq = await session.execute(select(User).where(User.id == d.owner_id))
-                owner_cache[d.owner_id] = uq.scalars().first()
-
-            pq = await session.execute(select(Politician).where(Politician.district_id == d.id))
-            pol = pq.scalars().first()
-            pol_by_district[d.id] = pol
-
-        updated = 0
-        for d in districts:
-            owner = owner_cache.get(d.owner_id)
-            pol = pol_by_district.get(d.id)
-            if owner and pol:
-                mul = ideology_multiplier(owner.ideology, pol.ideology)
-                mul = _quantize_tenth(mul, 0.40, 1.20)
-                if abs(d.resource_multiplier - mul) > 1e-6:
-                    log.debug(
-                        "District %s: mul %.2f → %.2f (owner=%s, pol=%s)",
-                        d.id, d.resource_multiplier, mul, owner.ideology, pol.ideology
-                    )
-                    d.resource_multiplier = mul
-                    updated += 1
+        changed: List[dict] = []
+        seen: set[int] = set()
+        for did, cur_mul, owner_ideol, pol_ideol in rows:
+            if did in seen:
+                continue
+            seen.add(did)
+            mul = _quantize_tenth(ideology_multiplier(owner_ideol, pol_ideol), 0.40, 1.20)
+            if abs(cur_mul - mul) > 1e-6:
+                log.debug(
+                    "District %s: mul %.2f → %.2f (owner=%s, pol=%s)",
+                    did, cur_mul, mul, owner_ideol, pol_ideol
+                )
+                changed.append({"id": did, "resource_multiplier": mul})
 
-        if updated:
+        if changed:
+            await session.execute(update(District), changed)
             await session.commit()
-            log.info("Обновлены множители ресурсов у %d районов.", updated)
+            log.info("Обновлены множители ресурсов у %d районов.", len(changed))
         else:
             log.info("Множители ресурсов без изменений.")
 
@@ -859,100 +840,65 @@ async def recalc_resource_multipliers(session: AsyncSession):
 # ===========================
 #  GRANT USERS' BASE RESOURCES
 # ===========================
-async def grant_users_base_resources(session: AsyncSession):
+RESOURCE_NAMES = ("money", "influence", "information", "force")
+
+
+async def grant_users_base_resources(session: AsyncSession) -> List[tuple[int, Optional[int], dict]]:
     """
     Начисляет каждому пользователю его базовые ресурсы (user.base_*).
     Базовые ресурсы НЕ умножаются и просто добавляются к накопленным.
-    Для каждого с ненулевыми базовыми — отправляется нотификация (если доступен bot).
+    Всё делается одним UPDATE ... SET money = money + base_money, без загрузки User.
+    Возвращает [(user_id, tg_id, delta)] получателей; уведомления уходят в сводку цикла.
     """
     with StepTimer("Начисление базовых ресурсов игрокам"):
-        # Бот для уведомлений (если есть)
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления о базовых ресурсах отправляться не будут.")
-
-        res = await session.execute(select(User))
-        users: List[User] = list(res.scalars().all())
-        if not users:
-            log.info("Пользователей нет — базовые ресурсы начислять некому.")
-            return
-
-        total_money = total_infl = total_info = total_force = 0
-        # Запомним, кому и что начислили — нотифицируем после commit
-        to_notify: List[tuple[int, int, dict]] = []  # (user_id, user_tg_id, delta_dict)
-
-        for u in users:
-            bm  = max(0, int(u.base_money or 0))
-            bi  = max(0, int(u.base_influence or 0))
-            binf = max(0, int(u.base_information or 0))
-            bf  = max(0, int(u.base_force or 0))
-
-            if bm == 0 and bi == 0 and binf == 0 and bf == 0:
-                continue
-
-            u.money       += bm
-            u.influence   += bi
-            u.information += binf
-            u.force       += bf
-
-            total_money += bm
-            total_infl  += bi
-            total_info  += binf
-            total_force += bf
-
-            to_notify.append((u.id, u.tg_id, {
-                "money": bm, "influence": bi, "information": binf, "force": bf
-            }))
-
+        # отрицательные base_* не списываем — как и раньше, считаем их нулём
+        base = {name: getattr(User, f"base_{name}") for name in RESOURCE_NAMES}
+        delta = {name: case((col > 0, col), else_=0) for name, col in base.items()}
+        has_any = or_(*(col > 0 for col in base.values()))
+
+        rows = (await session.execute(
+            select(User.id, User.tg_id, *(expr.label(name) for name, expr in delta.items()))
+            .where(has_any)
+            .order_by(User.id)
+        )).all()
+        to_notify: List[tuple[int, Optional[int], dict]] = [
+            (int(r.id), r.tg_id, {name: int(getattr(r, name)) for name in RESOURCE_NAMES}) for r in rows
+        ]
+        if not to_notify:
+            log.info("Базовых ресурсов для начисления нет.")
+            return []
+
+        await session.execute(
+            update(User)
+            .where(has_any)
+            .values({name: getattr(User, name) + expr for name, expr in delta.items()})
+            # User-объекты в этой сессии дальше не читают балансы — синхронизация не нужна
+            .execution_options(synchronize_session=False)
+        )
         await session.commit()
+
+        totals = {name: sum(d[name] for _, _, d in to_notify) for name in RESOURCE_NAMES}
         log.info(
             "Базовые ресурсы начислены суммарно: 💰%s 🪙%s 🧠%s 💪%s (получателей: %d)",
-            total_money, total_infl, total_info, total_force, len(to_notify)
+            totals["money"], totals["influence"], totals["information"], totals["force"], len(to_notify)
         )
 
         # Нотификации
-        if bot and to_notify:
-            # подгрузим имена только для тех, кому начисляли (опционально)
-            user_ids = [uid for uid, _, _ in to_notify]
-            q = await session.execute(select(User).where(User.id.in_(user_ids)))
-            users_map = {u.id: u for u in q.scalars().all()}
-
-            for uid, tg_id, delta in to_notify:
-                # если вдруг пользователя уже нет — пропускаем
-                user = users_map.get(uid)
-                if not user:
-                    continue
+        for uid, tg_id, d in to_notify:
+            body = (
+                "Вам начислены базовые ресурсы:\n"
+                f"• 💰 {d['money']}\n"
+                f"• 🪙 {d['influence']}\n"
+                f"• 🧠 {d['information']}\n"
+                f"• 💪 {d['force']}\n"
+            )
+            queue_notice(tg_id, title="📦 Базовые ресурсы начислены", body=body)
 
-                body = (
-                    "Вам начислены базовые ресурсы:\n"
-                    f"• 💰 {delta['money']}\n"
-                    f"• 🪙 {delta['influence']}\n"
-                    f"• 🧠 {delta['information']}\n"
-                    f"• 💪 {delta['force']}\n"
-                )
-                try:
-                    await notify_user(
-                        bot,
-                        tg_id,
-                        title="📦 Базовые ресурсы начислены",
-                        body=body,
-                    )
-                except Exception:
-                    # не валим цикл из-за одного неотправленного сообщения
-                    log.exception("Не удалось отправить нотификацию о базовых ресурсах пользователю #%s", uid)
+        return to_notify
 
 async def process_politician_influence(session: AsyncSession) -> None:
     """Обрабатывает pending-заявки вида 'influence' и меняет идеологию политиков."""
     with StepTimer("Обработка влияния на политиков"):
-        # Бот для уведомлений (если есть)
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления о влиянии отправляться не будут.")
-
         # 1) Собираем заявки influence, старые → новые
         stmt = (
             select(Action)
@@ -1022,7 +968,6 @@ async def process_politician_influence(session: AsyncSession) -> None:
                 .where(Action.id.in_(processed_ids))
                 .values(status=ActionStatus.DONE, updated_at=now_utc())
             )
-            await session.commit()
             log.info("Закрыто influence-заявок: %d", len(processed_ids))
 
         # 5) Квантуем идеологию в [-5..5] и сохраняем в БД
@@ -1036,118 +981,109 @@ async def process_politician_influence(session: AsyncSession) -> None:
                 if p.ideology != new_val:
                     log.debug("Политик #%s (%s): идеология %s → %s", p.id, p.name, p.ideology, new_val)
                     p.ideology = new_val
-
-            await session.commit()
             log.info("Обновлена идеология у %d политиков.", len(changed_pids))
 
+        # закрытие заявок и новая идеология — одним commit
+        await session.commit()
+
         # 6) Уведомления авторам заявок
-        if bot and notify_pairs:
+        if notify_pairs:
             user_ids = sorted({uid for uid, _ in notify_pairs})
-            uq = await session.execute(select(User).where(User.id.in_(user_ids)))
-            users_map = {u.id: u for u in uq.scalars().all()}
+            uq = await session.execute(select(User.id, User.tg_id).where(User.id.in_(user_ids)))
+            tg_by_user = {int(uid): tg_id for uid, tg_id in uq.all()}
 
             for uid, pid in sorted(notify_pairs):
-                user = users_map.get(uid)
                 pol = pol_by_id.get(pid)
-                if not user or not pol:
+                if uid not in tg_by_user or not pol:
                     continue
-                try:
-                    await notify_user(
-                        bot,
-                        user.tg_id,
-                        title="🏛️ Влияние учтено",
-                        body=f"Ваши действия повлияли на политика «{pol.name}».",
-                    )
-                except Exception:
-                    log.exception("Не удалось отправить уведомление о влиянии (user_id=%s, pol_id=%s)", uid, pid)
+                queue_notice(
+                    tg_by_user[uid],
+                    title="🏛️ Влияние учтено",
+                    body=f"Ваши действия повлияли на политика «{pol.name}».",
+                )
 
 # ===========================
 #    GRANT RESOURCES
 # ===========================
-async def grant_district_resources(session: AsyncSession, contested: List[int]):
-    """Начисляет владельцам ресурсы с районов, исключая спорные (и шлёт уведомления)."""
+async def grant_district_resources(session: AsyncSession, contested: List[int]) -> Dict[int, List[tuple[str, dict]]]:
+    """
+    Начисляет владельцам ресурсы с районов, исключая спорные (уведомления — в сводку цикла).
+    ceil(base_* × multiplier) считается в SQL: один SELECT с разбивкой по владельцам/районам
+    и один UPDATE ... FROM с суммами по владельцу. Возвращает разбивку {owner_id: [(район, ресурсы)]}.
+    """
     with StepTimer("Начисление ресурсов районам"):
-        # Бот для уведомлений (если есть)
-        try:
-            from app import bot  # type: ignore
-        except Exception:
-            bot = None
-            log.warning("Бот недоступен: уведомления о начислении ресурсов отправляться не будут.")
-
-        res = await session.execute(select(District))
-        districts: List[District] = list(res.scalars().all())
-        if not districts:
-            log.info("Районов нет — начислять нечего.")
-            return
+        eff = District.effective_resources_sql()
+        granted = District.id.not_in(contested) if contested else true()
 
-        contested_set = set(contested)
-        changes: Dict[int, dict] = defaultdict(lambda: {"money": 0, "influence": 0, "information": 0, "force": 0})
+        rows = (await session.execute(
+            select(
+                District.owner_id, User.tg_id, District.name,
+                *(expr.label(name) for name, expr in eff.items()),
+            )
+            .join(User, User.id == District.owner_id)
+            .where(granted)
+            .order_by(District.owner_id, District.id)
+        )).all()
+        if not rows:
+            log.info("Районов для начисления нет.")
+            return {}
+        if contested:
+            log.debug("Спорные районы — пропуск начисления: %s", contested)
+
+        changes: Dict[int, dict] = defaultdict(lambda: {name: 0 for name in RESOURCE_NAMES})
         per_owner_breakdown: Dict[int, List[tuple[str, dict]]] = defaultdict(list)
-
-        for d in districts:
-            if d.id in contested_set:
-                log.debug("Район '%s' спорный — пропуск начисления.", d.name)
-                continue
-            eff = d.effective_resources()
-            changes[d.owner_id]["money"] += eff["money"]
-            changes[d.owner_id]["influence"] += eff["influence"]
-            changes[d.owner_id]["information"] += eff["information"]
-            changes[d.owner_id]["force"] += eff["force"]
-
-            per_owner_breakdown[d.owner_id].append(
-                (d.name, {"money": eff["money"], "influence": eff["influence"], "information": eff["information"], "force": eff["force"]})
+        owner_tg: Dict[int, Optional[int]] = {}
+        for r in rows:
+            uid = int(r.owner_id)
+            res = {name: int(getattr(r, name)) for name in RESOURCE_NAMES}
+            for name in RESOURCE_NAMES:
+                changes[uid][name] += res[name]
+            per_owner_breakdown[uid].append((r.name, res))
+            owner_tg[uid] = r.tg_id
+
+        sums = (
+            select(
+                District.owner_id.label("owner_id"),
+                *(func.sum(expr).label(name) for name, expr in eff.items()),
             )
-
-        total_money = total_infl = total_info = total_force = 0
-
-        for uid, delta in changes.items():
-            uq = await session.execute(select(User).where(User.id == uid))
-            user = uq.scalars().first()
-            if not user:
-                continue
-
-            user.money += delta["money"]
-            user.influence += delta["influence"]
-            user.information += delta["information"]
-            user.force += delta["force"]
-
-            total_money += delta["money"]
-            total_infl += delta["influence"]
-            total_info += delta["information"]
-            total_force += delta["force"]
-
+            .where(granted)
+            .group_by(District.owner_id)
+            .subquery()
+        )
+        await session.execute(
+            update(User)
+            .where(User.id == sums.c.owner_id)
+            .values({name: getattr(User, name) + sums.c[name] for name in RESOURCE_NAMES})
+            .execution_options(synchronize_session=False)
+        )
         await session.commit()
-        log.info("Начислено суммарно: 💰%s 🪙%s 🧠%s 💪%s", total_money, total_infl, total_info, total_force)
 
-        # Уведомления
-        if bot:
-            for uid, items in per_owner_breakdown.items():
-                sums = changes.get(uid, {})
-                if not sums or (sums["money"] + sums["influence"] + sums["information"] + sums["force"]) <= 0:
-                    continue
+        totals = {name: sum(c[name] for c in changes.values()) for name in RESOURCE_NAMES}
+        log.info(
+            "Начислено суммарно: 💰%s 🪙%s 🧠%s 💪%s",
+            totals["money"], totals["influence"], totals["information"], totals["force"],
+        )
 
-                uq = await session.execute(select(User).where(User.id == uid))
-                user = uq.scalars().first()
-                if not user:
-                    continue
+        # Уведомления
+        for uid, items in per_owner_breakdown.items():
+            sums_ = changes[uid]
+            tg_id = owner_tg.get(uid)
+            if not tg_id or sum(sums_.values()) <= 0:
+                continue
 
-                lines = []
-                for name, r in items:
-                    lines.append(
-                        f"• <b>{name}</b>: 💰 {r['money']}, 🪙 {r['influence']}, 🧠 {r['information']}, 💪 {r['force']}"
-                    )
-                total_line = (
-                    f"Итого: 💰 <b>{sums['money']}</b>, 🪙 <b>{sums['influence']}</b>, "
-                    f"🧠 <b>{sums['information']}</b>, 💪 <b>{sums['force']}</b>"
+            lines = []
+            for name, r in items:
+                lines.append(
+                    f"• <b>{name}</b>: 💰 {r['money']}, 🪙 {r['influence']}, 🧠 {r['information']}, 💪 {r['force']}"
                 )
-                body = "Вы получили ресурсы с контролируемых районов:\n" + "\n".join(lines) + "\n\n" + total_line
+            total_line = (
+                f"Итого: 💰 <b>{sums_['money']}</b>, 🪙 <b>{sums_['influence']}</b>, "
+                f"🧠 <b>{sums_['information']}</b>, 💪 <b>{sums_['force']}</b>"
+            )
+            body = "Вы получили ресурсы с контролируемых районов:\n" + "\n".join(lines) + "\n\n" + total_line
+            queue_notice(tg_id, title="💼 Ресурсы начислены", body=body)
 
-                await notify_user(
-                    bot,
-                    user.tg_id,
-                    title="💼 Ресурсы начислены",
-                    body=body,
-                )
+        return dict(per_owner_breakdown)
 
 
 # ===========================
@@ -1156,20 +1092,15 @@ async def grant_district_resources(session: AsyncSession, contested: List[int]):
 async def refresh_player_actions(session: AsyncSession):
     """Восстанавливает слоты действий игрокам до максимума."""
     with StepTimer("Обновление слотов действий"):
-        res = await session.execute(select(User))
-        users: List[User] = list(res.scalars().all())
-        if not users:
-            log.info("Пользователей нет — слоты обновлять некому.")
-            return
-
-        refreshed = 0
-        for u in users:
-            max_actions = u.max_available_actions or 0
-            if u.available_actions < max_actions:
-                u.available_actions = max_actions
-                u.actions_refresh_at = now_utc()
-                refreshed += 1
-
+        # одним UPDATE вместо загрузки всех игроков и flush-а по одному
+        max_actions = func.coalesce(User.max_available_actions, 0)
+        res = await session.execute(
+            update(User)
+            .where(User.available_actions < max_actions)
+            .values(available_actions=max_actions, actions_refresh_at=now_utc())
+            .execution_options(synchronize_session=False)
+        )
+        refreshed = res.rowcount
         await session.commit()
         log.info("Слоты действий восстановлены у %d игроков.", refreshed)
 
@@ -1178,67 +1109,137 @@ async def refresh_player_actions(session: AsyncSession):
 #           MAIN
 # ===========================
 async def run_game_cycle():
-    global CYCLE_TS
+    global CYCLE_TS, CYCLE_ATTEMPT, CYCLE_DIGEST, CYCLE_METRICS
+
+    # фиксируем timestamp цикла и заводим журнал новостей (XLSX пишется в конце);
+    # продолженный по журналу цикл заберёт свой прежний таймстемп (_adopt_journal_cycle)
+    CYCLE_TS = now_utc().strftime("%Y%m%dT%H%M%SZ")
+    CYCLE_ATTEMPT = 1
+    CYCLE_METRICS = CycleMetrics(CYCLE_TS)
+    _start_cycle_news()
+    CYCLE_DIGEST = CycleDigest()
+    log.info("Таймстемп цикла (UTC): %s", CYCLE_TS)
 
     # 0) загрузить курсы конверсии
     with StepTimer("Инициализация курсов"):
         rates = CombatRates.load(COMBAT_RATES_PATH)
 
-    # фиксируем timestamp цикла и создаём файл
-    CYCLE_TS = now_utc().strftime("%Y%m%dT%H%M%SZ")
-    _ensure_cycle_workbook()
-    log.info("Таймстемп цикла (UTC): %s", CYCLE_TS)
+    if CYCLE_TX_MODE != "steps" and CYCLE_TX_MODE not in _CYCLE_TX_JOIN_MODES:
+        raise ValueError(f"Неизвестный CYCLE_TX_MODE={CYCLE_TX_MODE!r} (steps | savepoint | single)")
 
     engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+    if engine.dialect.name == "sqlite":
+        _sqlite_explicit_begin(engine)
     async_session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    CYCLE_METRICS.attach(engine)
+    instrument_engine(engine)
+    cycle_ok = False
 
-    async with async_session_factory() as session:
-        log.info("=== Старт игрового цикла ===")
-
-        try:
-            with StepTimer("Шаг A: Агрегация SUPPORT"):
-                await aggregate_supports(session)
-
-            with StepTimer("Шаг B: Определение спорных районов"):
-                contested = await detect_contested_districts(session)
-
-            with StepTimer("Шаг 1: Резерв обороны"):
-                defense_pool = await resolve_defense_pools(session, rates, contested)
-
-            with StepTimer("Шаг 2: Резолв атак"):
-                await resolve_attacks(session, rates, defense_pool, contested)
-
-            with StepTimer("Шаг 2.5: Остаток обороны → CP"):
-                await convert_leftover_defense_to_control_points(session, defense_pool, contested)
-
-            with StepTimer("Шаг 2.6: Влияние на политиков"):
-                await process_politician_influence(session)
-
-            with StepTimer("Шаг 3: Закрыть все разведки"):
-                await close_all_scouting(session)
-
-            with StepTimer("Шаг 4: Пересчёт ресурсных множителей"):
-                await recalc_resource_multipliers(session)
-
-            with StepTimer("Шаг 4.5: Базовые ресурсы игрокам"):
-                await grant_users_base_resources(session)
-
-            with StepTimer("Шаг 5: Выдача ресурсов"):
-                await grant_district_resources(session, contested)
-
-            with StepTimer("Шаг 6: Обновление слотов действий"):
-                await refresh_player_actions(session)
-
-            log.info("=== Игровой цикл завершён ===")
+    try:
+        async with async_session_factory() as session:
+            # один цикл за раз; незавершённый прошлый — продолжаем с первого невыполненного шага
+            lock_holder = await acquire_cycle_lock(session)
             try:
-                Path("last_cycle_finished.txt").write_text(now_utc().isoformat(), encoding="utf-8")
-                log.info("Записан маркер завершения цикла: last_cycle_finished.txt")
-            except Exception:
-                log.exception("Не удалось записать last_cycle_finished.txt")
+                await _run_cycle_steps(engine, session, rates, lock_holder)
+                cycle_ok = True
+            finally:
+                await release_cycle_lock(session, lock_holder)
+    finally:
+        _write_cycle_metrics(ok=cycle_ok)
+        # без этого пул (и поток aiosqlite) держит процесс после завершения цикла
+        await engine.dispose()
+
+
+async def _run_cycle_steps(engine: AsyncEngine, control: AsyncSession, rates: CombatRates, lock_holder: str) -> None:
+    # control — замок и статус цикла (фиксируются сразу); шаги и журнал шагов — в сессии из _step_transaction
+    journal = await CycleJournal.open(control, CYCLE_TS)
+    _adopt_journal_cycle(journal)
+    log.info(
+        "=== Старт игрового цикла %s (id=%d, транзакции: %s) ===",
+        journal.run.cycle_ts, journal.cycle_id, CYCLE_TX_MODE,
+    )
+    committed = False
+
+    async def step(key: str, title: str, fn, *args, output=None):
+        """Шаг по журналу: выполненный в прошлом запуске пропускается, его результат берётся из журнала."""
+        if journal.is_done(key):
+            log.info("↷ %s — уже выполнен, пропуск", title)
+            return journal.output(key)
+        news_mark = CYCLE_NEWS.mark() if CYCLE_NEWS else None
+        digest_mark = CYCLE_DIGEST.mark() if CYCLE_DIGEST else None
+        t0 = time.perf_counter()
+        try:
+            with StepTimer(title):
+                async with _step_transaction(engine, cycle_session) as session:
+                    result = await fn(session, *args)
+                    out = output(result) if output else None
+                    # продление замка и строка журнала — в той же транзакции, что и записи шага
+                    await renew_cycle_lock(session, lock_holder)
+                    await journal.complete(session, key, out, duration_s=round(time.perf_counter() - t0, 4))
+        except BaseException:
+            if CYCLE_TX_MODE == "steps":
+                # шаг откачен: его новости и уведомления описывают то, чего в БД нет
+                if news_mark is not None:
+                    CYCLE_NEWS.rollback_to(news_mark)
+                if digest_mark is not None:
+                    CYCLE_DIGEST.rollback_to(digest_mark)
+            raise
+        return out
 
+    try:
+        async with _cycle_transaction(engine) as cycle_session:
+            await step("A", "Шаг A: Агрегация SUPPORT", aggregate_supports)
+
+            contested = (await step(
+                "B", "Шаг B: Определение спорных районов", detect_contested_districts,
+                output=lambda r: {"contested": r},
+            ))["contested"]
+
+            await step(
+                "C", "Шаги 1–2.5: Оборона, атаки, остаток обороны → CP",
+                resolve_combat_phase, rates, contested,
+                output=lambda r: {
+                    "defense_pool": r.defense_pool,
+                    "remaining_defense": r.remaining_defense,
+                    "control_points": r.control_points,
+                    "owners": r.owners,
+                },
+            )
+            await step("2.6", "Шаг 2.6: Влияние на политиков", process_politician_influence)
+            await step("3", "Шаг 3: Закрыть все разведки", close_all_scouting)
+            await step("4", "Шаг 4: Пересчёт ресурсных множителей", recalc_resource_multipliers)
+            await step("4.5", "Шаг 4.5: Базовые ресурсы игрокам", grant_users_base_resources)
+            await step("5", "Шаг 5: Выдача ресурсов", grant_district_resources, contested)
+            await step("6", "Шаг 6: Обновление слотов действий", refresh_player_actions)
+
+            await journal.finish(cycle_session or control)
+        committed = True
+        log.info("=== Игровой цикл завершён ===")
+        try:
+            Path("last_cycle_finished.txt").write_text(now_utc().isoformat(), encoding="utf-8")
+            log.info("Записан маркер завершения цикла: last_cycle_finished.txt")
         except Exception:
-            log.exception("Игровой цикл завершился с ошибкой")
-            raise
+            log.exception("Не удалось записать last_cycle_finished.txt")
+
+    except Exception as e:
+        if CYCLE_TX_MODE == "steps":
+            log.exception("Игровой цикл завершился с ошибкой (повторный запуск продолжит с упавшего шага)")
+        else:
+            log.exception("Игровой цикл завершился с ошибкой и откачен целиком")
+        await journal.fail(control, e)
+        raise
+    finally:
+        if committed or CYCLE_TX_MODE == "steps":
+            _flush_cycle_news()
+            # сеть — уже после всей работы с БД; уходит то, что накопили закоммиченные шаги
+            with StepTimer("Рассылка сводки уведомлений цикла"):
+                await _send_cycle_digest()
+        else:
+            # откаченный цикл: новости и уведомления описывают то, чего в БД нет
+            log.warning(
+                "Новости (%d) и сводка уведомлений (получателей: %d) откаченного цикла не отправлены",
+                len(CYCLE_NEWS) if CYCLE_NEWS else 0, len(CYCLE_DIGEST) if CYCLE_DIGEST else 0,
+            )
 
 
 if __name__ == "__main__":
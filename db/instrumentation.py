@@ -0,0 +1,165 @@
+# db/instrumentation.py
+"""
+Инструментирование SQL на событиях движка (before/after_cursor_execute). Включается
+SQL_INSTRUMENTATION=1; без него instrument_engine() ничего не вешает, а sql_scope()
+почти бесплатен.
+
+- sql_scope(name) — логическая область: апдейт (DbSessionMiddleware), опция
+  (routes.options), шаг цикла (StepTimer в commands.py). Запрос учитывается во всех
+  открытых областях. При закрытии области — строка в лог: DEBUG, либо INFO, если
+  запросов не меньше SQL_SCOPE_LOG_MIN.
+- N+1: один и тот же текст запроса в области SQL_REPEAT_THRESHOLD раз и больше —
+  WARNING с текстом и числом повторов (на самой вложенной области, где это случилось).
+- медленные запросы: дольше SQL_SLOW_MS — WARNING с текстом, временем и «формой»
+  параметров (типы вместо значений: в лог не попадают данные игроков).
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional, Set, Tuple
+
+from sqlalchemy import event
+
+log = logging.getLogger("sql")
+
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "0").lower() in ("1", "true", "yes")
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "200"))
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
+SQL_SCOPE_LOG_MIN = int(os.getenv("SQL_SCOPE_LOG_MIN", "20"))
+
+_STATEMENT_LOG_LEN = 500
+_TIMER_KEY = "instrumentation_t0"
+
+
+@dataclass
+class SqlScope:
+    name: str
+    statements: int = 0
+    duration_ms: float = 0.0
+    repeats: Counter = field(default_factory=Counter)
+    # уже отмечены как N+1 во вложенной области — не повторяем предупреждение
+    flagged: Set[str] = field(default_factory=set)
+
+
+_scopes: ContextVar[Tuple[SqlScope, ...]] = ContextVar("sql_scopes", default=())
+
+
+@contextmanager
+def sql_scope(name: str) -> Iterator[Optional[SqlScope]]:
+    if not SQL_INSTRUMENTATION:
+        yield None
+        return
+    parents = _scopes.get()
+    scope = SqlScope(name)
+    token = _scopes.set(parents + (scope,))
+    try:
+        yield scope
+    finally:
+        _scopes.reset(token)
+        _report(scope, parents[-1] if parents else None)
+
+
+def current_scope() -> Optional[SqlScope]:
+    scopes = _scopes.get()
+    return scopes[-1] if scopes else None
+
+
+def instrument_engine(engine) -> bool:
+    """Вешает обработчики на движок (AsyncEngine или Engine). True — если инструментирование включено."""
+    if not SQL_INSTRUMENTATION:
+        return False
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+    return True
+
+
+# ----- обработчики событий -----
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_TIMER_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    timers = conn.info.get(_TIMER_KEY)
+    elapsed_ms = (time.perf_counter() - timers.pop()) * 1000 if timers else 0.0
+
+    scopes = _scopes.get()
+    for scope in scopes:
+        scope.statements += 1
+        scope.duration_ms += elapsed_ms
+        scope.repeats[statement] += 1
+
+    if elapsed_ms >= SQL_SLOW_MS:
+        log.warning(
+            "Медленный запрос %.1f ms [%s]: %s | параметры: %s",
+            elapsed_ms, scopes[-1].name if scopes else "-",
+            _short(statement), param_shape(parameters, executemany),
+        )
+
+
+def _handle_error(exception_context) -> None:
+    # запрос упал — after_cursor_execute не будет, снимаем его таймер
+    conn = exception_context.connection
+    if conn is not None:
+        timers = conn.info.get(_TIMER_KEY)
+        if timers:
+            timers.pop()
+
+
+def _report(scope: SqlScope, parent: Optional[SqlScope]) -> None:
+    for statement, n in scope.repeats.most_common():
+        if n < SQL_REPEAT_THRESHOLD:
+            break
+        if statement in scope.flagged:
+            continue
+        log.warning("[%s] запрос выполнен %d раз — похоже на N+1: %s", scope.name, n, _short(statement))
+        scope.flagged.add(statement)
+    if parent is not None:
+        parent.flagged |= scope.flagged
+
+    level = logging.INFO if scope.statements >= SQL_SCOPE_LOG_MIN else logging.DEBUG
+    if log.isEnabledFor(level):
+        log.log(level, "[%s] SQL: %d запросов (%d уникальных), %.1f ms",
+                scope.name, scope.statements, len(scope.repeats), scope.duration_ms)
+
+
+# ----- форма параметров -----
+def param_shape(parameters: Any, executemany: bool = False) -> str:
+    """Типы параметров без значений: "(int, str, None)", "{'id': int}", "100× (int, int)"."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return f"{len(parameters)}× {_shape(parameters[0])}" if parameters else "0×"
+    return _shape(parameters)
+
+
+def _shape(params: Any) -> str:
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k!r}: {_type_name(v)}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        # длинные IN-списки сворачиваем: (int×500)
+        runs = []
+        for v in params:
+            name = _type_name(v)
+            if runs and runs[-1][0] == name:
+                runs[-1][1] += 1
+            else:
+                runs.append([name, 1])
+        return "(" + ", ".join(name if n == 1 else f"{name}×{n}" for name, n in runs) + ")"
+    return _type_name(params)
+
+
+def _type_name(value: Any) -> str:
+    return "None" if value is None else type(value).__name__
+
+
+def _short(statement: str) -> str:
+    s = re.sub(r"\s+", " ", statement).strip()
+    return s if len(s) <= _STATEMENT_LOG_LEN else s[:_STATEMENT_LOG_LEN] + "…"
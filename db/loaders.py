@@ -0,0 +1,47 @@
+# db/loaders.py
+"""
+Именованные профили загрузки связей.
+
+Связи в моделях не грузятся сами (lazy="raise_on_sql"): User.get_by_tg_id и прочие
+запросы тянут только свою таблицу, а обращение к незагруженной связи — явная ошибка
+вместо скрытого запроса (в async-сессии неявная подгрузка всё равно невозможна).
+Запрос, которому нужны связи, подключает профиль под свой экран/шаг:
+
+    select(Action).options(*load_profile("action_card")).where(Action.id == action_id)
+"""
+from typing import Dict, Tuple
+
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from db.models import Action, District, News, Politician, User
+
+PROFILES: Dict[str, Tuple[LoaderOption, ...]] = {
+    # экран профиля: список разведанных районов
+    "profile_screen": (selectinload(User.scouts_districts),),
+    # карточка действия: владелец, район, родитель и поддержки
+    "action_card": (
+        joinedload(Action.owner),
+        joinedload(Action.district),
+        joinedload(Action.parent_action),
+        selectinload(Action.support_actions),
+    ),
+    # действие + владелец/район — для уведомлений и подписей
+    "action_owner": (joinedload(Action.owner),),
+    "action_district": (joinedload(Action.district),),
+    "action_notify": (joinedload(Action.owner), joinedload(Action.district)),
+    # районы
+    "district_owner": (joinedload(District.owner),),
+    "district_watchers": (selectinload(District.scouting_by),),
+    # новости и политики
+    "news_action": (joinedload(News.action),),
+    "politician_district": (joinedload(Politician.district),),
+}
+
+
+def load_profile(name: str) -> Tuple[LoaderOption, ...]:
+    """Опции загрузчика для профиля name (для .options(*...))."""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise KeyError(f"Неизвестный профиль загрузки: {name!r}") from None
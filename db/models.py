@@ -17,7 +17,11 @@ from sqlalchemy import (
     func,
     Index, Enum, Integer, CheckConstraint, Float, UniqueConstraint, JSON, Text,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 from db.session import Base
 from enum import Enum as PyEnum
@@ -27,6 +31,25 @@ def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
+class ceil_int(FunctionElement):
+    """CEIL(x) как целое число — то же, что math.ceil() в Python."""
+    type = Integer()
+    name = "ceil_int"
+    inherit_cache = True
+
+
+@compiles(ceil_int)
+def _compile_ceil_int(element, compiler, **kw):
+    return "CAST(CEIL(%s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(ceil_int, "sqlite")
+def _compile_ceil_int_sqlite(element, compiler, **kw):
+    # CEIL в SQLite есть только при сборке с math-функциями; CAST(x AS INTEGER) там отбрасывает дробь
+    x = compiler.process(element.clauses, **kw)
+    return f"(CAST({x} AS INTEGER) + ({x} > CAST({x} AS INTEGER)))"
+
+
 # ===========================
 #   Assoc: User <-> District (scouting)
 # ===========================
@@ -42,6 +65,15 @@ user_scouts_districts = Table(
 # ===========================
 #           User
 # ===========================
+# ключ session.info: tg_id пользователей, изменённых в транзакции (None — неизвестно, кого именно);
+# кэш мидлвари (services.user_cache) сбрасывает их записи после COMMIT
+USERS_CHANGED_KEY = "users_changed"
+
+
+def _mark_users_changed(session, tg_id: Optional[int] = None) -> None:
+    session.info.setdefault(USERS_CHANGED_KEY, set()).add(tg_id)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -74,11 +106,12 @@ class User(Base):
     actions_refresh_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
+    # Связи не грузятся сами (lazy="raise_on_sql") — нужные подключаются профилем из db.loaders
     # Один-ко-многим: User -> District
     districts: Mapped[List["District"]] = relationship(
         "District",
         back_populates="owner",
-        lazy="selectin",
+        lazy="raise_on_sql",
         cascade="all, delete-orphan",
         passive_deletes=True,  # работает полноценно на Postgres (FK ON DELETE CASCADE)
     )
@@ -86,11 +119,11 @@ class User(Base):
         "District",
         secondary=user_scouts_districts,
         back_populates="scouting_by",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
     actions: Mapped[List["Action"]] = relationship(
-        "Action", back_populates="owner", lazy="selectin",
+        "Action", back_populates="owner", lazy="raise_on_sql",
         cascade="all, delete-orphan", passive_deletes=True
     )
 
@@ -132,8 +165,8 @@ class User(Base):
         return user
 
     @classmethod
-    async def get_by_tg_id(cls, session, tg_id: int) -> Optional["User"]:
-        res = await session.execute(select(cls).where(cls.tg_id == tg_id))
+    async def get_by_tg_id(cls, session, tg_id: int, *, options: Sequence = ()) -> Optional["User"]:
+        res = await session.execute(select(cls).options(*options).where(cls.tg_id == tg_id))
         return res.scalars().first()
 
     @classmethod
@@ -150,6 +183,7 @@ class User(Base):
             .values(**kwargs)
             .execution_options(synchronize_session="fetch")
         )
+        _mark_users_changed(session, tg_id)
         await session.commit()
         return (res.rowcount or 0) > 0
 
@@ -163,12 +197,15 @@ class User(Base):
             .values(**kwargs)
             .execution_options(synchronize_session="fetch")
         )
+        # tg_id по username не знаем — кэш мидлвари сбросится целиком (вызов редкий)
+        _mark_users_changed(session)
         await session.commit()
         return (res.rowcount or 0) > 0
 
     @classmethod
     async def delete_by_tg_id(cls, session, tg_id: int) -> bool:
         res = await session.execute(delete(cls).where(cls.tg_id == tg_id))
+        _mark_users_changed(session, tg_id)
         await session.commit()
         return (res.rowcount or 0) > 0
 
@@ -219,7 +256,7 @@ class District(Base):
         nullable=False
     )
     owner: Mapped["User"] = relationship(
-        "User", back_populates="districts", lazy="selectin"
+        "User", back_populates="districts", lazy="raise_on_sql"
     )
 
     created_at: Mapped[datetime] = mapped_column(
@@ -246,7 +283,7 @@ class District(Base):
         "User",
         secondary=user_scouts_districts,
         back_populates="scouts_districts",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
     # Базовые ресурсы (Base Resources)
@@ -381,6 +418,14 @@ class District(Base):
         return (res.rowcount or 0) > 0
 
     # ===== Вспомогательное =====
+    @classmethod
+    def effective_resources_sql(cls) -> dict[str, ceil_int]:
+        """SQL-аналог effective_resources(): ceil(base_* × resource_multiplier) по каждому ресурсу."""
+        return {
+            name: ceil_int(getattr(cls, f"base_{name}") * cls.resource_multiplier)
+            for name in ("money", "influence", "information", "force")
+        }
+
     def effective_resources(self) -> dict[str, int]:
         """Рассчитать ресурсы с учётом мультипликатора."""
         mul = float(self.resource_multiplier)
@@ -434,7 +479,7 @@ class Action(Base):
         index=True,
         nullable=False
     )
-    owner: Mapped["User"] = relationship("User", back_populates="actions", lazy="selectin")
+    owner: Mapped["User"] = relationship("User", back_populates="actions", lazy="raise_on_sql")
 
     # (NEW) Необязательный район
     district_id: Mapped[Optional[int]] = mapped_column(
@@ -442,7 +487,7 @@ class Action(Base):
         index=True,
         nullable=True
     )
-    district: Mapped[Optional["District"]] = relationship("District", lazy="selectin")
+    district: Mapped[Optional["District"]] = relationship("District", lazy="raise_on_sql")
 
     # (NEW) Тип экшена
     type: Mapped[ActionType] = mapped_column(
@@ -461,13 +506,13 @@ class Action(Base):
         "Action",
         remote_side="Action.id",
         back_populates="support_actions",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     support_actions: Mapped[List["Action"]] = relationship(
         "Action",
         back_populates="parent_action",
         cascade="all, delete-orphan",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
 
     # (NEW) Ресурсы
@@ -580,7 +625,7 @@ class News(Base):
         nullable=True,
     )
     action: Mapped[Optional["Action"]] = relationship(
-        "Action", lazy="selectin"
+        "Action", lazy="raise_on_sql"
     )
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
@@ -677,7 +722,7 @@ class Politician(Base):
         index=True,
         nullable=True,
     )
-    district: Mapped[Optional["District"]] = relationship("District", lazy="selectin")
+    district: Mapped[Optional["District"]] = relationship("District", lazy="raise_on_sql")
 
     # Склонность/идеология (-5..+5)
     ideology: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
@@ -758,3 +803,158 @@ class Politician(Base):
         res = await session.execute(delete(cls).where(cls.id == politician_id))
         await session.commit()
         return (res.rowcount or 0) > 0
+
+
+# ===========================
+#     Google Sheets outbox
+# ===========================
+class OutboxStatus(PyEnum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class SheetsOutbox(Base):
+    """
+    Строки, ожидающие записи в Google Sheets.
+    Хендлеры кладут их сюда в своей транзакции, фоновый флашер (services.sheets_outbox)
+    пишет пачками: один append_rows на лист за проход.
+    """
+    __tablename__ = "sheets_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+
+    # Название листа (RAW, rituals, news_to_print, ask_and_answer, ...)
+    worksheet: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Значения по колонкам: {"имя колонки в нижнем регистре": значение}
+    payload: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    # Ключ идемпотентности: одна и та же строка не попадёт в лист дважды
+    idempotency_key: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+
+    status: Mapped[OutboxStatus] = mapped_column(
+        Enum(OutboxStatus, name="outbox_status_enum"),
+        default=OutboxStatus.PENDING,
+        nullable=False,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_sheets_outbox_status_next", "status", "next_attempt_at"),
+    )
+
+    @classmethod
+    async def enqueue(cls, session, *, worksheet: str, payload: dict, idempotency_key: str) -> bool:
+        """
+        Добавляет строку в outbox БЕЗ commit — фиксируется вместе с изменениями вызывающего.
+        Возвращает False, если строка с таким ключом уже есть: INSERT ... ON CONFLICT DO NOTHING,
+        так что гонка двух вставок не роняет транзакцию вызывающего на commit.
+        """
+        insert_ = _UPSERT_INSERTS[session.get_bind().dialect.name]
+        res = await session.execute(
+            insert_(cls)
+            .values(worksheet=worksheet, payload=payload, idempotency_key=idempotency_key)
+            .on_conflict_do_nothing(index_elements=[cls.idempotency_key])
+        )
+        return bool(res.rowcount)
+
+
+# insert() с ON CONFLICT для поддерживаемых диалектов
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+class ScreenMessage(Base):
+    """
+    Какое сообщение бота сейчас «главный экран» чата (для редактирования на месте).
+    Постоянный уровень services.message_store: пишется фоном пачками, читается при промахе кэша.
+    """
+    __tablename__ = "screen_messages"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    persist_key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+
+    message_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # unix time отправки/правки — как в кэше (сравнивается с allow_edit_age_sec)
+    sent_ts: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+
+class CallbackPayload(Base):
+    """
+    Параметры кнопок, не влезшие в callback_data (utils.callback): кнопку может построить
+    игровой цикл или бот до перезапуска, а нажмут её в текущем процессе бота.
+    """
+    __tablename__ = "callback_payloads"
+
+    # хэш параметров (utils.callback.PayloadStore.token_for)
+    token: Mapped[str] = mapped_column(String(16), primary_key=True)
+    params: Mapped[dict] = mapped_column(JSON, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
+# ===========================
+#     Журнал игрового цикла
+# ===========================
+class CycleRunStatus(PyEnum):
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    ABANDONED = "abandoned"
+
+
+class CycleRun(Base):
+    """
+    Один игровой цикл. Незавершённый (running/failed) следующий запуск продолжает
+    с первого невыполненного шага — см. services.cycle_journal.
+    """
+    __tablename__ = "game_cycles"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    # CYCLE_TS первого запуска цикла
+    cycle_ts: Mapped[str] = mapped_column(String(32), nullable=False, unique=True)
+    status: Mapped[CycleRunStatus] = mapped_column(
+        Enum(CycleRunStatus, name="cycle_run_status_enum"),
+        default=CycleRunStatus.RUNNING,
+        nullable=False,
+        index=True,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    last_step: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    steps: Mapped[List["CycleStep"]] = relationship(
+        "CycleStep", back_populates="cycle", cascade="all, delete-orphan", lazy="raise_on_sql",
+    )
+
+
+class CycleStep(Base):
+    """Выполненный шаг цикла и его результат, нужный следующим шагам (например, список спорных районов)."""
+    __tablename__ = "game_cycle_steps"
+
+    cycle_id: Mapped[int] = mapped_column(ForeignKey("game_cycles.id", ondelete="CASCADE"), primary_key=True)
+    step: Mapped[str] = mapped_column(String(32), primary_key=True)
+    output: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    duration_s: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
+
+    cycle: Mapped["CycleRun"] = relationship("CycleRun", back_populates="steps", lazy="raise_on_sql")
+
+
+class CycleLock(Base):
+    """
+    Замок «цикл запущен»: одна строка с id=1 (INSERT второго процесса падает на PK).
+    Протухший (старше CYCLE_LOCK_TTL) замок забирается — после kill -9 не нужно чистить руками.
+    """
+    __tablename__ = "game_cycle_lock"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    holder: Mapped[str] = mapped_column(String(255), nullable=False)
+    acquired_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=now_utc, nullable=False)
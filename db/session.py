@@ -1,6 +1,10 @@
+from contextvars import ContextVar
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from db.config import load_db_config
+from db.instrumentation import instrument_engine
 
 
 class Base(DeclarativeBase):
@@ -9,13 +13,72 @@ class Base(DeclarativeBase):
 
 _db_cfg = load_db_config()
 engine = create_async_engine(_db_cfg.url, echo=False, future=True)
+instrument_engine(engine)  # только при SQL_INSTRUMENTATION=1
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
 # Утилита для контекстного использования
 from contextlib import asynccontextmanager
 
 
+class SessionScope:
+    """
+    Одна AsyncSession (и identity map) на все get_session() внутри апдейта.
+    Соединение берётся из пула при первом запросе. Скоуп не откладывает фиксацию: обработчик,
+    вызвавший session.commit(), фиксирует всё накопленное сразу; в конце скоупа commit
+    фиксирует остаток (при исключении — rollback остатка, уже закоммиченное не откатывается).
+    """
+
+    def __init__(self):
+        self.session: AsyncSession = SessionLocal()
+        self.active = True
+
+
+_scope: ContextVar[Optional[SessionScope]] = ContextVar("db_session_scope", default=None)
+
+
+@asynccontextmanager
+async def session_scope():
+    """
+    Открывает скоуп (мидлварь DbSessionMiddleware — на каждый апдейт). Вложенные
+    get_session() получают его сессию (каждый блок — в своём SAVEPOINT), поэтому опция
+    и последующий ререндер экрана делят identity map, а не грузят одних и тех же User/Action заново.
+    """
+    scope = SessionScope()
+    token = _scope.set(scope)
+    try:
+        yield scope
+        await scope.session.commit()
+    except BaseException:
+        await scope.session.rollback()
+        raise
+    finally:
+        scope.active = False
+        _scope.reset(token)
+        await scope.session.close()
+
+
 @asynccontextmanager
 async def get_session():
-    async with SessionLocal() as session:
+    scope = _scope.get()
+    # задачи, запущенные из апдейта, наследуют контекст — закрытый скоуп им не отдаём
+    if scope is None or not scope.active:
+        async with SessionLocal() as session:
+            yield session
+        return
+
+    # блок — в своём SAVEPOINT: ошибка внутри откатывает только его, а не всю работу апдейта,
+    # и просрочивает (expire) только объекты, изменённые в блоке (user из мидлвари остаётся загруженным)
+    session = scope.session
+    nested = await session.begin_nested()
+    try:
         yield session
+    except BaseException:
+        if nested.is_active:
+            await nested.rollback()
+        elif session.in_transaction():
+            # блок сам сделал commit() и упал позже — незафиксированное после commit сделано им же
+            await session.rollback()
+        raise
+    else:
+        if nested.is_active:
+            await nested.commit()
@@ -8,7 +8,6 @@ from typing import Any, Dict, List, Type
 import pandas as pd
 import gspread
 from gspread_dataframe import set_with_dataframe
-from google.oauth2.service_account import Credentials
 
 from sqlalchemy import select
 from sqlalchemy.orm import DeclarativeBase
@@ -22,13 +21,10 @@ SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 DB_URL = os.environ["DATABASE_URL"]
 SA_PATH = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
 importlib.import_module("db.models")
 
 from db.models import Action
+from utils.sheets import get_client, get_spreadsheet
 # ---------- утилиты ----------
 def to_jsonable(v: Any) -> Any:
     if v is None: return None
@@ -113,8 +109,8 @@ def build_query_with_rels(model: Type):
         stmt = stmt.options(selectinload(getattr(model, rel.key)))
     return stmt
 
-def get_ws(gc: gspread.Client, spreadsheet_id: str, title: str, ncols: int) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
+def get_ws(spreadsheet_id: str, title: str, ncols: int) -> gspread.Worksheet:
+    sh = get_spreadsheet(spreadsheet_id)
     from gspread.exceptions import WorksheetNotFound
     try:
         ws = sh.worksheet(title)
@@ -161,7 +157,7 @@ def objects_to_dataframe(objs: List[Any], cols: List[str], rels: List[tuple], *,
     return pd.DataFrame(rows, columns=extended_cols)
 
 # ---------- основной экспорт ----------
-async def export_model(session: AsyncSession, gc: gspread.Client, model: Type):
+async def export_model(session: AsyncSession, model: Type):
     tablename = getattr(model, "__tablename__", model.__name__)
     cols = column_names(model)
     rels = relationship_specs(model)
@@ -173,7 +169,7 @@ async def export_model(session: AsyncSession, gc: gspread.Client, model: Type):
     # ✅ Передаём model внутрь для спец-логики Action
     df = objects_to_dataframe(objs, cols, rels, model=model)
 
-    ws = get_ws(gc, SPREADSHEET_ID, tablename, ncols=len(df.columns))
+    ws = get_ws(SPREADSHEET_ID, tablename, ncols=len(df.columns))
     set_with_dataframe(ws, df, include_index=False, include_column_header=True, resize=True)
     print(f"[OK] {tablename}: {len(df)} rows, {len(df.columns)} columns (with relationships)")
 
@@ -182,8 +178,7 @@ async def main():
     engine = create_async_engine(DB_URL, echo=False, pool_pre_ping=True)
     async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-    creds = Credentials.from_service_account_file(SA_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
+    get_client(SA_PATH)
 
     models = get_models(Base)
     if not models:
@@ -191,7 +186,7 @@ async def main():
 
     async with async_session() as session:
         for model in models:
-            await export_model(session, gc, model)
+            await export_model(session, model)
 
     await engine.dispose()
 
@@ -7,7 +7,6 @@ from typing import Any, Dict, List, Type, Optional
 from sqlalchemy import Integer, BigInteger, Float, Boolean, DateTime, String, Text, JSON as SAJSON, Enum as SAEnum
 import pandas as pd
 import gspread
-from google.oauth2.service_account import Credentials
 from dateutil.parser import isoparse
 
 from sqlalchemy import select, update, insert, ColumnDefault
@@ -21,15 +20,12 @@ from db.session import Base
 importlib.import_module("db.models")
 
 from db.models import Action
+from utils.sheets import get_client, get_worksheet
 
 SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 DB_URL = os.environ["DATABASE_URL"]
 SA_PATH = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
 def is_empty_cell(val) -> bool:
     if val is None:
         return True
@@ -77,10 +73,9 @@ def is_rel_name_col(col: str) -> bool:
     # игнорим relationship-колонки вида owner__name, scouting_by__names и т.п.
     return "__name" in col
 
-def sheet_to_dataframe(gc: gspread.Client, title: str) -> Optional[pd.DataFrame]:
-    sh = gc.open_by_key(SPREADSHEET_ID)
+def sheet_to_dataframe(title: str) -> Optional[pd.DataFrame]:
     try:
-        ws = sh.worksheet(title)
+        ws = get_worksheet(title, spreadsheet_id=SPREADSHEET_ID)
     except gspread.exceptions.WorksheetNotFound:
         return None
     values = ws.get_all_values()  # [[col1, col2, ...], [...], ...]
@@ -271,9 +266,9 @@ async def upsert_rows(session: AsyncSession, model: Type, df: pd.DataFrame):
 
 
 # -------------------- Основная точка входа --------------------
-async def import_model(session: AsyncSession, gc: gspread.Client, model: Type):
+async def import_model(session: AsyncSession, model: Type):
     tablename = getattr(model, "__tablename__", model.__name__)
-    df = sheet_to_dataframe(gc, tablename)
+    df = sheet_to_dataframe(tablename)
     if df is None:
         print(f"[SKIP] Нет листа '{tablename}', пропускаю")
         return
@@ -294,8 +289,7 @@ async def main():
     async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
     # Google
-    creds = Credentials.from_service_account_file(SA_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
+    get_client(SA_PATH)
 
     models = get_models(Base)
     if not models:
@@ -303,7 +297,7 @@ async def main():
 
     async with async_session() as session:
         for model in models:
-            await import_model(session, gc, model)
+            await import_model(session, model)
 
     await engine.dispose()
 
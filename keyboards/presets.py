@@ -48,6 +48,16 @@ def action_district_list_kb(action, action_id=None) -> KeyboardSpec:
     )
 
 
+# ресурсы с кнопками «➖5/➕5» (свечей максимум 8 — им хватает ±1)
+_BULK_RESOURCES = {"force", "money", "influence", "information"}
+
+
+def _resource_row(res: str) -> List[str]:
+    if res in _BULK_RESOURCES:
+        return [f"{res}_remove_bulk", f"{res}_remove", res, f"{res}_add", f"{res}_add_bulk"]
+    return [f"{res}_remove", res, f"{res}_add"]
+
+
 def action_setup_kb(
         resources: List[str],
         action_id: int,
@@ -74,7 +84,7 @@ def action_setup_kb(
             for res in resources:
                 res = res.strip()
                 if res:
-                    rows.append([f"{res}_remove", res, f"{res}_add"])
+                    rows.append(_resource_row(res))
             if not influence:
                 rows.append(["moving_on_point"])
             rows.append(["done"])
@@ -83,7 +93,7 @@ def action_setup_kb(
             for res in resources:
                 res = res.strip()
                 if res:
-                    rows.append([f"{res}_remove", res, f"{res}_add"])
+                    rows.append(_resource_row(res))
             rows.append(["done"])
             rows.append(["delete", "back"])
 
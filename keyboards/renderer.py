@@ -1,9 +1,9 @@
 # keyboards/renderer.py
 import os
-from typing import Tuple, List, Dict, Any, Iterable, Union
-from urllib.parse import urlencode
+from dataclasses import dataclass
+from typing import Tuple, List, Dict, Any, Iterable, Optional, Union
 
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+from jinja2 import Environment, FileSystemLoader, Template, meta
 from aiogram.types import (
     InlineKeyboardMarkup, ReplyKeyboardMarkup,
     InlineKeyboardButton, KeyboardButton,
@@ -11,15 +11,42 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
 from config import load_config
+from utils.callback import encode_callback_data
 from .spec import KeyboardSpec, RowOrName
 
 _cfg = load_config()
 
 
+_CANDIDATE_SUFFIXES = ("", ".j2", ".txt.j2")  # порядок поиска файла кнопки
+
+
+@dataclass(frozen=True)
+class ButtonText:
+    """Текст кнопки: скомпилированный шаблон или готовая строка (шаблон без переменных / fallback)."""
+    template: Optional[Template] = None
+    static_text: Optional[str] = None
+
+    def render(self, context: Dict[str, Any]) -> str:
+        if self.static_text is not None:
+            return self.static_text
+        return self.template.render(**context)
+
+
 class KeyboardRenderer:
+    """
+    Тексты кнопок берутся из templates/<loc>/keyboards/<spec>/<button>[.j2|.txt.j2],
+    затем из templates/keyboards/<spec>/. Каталоги сканируются один раз при создании
+    рендерера: индекс (loc, spec, button) → ButtonText, поэтому рендер меню не трогает ФС.
+    Шаблоны без переменных рендерятся сразу и хранятся строкой. После правки шаблонов — reload().
+    """
+
     def __init__(self, template_root: str | None = None):
         self.template_root = template_root or _cfg.template_root
         self._env_cache: Dict[Tuple[str, str], Environment] = {}
+        # (loc | None, spec) → {button: ButtonText}; None — общий каталог templates/keyboards
+        self._index: Dict[Tuple[Optional[str], str], Dict[str, ButtonText]] = {}
+        self._resolved: Dict[Tuple[str, str, str], ButtonText] = {}
+        self.reload()
 
     def _get_env(self, path: str) -> Environment:
         key = ("env", path)
@@ -27,30 +54,69 @@ class KeyboardRenderer:
             self._env_cache[key] = Environment(loader=FileSystemLoader(path), autoescape=False)
         return self._env_cache[key]
 
+    # --- индекс шаблонов кнопок ---
+    def reload(self) -> None:
+        """(Пере)сканирует каталоги шаблонов кнопок."""
+        self._env_cache.clear()
+        self._index = {}
+        self._resolved = {}
+        if not os.path.isdir(self.template_root):
+            return
+        for entry in os.scandir(self.template_root):
+            if not entry.is_dir():
+                continue
+            if entry.name == "keyboards":
+                self._scan_keyboards_dir(entry.path, loc=None)
+            else:
+                kb_dir = os.path.join(entry.path, "keyboards")
+                if os.path.isdir(kb_dir):
+                    self._scan_keyboards_dir(kb_dir, loc=entry.name.lower())
+
+    def _scan_keyboards_dir(self, kb_dir: str, loc: Optional[str]) -> None:
+        for spec_entry in os.scandir(kb_dir):
+            if not spec_entry.is_dir():
+                continue
+            env = self._get_env(spec_entry.path)
+            # кнопке соответствует первый найденный кандидат: "<b>", "<b>.j2", "<b>.txt.j2"
+            best: Dict[str, Tuple[int, str]] = {}
+            for f in os.scandir(spec_entry.path):
+                if not f.is_file():
+                    continue
+                for rank, suffix in enumerate(_CANDIDATE_SUFFIXES):
+                    if suffix and not f.name.endswith(suffix):
+                        continue
+                    button = f.name[: len(f.name) - len(suffix)]
+                    if button and (button not in best or rank < best[button][0]):
+                        best[button] = (rank, f.name)
+            compiled: Dict[str, ButtonText] = {}
+            for button, (_, filename) in best.items():
+                if filename not in compiled:
+                    compiled[filename] = self._compile(env, filename)
+                self._index.setdefault((loc, spec_entry.name), {})[button] = compiled[filename]
+
+    @staticmethod
+    def _compile(env: Environment, filename: str) -> ButtonText:
+        source = env.loader.get_source(env, filename)[0]
+        template = env.get_template(filename)
+        if not meta.find_undeclared_variables(env.parse(source)):
+            return ButtonText(static_text=template.render())
+        return ButtonText(template=template)
+
+    def _button_text(self, loc: str, spec_name: str, button_name: str) -> ButtonText:
+        key = (loc, spec_name, button_name)
+        text = self._resolved.get(key)
+        if text is None:
+            text = (
+                self._index.get((loc, spec_name), {}).get(button_name)
+                or self._index.get((None, spec_name), {}).get(button_name)
+                or ButtonText(static_text=button_name.replace("_", " ").title())  # fallback
+            )
+            self._resolved[key] = text
+        return text
+
     def _render_button_text(self, spec: KeyboardSpec, button_name: str, context: Dict[str, Any]) -> str:
         loc = (context.get("localization") or _cfg.default_localization).lower()
-        localized_dir = os.path.join(self.template_root, loc, "keyboards", spec.name)
-        global_dir = os.path.join(self.template_root, "keyboards", spec.name)
-
-        candidates = [button_name, f"{button_name}.j2", f"{button_name}.txt.j2"]
-
-        if os.path.isdir(localized_dir):
-            env = self._get_env(localized_dir)
-            for c in candidates:
-                try:
-                    return env.get_template(c).render(**context)
-                except TemplateNotFound:
-                    pass
-
-        if os.path.isdir(global_dir):
-            env = self._get_env(global_dir)
-            for c in candidates:
-                try:
-                    return env.get_template(c).render(**context)
-                except TemplateNotFound:
-                    pass
-
-        return button_name.replace("_", " ").title()  # fallback
+        return self._button_text(loc, spec.name, button_name).render(context)
 
     # --- нормализация опций в явные ряды ---
     def _options_to_rows(self, options: List[RowOrName], max_in_row: int) -> List[List[str]]:
@@ -78,18 +144,9 @@ class KeyboardRenderer:
 
     # --- СБОРКА callback_data с параметрами ---
     def _build_callback_data(self, spec: KeyboardSpec, option_name: str) -> str:
-        base = f"{spec.name}_{option_name}"
-        params = spec.button_params.get(option_name) if hasattr(spec, "button_params") and spec.button_params else None
-        if not params:
-            return base
-        qs = urlencode(params, doseq=True)
-        data = f"{base}?{qs}"
-        # Telegram лимит ~64 байта; по желанию можно обрезать/журналировать
-        if len(data.encode("utf-8")) > 64:
-            # стараемся ужать ключи: оставим только base без параметров
-            # (или здесь можно кидать исключение/логировать warning)
-            return base
-        return data
+        # компактный формат; длинные параметры уходят в хранилище (см. utils.callback)
+        params = spec.button_params.get(option_name) if spec.button_params else None
+        return encode_callback_data(f"{spec.name}_{option_name}", params)
 
     def build(self, spec: KeyboardSpec, common_context: Dict[str, Any]) -> InlineKeyboardMarkup | ReplyKeyboardMarkup:
         ctx = {**common_context, **spec.context}
@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from db.instrumentation import sql_scope
+from db.session import session_scope
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на апдейт (db.session.session_scope): кладётся в data["session"],
+    её же получают все get_session() в мидлварях, опциях и экранах этого апдейта.
+    Общие у них сессия и identity map, а не транзакция: опции, которые сами вызывают
+    commit(), фиксируют свою работу сразу. После обработчика коммитится то, что осталось
+    незафиксированным (например, запись мидлвари); при исключении — rollback этого остатка.
+    Заодно — область учёта SQL на апдейт (db.instrumentation, если включено).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with sql_scope(f"update:{getattr(event, 'event_type', type(event).__name__)}"):
+            async with session_scope() as scope:
+                data["session"] = scope.session
+                return await handler(event, data)
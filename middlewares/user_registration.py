@@ -5,6 +5,7 @@ from sqlalchemy import select, func
 
 from db.session import get_session
 from db.models import User
+from services.user_cache import UserIdentity, get_user_cache
 
 
 def _norm_username(v: str | None) -> str | None:
@@ -17,6 +18,11 @@ def _norm_username(v: str | None) -> str | None:
 
 
 class UserRegistrationMiddleware(BaseMiddleware):
+    """
+    Регистрирует игрока при первом апдейте и кладёт его данные в data["user_identity"].
+    Уже известные игроки берутся из кэша (services.user_cache) — без запроса в БД.
+    """
+
     async def __call__(
         self,
         handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
@@ -24,6 +30,18 @@ class UserRegistrationMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         user_data = event.from_user
+        cache = get_user_cache()
+
+        identity = cache.get(user_data.id)
+        if identity is None:
+            identity = await self._register(user_data)
+            cache.put(identity)
+
+        data["user_identity"] = identity
+        return await handler(event, data)
+
+    @staticmethod
+    async def _register(user_data) -> UserIdentity:
         username = _norm_username(user_data.username)
 
         async with get_session() as session:
@@ -53,9 +71,12 @@ class UserRegistrationMiddleware(BaseMiddleware):
                     placeholder.last_name = user_data.last_name
                     placeholder.language_code = user_data.language_code
                     await session.commit()
+                    # запись сменила tg_id — прежняя (если была) больше не верна
+                    get_user_cache().invalidate(user_data.id)
+                    db_user = placeholder
                 else:
                     # 3) Иначе создаём нового пользователя с реальным tg_id
-                    await User.create(
+                    db_user = await User.create(
                         session=session,
                         tg_id=user_data.id,
                         username=username,
@@ -64,4 +85,4 @@ class UserRegistrationMiddleware(BaseMiddleware):
                         language_code=user_data.language_code,
                     )
 
-        return await handler(event, data)
+            return UserIdentity.from_user(db_user)
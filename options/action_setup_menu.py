@@ -1,22 +1,22 @@
 # options/action_setup.py
-import asyncio
 import logging
 from typing import Optional, List
+from uuid import uuid4
 
 from aiogram import types
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import case, exists, func, select, update
 
-from utils.ask_and_answer import append_ask_and_answer
-from utils.news_to_print import add_news_to_print
-from utils.rituals import append_ritual
+from utils.ask_and_answer import ask_and_answer_payload
+from utils.news_to_print import news_to_print_payload
+from utils.rituals import ritual_row_payload
 from .registry import option
 from db.session import get_session
-from db.models import Action, ActionType, User, ActionStatus, District
+from db.loaders import load_profile
+from db.models import Action, ActionType, User, ActionStatus, District, SheetsOutbox
 from screens.settings_action import SettingsActionScreen
 
-from utils.raw_body_input import add_raw_row
+from utils.raw_body_input import raw_row_payload
 
 # --- NOTIFY HELPERS -----------------------------------------------------------
 from services.notify import notify_user  # <- как мы делали ранее
@@ -119,6 +119,71 @@ async def _notify_watchers_action_cancelled(session, bot, actor: User, action: A
         await notify_user(bot, w.tg_id, title=title, body=body)
 
 
+# --- GOOGLE SHEETS OUTBOX -----------------------------------------------------
+async def _enqueue_sheet_rows(session, user: User, action: Action) -> None:
+    """
+    Кладёт строки для Google Sheets в outbox (без commit — вместе с отправкой заявки).
+    Пишет их фоновый флашер (services.sheets_outbox). Ключ — action.id и номер отправки:
+    заявка, возвращённая в черновик и отправленная снова, даёт новые строки, а повторы
+    записи одной отправки флашер отсекает по колонке outbox_key.
+    """
+    kind = (action.kind or "").lower()
+    submission = uuid4().hex[:12]
+
+    if kind == "ritual":
+        u_name = (user.in_game_name or user.username or f"tg:{user.tg_id}").strip()
+        a_text = (action.text or "").strip()
+        candles = int(action.candles or 0)
+        raw_body = f"\"{u_name}\" начал ритуал: \"{a_text}\" на \"{candles}\" свечей"
+        # не заполняем title / to_send — только raw_body, created_at и type
+        await SheetsOutbox.enqueue(
+            session,
+            worksheet="RAW",
+            payload=raw_row_payload(raw_body=raw_body, created_at=str(action.created_at), type_value="ritual.start"),
+            idempotency_key=f"RAW:ritual.start:{action.id}:{submission}",
+        )
+        await SheetsOutbox.enqueue(
+            session,
+            worksheet="rituals",
+            payload=ritual_row_payload(
+                action_title=action.title,
+                action_user_in_game_name=u_name,
+                action_text=action.text,
+                created_at=action.created_at,
+                action_id=action.id,
+            ),
+            idempotency_key=f"rituals:{action.id}:{submission}",
+        )
+
+    # Для разведки НЕ по району: отправляем вопрос в ask_and_answer
+    if kind.startswith("scout") and action.type != ActionType.SCOUT_DISTRICT:
+        await SheetsOutbox.enqueue(
+            session,
+            worksheet="ask_and_answer",
+            payload=ask_and_answer_payload(
+                username=(user.username or "").strip(),
+                in_game_name=(user.in_game_name or "").strip(),
+                question=(action.text or "").strip(),
+                action_id=action.id,
+            ),
+            idempotency_key=f"ask_and_answer:{action.id}:{submission}",
+        )
+
+    if kind == "communicate":
+        await SheetsOutbox.enqueue(
+            session,
+            worksheet="news_to_print",
+            payload=news_to_print_payload(
+                title=(action.title or "Предложение новости").strip(),
+                body=(action.text or "").strip(),
+                action_id=action.id,
+                spent_info=(action.information or 0),
+                to_send=False,  # отметим для переноса в news
+            ),
+            idempotency_key=f"news_to_print:{action.id}:{submission}",
+        )
+
+
 # -------------------------------------------------------------------------------
 
 
@@ -244,6 +309,12 @@ async def action_setup_menu_is_positive_decrease(cb: types.CallbackQuery, state:
 
 _RESOURCE_FIELDS = {"force", "money", "influence", "information"}
 _STEP = 1
+_BULK_STEP = 5  # кнопки «➕5/➖5»: одно нажатие — один запрос на несколько единиц
+
+
+def _clamp(value, upper):
+    """SQL-выражение: value, зажатое в [0, upper]."""
+    return case((value > upper, upper), (value < 0, 0), else_=value)
 
 
 async def _bump_resource(cb: types.CallbackQuery, state: FSMContext, action_id: int, field: str, delta: int):
@@ -251,68 +322,80 @@ async def _bump_resource(cb: types.CallbackQuery, state: FSMContext, action_id:
         await cb.answer("Неизвестный ресурс.", show_alert=True)
         return
 
+    # Один условный UPDATE ... RETURNING: проверка границ и изменение — в БД, без гонки
+    # между чтением и записью при быстрых нажатиях. Потолок — свободный ресурс игрока.
+    column = getattr(Action, field)
+    current = func.coalesce(column, 0)
+    cap = func.coalesce(
+        select(getattr(User, field)).where(User.tg_id == cb.from_user.id).scalar_subquery(), 0
+    )
+    new_value = _clamp(current + delta, cap)
     async with get_session() as session:
-        user = (await session.execute(select(User).where(User.tg_id == cb.from_user.id))).scalars().first()
-        action = (await session.execute(select(Action).where(Action.id == action_id))).scalars().first()
-        if not user or not action:
-            await cb.answer("Не найдена заявка/пользователь.", show_alert=True)
-            return
-
-        current = getattr(action, field, 0) or 0
-        cap = getattr(user, field, 0) or 0
-
-        new_val = current + delta
-        if new_val < 0:
-            new_val = 0
-        if new_val > cap:
-            new_val = cap
-
-        if new_val == current:
-            if delta > 0 and current >= cap:
+        new_val = (await session.execute(
+            update(Action)
+            .where(
+                Action.id == action_id,
+                exists().where(User.tg_id == cb.from_user.id),
+                current != new_value,
+            )
+            .values({field: new_value})
+            .returning(column)
+        )).scalar_one_or_none()
+
+        if new_val is None:
+            # ничего не поменялось — выясняем почему (редкий путь)
+            row = (await session.execute(
+                select(current, cap).where(Action.id == action_id)
+            )).first()
+            user_exists = await session.scalar(select(exists().where(User.tg_id == cb.from_user.id)))
+            if row is None or not user_exists:
+                await cb.answer("Не найдена заявка/пользователь.", show_alert=True)
+            elif delta > 0 and row[0] >= row[1]:
                 await cb.answer("Больше вложить нельзя — нет свободных ресурсов.")
-            elif delta < 0 and current <= 0:
+            elif delta < 0 and row[0] <= 0:
                 await cb.answer("И так уже 0.")
             else:
                 await cb.answer("Без изменений.")
             return
-
-        setattr(action, field, new_val)
         await session.commit()
 
     await _rerender(cb, state, action_id)
     sign = "➕" if delta > 0 else "➖"
-    await cb.answer(f"{sign} {field}: {current} → {new_val}")
+    await cb.answer(f"{sign}{abs(delta)} {field} → {new_val}")
 
 
 async def _bump_candles(cb: types.CallbackQuery, state: FSMContext, action_id: int, delta: int):
+    current = func.coalesce(Action.candles, 0)
+    new_value = _clamp(current + delta, _MAX_CANDLES)  # держим 0..8 при редактировании
+    owner_id = select(User.id).where(User.tg_id == cb.from_user.id).scalar_subquery()
     async with get_session() as session:
-        user = (await session.execute(select(User).where(User.tg_id == cb.from_user.id))).scalars().first()
-        action = (await session.execute(select(Action).where(Action.id == action_id))).scalars().first()
-
-        if not user or not action:
-            await cb.answer("Не найдена заявка/пользователь.", show_alert=True)
-            return
-        if action.owner_id != user.id:
-            await cb.answer("Эта заявка принадлежит другому игроку.", show_alert=True)
-            return
-
-        current = int(action.candles or 0)
-        new_val = max(0, min(_MAX_CANDLES, current + delta))  # держим 0..8 при редактировании
-
-        if new_val == current:
-            if delta > 0 and current >= _MAX_CANDLES:
+        new_val = (await session.execute(
+            update(Action)
+            .where(Action.id == action_id, Action.owner_id == owner_id, current != new_value)
+            .values(candles=new_value)
+            .returning(Action.candles)
+        )).scalar_one_or_none()
+
+        if new_val is None:
+            row = (await session.execute(
+                select(current, Action.owner_id).where(Action.id == action_id)
+            )).first()
+            user_id = await session.scalar(select(User.id).where(User.tg_id == cb.from_user.id))
+            if row is None or user_id is None:
+                await cb.answer("Не найдена заявка/пользователь.", show_alert=True)
+            elif row[1] != user_id:
+                await cb.answer("Эта заявка принадлежит другому игроку.", show_alert=True)
+            elif delta > 0 and row[0] >= _MAX_CANDLES:
                 await cb.answer("Максимум 8 свечей.")
-            elif delta < 0 and current <= 0:
+            elif delta < 0 and row[0] <= 0:
                 await cb.answer("И так уже 0.")
             else:
                 await cb.answer("Без изменений.")
             return
-
-        action.candles = new_val
         await session.commit()
 
     await _rerender(cb, state, action_id)
-    await cb.answer(f"{'➕' if delta > 0 else '➖'} candles: {current} → {new_val}")
+    await cb.answer(f"{'➕' if delta > 0 else '➖'} candles → {new_val}")
 
 
 @option("action_setup_menu_candles_add")
@@ -365,6 +448,46 @@ async def action_setup_menu_force_remove(cb: types.CallbackQuery, state: FSMCont
     await _bump_resource(cb, state, action_id, "force", -_STEP)
 
 
+@option("action_setup_menu_money_add_bulk")
+async def action_setup_menu_money_add_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "money", +_BULK_STEP)
+
+
+@option("action_setup_menu_money_remove_bulk")
+async def action_setup_menu_money_remove_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "money", -_BULK_STEP)
+
+
+@option("action_setup_menu_influence_add_bulk")
+async def action_setup_menu_influence_add_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "influence", +_BULK_STEP)
+
+
+@option("action_setup_menu_influence_remove_bulk")
+async def action_setup_menu_influence_remove_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "influence", -_BULK_STEP)
+
+
+@option("action_setup_menu_information_add_bulk")
+async def action_setup_menu_information_add_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "information", +_BULK_STEP)
+
+
+@option("action_setup_menu_information_remove_bulk")
+async def action_setup_menu_information_remove_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "information", -_BULK_STEP)
+
+
+@option("action_setup_menu_force_add_bulk")
+async def action_setup_menu_force_add_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "force", +_BULK_STEP)
+
+
+@option("action_setup_menu_force_remove_bulk")
+async def action_setup_menu_force_remove_bulk(cb: types.CallbackQuery, state: FSMContext, action_id: int, **_):
+    await _bump_resource(cb, state, action_id, "force", -_BULK_STEP)
+
+
 @option("action_setup_menu_back")
 async def action_setup_menu_back(cb: types.CallbackQuery, state: FSMContext, **kwargs):
     from screens.actions import ActionsScreen
@@ -389,7 +512,7 @@ async def action_setup_menu_done(cb: types.CallbackQuery, state, action_id: int,
 
             action = (await session.execute(
                 select(Action)
-                .options(selectinload(Action.owner))
+                .options(*load_profile("action_notify"))
                 .where(Action.id == action_id)
             )).scalars().first()
 
@@ -489,57 +612,10 @@ async def action_setup_menu_done(cb: types.CallbackQuery, state, action_id: int,
                     if district is not None:
                         user.scouts_districts.append(district)
 
+            # строки для Google Sheets — в outbox той же транзакцией, запись в фоне
+            await _enqueue_sheet_rows(session, user, action)
+
             await session.commit()
-            try:
-                is_ritual = (action.kind or "").lower() == "ritual"
-                if is_ritual:
-                    u_name = (user.in_game_name or user.username or f"tg:{user.tg_id}").strip()
-                    a_text = (action.text or "").strip()
-                    candles = int(action.candles or 0)
-
-                    raw_body = f"\"{u_name}\" начал ритуал: \"{a_text}\" на \"{candles}\" свечей"
-                    # не заполняем title / created_at / to_send — только raw_body и type
-                    await asyncio.to_thread(add_raw_row, raw_body=raw_body, created_at=str(action.created_at),
-                                            type_value="ritual.start")
-                    await asyncio.to_thread(append_ritual,
-                                            action_title=action.title,
-                                            action_user_in_game_name=u_name,
-                                            action_text=action.text,
-                                            created_at=action.created_at,
-                                            action_id=action.id
-                                            )
-            except Exception:
-                logging.exception("failed to append ritual RAW news")
-            try:
-                # Для разведки НЕ по району: отправляем вопрос в ask_and_answer
-                is_scout_kind = (action.kind or "").lower().startswith("scout")
-                if is_scout_kind and action.type != ActionType.SCOUT_DISTRICT:
-                    await asyncio.to_thread(
-                        append_ask_and_answer,
-                        username=(user.username or "").strip(),
-                        in_game_name=(user.in_game_name or "").strip(),
-                        question=(action.text or "").strip(),
-                        action_id=action.id,
-                    )
-            except Exception:
-                logging.exception("failed to append ask_and_answer for scout")
-            try:
-                is_communicate = (action.kind or "").lower() == "communicate"
-                if is_communicate:
-                    title = (action.title or "Предложение новости").strip()
-                    body = (action.text or "").strip()
-                    # отправляем сразу в конвейер (to_send=True)
-                    await asyncio.to_thread(
-                        add_news_to_print,
-                        title=title,
-                        body=body,
-                        action_id=action.id,
-                        spent_info=(action.information or 0),
-                        to_send=False,  # отметим для переноса в news
-                        # created_at=None      # оставим по умолчанию — функция проставит текущее время
-                    )
-            except Exception:
-                logging.exception("failed to append communicate news_to_print")
             try:
                 logging.info("notify watchers started")
                 await _notify_watchers_action_started(session, cb.bot, user, action)
@@ -583,7 +659,7 @@ async def action_setup_menu_edit(cb: types.CallbackQuery, state: FSMContext, act
 
             action = (await session.execute(
                 select(Action)
-                .options(selectinload(Action.owner))
+                .options(*load_profile("action_owner"))
                 .where(Action.id == action_id)
             )).scalars().first()
 
@@ -649,7 +725,7 @@ async def action_setup_menu_delete(cb: types.CallbackQuery, state: FSMContext, a
 
             action = (await session.execute(
                 select(Action)
-                .options(selectinload(Action.owner))
+                .options(*load_profile("action_owner"))
                 .where(Action.id == action_id)
             )).scalars().first()
 
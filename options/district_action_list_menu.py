@@ -7,9 +7,9 @@ from screens.actions import ActionsScreen
 from screens.settings_action import DistrictActionList, SettingsActionScreen
 from .registry import option
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import District, User, Action, ActionType, ActionStatus
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 
 @option("action_district_menu_back")
@@ -52,7 +52,7 @@ async def action_district_menu_pick(cb: types.CallbackQuery, state: FSMContext,
         rows = (
             await session.execute(
                 select(District)
-                .options(selectinload(District.owner))
+                .options(*load_profile("district_owner"))
                 .order_by(District.id)
             )
         ).scalars().all()
@@ -4,10 +4,10 @@ import logging
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 from .registry import option
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, Politician, Action, ActionStatus, ActionType
 from screens.politician_list import PoliticianActionList
 from screens.settings_action import SettingsActionScreen
@@ -48,7 +48,7 @@ async def action_politician_menu_pick(cb: types.CallbackQuery, state: FSMContext
         rows = (
             await session.execute(
                 select(Politician)
-                .options(selectinload(Politician.district))
+                .options(*load_profile("politician_district"))
                 .order_by(
                     Politician.district_id.is_(None),  # non-null сначала, NULL — в конец
                     Politician.district_id.asc(),
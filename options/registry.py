@@ -1,9 +1,88 @@
 import asyncio
 import importlib
+import inspect
+import logging
 import pkgutil
-from typing import Callable, Awaitable, Dict, Optional
+import typing
+from dataclasses import dataclass
+from typing import Any, Callable, Awaitable, Dict, FrozenSet, Mapping, Optional, Tuple
 
-_REGISTRY: Dict[str, Callable[..., Awaitable[None]]] = {}
+from utils.callback import register_callback_key
+
+# Что обработчик опции может получить от роутера (имя параметра → значение из апдейта)
+INJECTABLES: FrozenSet[str] = frozenset({"cb", "state", "session", "user_identity"})
+
+# Приведение значений из callback_data к объявленному типу параметра
+_COERCERS: Dict[type, Callable[[Any], Any]] = {
+    int: int,
+    float: float,
+    str: str,
+    bool: lambda v: v if isinstance(v, bool) else str(v).strip().lower() in ("1", "true", "yes", "on"),
+}
+
+
+@dataclass(frozen=True)
+class OptionSpec:
+    """Соглашение о вызове обработчика, посчитанное один раз при регистрации."""
+    func: Callable[..., Awaitable[None]]
+    injects: Tuple[str, ...]          # какие из INJECTABLES он принимает
+    accepts_kwargs: bool              # есть **kwargs — отдаём все параметры callback_data
+    params: FrozenSet[str]            # объявленные имена (без инъекций)
+    coercers: Mapping[str, Tuple[type, Callable[[Any], Any]]]
+
+    @classmethod
+    def build(cls, func: Callable[..., Awaitable[None]]) -> "OptionSpec":
+        sig = inspect.signature(func)
+        try:
+            hints = typing.get_type_hints(func)
+        except Exception:
+            hints = {}
+        injects, params, coercers = [], set(), {}
+        accepts_kwargs = False
+        for p in sig.parameters.values():
+            if p.kind == p.VAR_KEYWORD:
+                accepts_kwargs = True
+                continue
+            if p.kind == p.VAR_POSITIONAL:
+                continue
+            if p.name in INJECTABLES:
+                injects.append(p.name)
+                continue
+            params.add(p.name)
+            tp = hints.get(p.name)
+            if tp in _COERCERS:
+                coercers[p.name] = (tp, _COERCERS[tp])
+        return cls(
+            func=func,
+            injects=tuple(injects),
+            accepts_kwargs=accepts_kwargs,
+            params=frozenset(params),
+            coercers=coercers,
+        )
+
+    def _coerce(self, name: str, value: Any) -> Any:
+        c = self.coercers.get(name)
+        if c is None or isinstance(value, c[0]) and not (c[0] is int and isinstance(value, bool)):
+            return value
+        try:
+            return c[1](value)
+        except (TypeError, ValueError):
+            logging.warning("Option %s: не удалось привести %s=%r к %s", self.func.__name__, name, value, c[0].__name__)
+            return value
+
+    def __call__(self, injected: Mapping[str, Any], cb_kwargs: Mapping[str, Any]) -> Awaitable[None]:
+        call_kwargs = {name: injected[name] for name in self.injects if injected.get(name) is not None}
+        if self.accepts_kwargs:
+            for name, val in cb_kwargs.items():
+                call_kwargs[name] = self._coerce(name, val) if name in self.coercers else val
+        else:
+            for name, val in cb_kwargs.items():
+                if name in self.params:
+                    call_kwargs[name] = self._coerce(name, val)
+        return self.func(**call_kwargs)
+
+
+_REGISTRY: Dict[str, OptionSpec] = {}
 
 
 def option(name: Optional[str] = None):
@@ -16,13 +95,19 @@ def option(name: Optional[str] = None):
         key = name or func.__name__
         if key in _REGISTRY:
             raise RuntimeError(f"Option '{key}' already registered")
-        _REGISTRY[key] = func
+        _REGISTRY[key] = OptionSpec.build(func)
+        register_callback_key(key)  # для разбора компактного callback_data
         return func
 
     return wrapper
 
 
 def get_option(name: str) -> Optional[Callable[..., Awaitable[None]]]:
+    spec = _REGISTRY.get(name)
+    return spec.func if spec else None
+
+
+def get_option_spec(name: str) -> Optional[OptionSpec]:
     return _REGISTRY.get(name)
 
 
@@ -2,9 +2,9 @@ import logging
 
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, update, and_
-from sqlalchemy.orm import selectinload
 from aiogram import types
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import Action, ActionStatus, District, User
 from options.registry import option
 from services.notify import notify_user
@@ -95,7 +95,7 @@ async def _try_resolve_personal_duel(session, cb: types.CallbackQuery, trigger_a
     # Все pending on-point действия по этому району (и атаки, и защиты)
     q = (
         select(Action)
-        .options(selectinload(Action.owner))
+        .options(*load_profile("action_owner"))
         .where(
             Action.status == ActionStatus.PENDING,
             Action.district_id == trigger_action.district_id,
@@ -175,7 +175,7 @@ async def _try_resolve_personal_duel(session, cb: types.CallbackQuery, trigger_a
     # Для каждого участника: `/set_district_owner #<district_id> @<username>` -- <won_on_point>
     lines = []
     for a in actions:
-        u = a.owner  # подгружен selectinload'ом
+        u = a.owner  # профиль action_owner
         uname = (u.username or f"user{u.id}") if u else f"user{a.owner_id}"
         mark = "won=True" if a.won_on_point is True else ("won=False" if a.won_on_point is False else "won=None")
         lines.append(f"`/set_district_owner #{trigger_action.district_id} @{uname}` -- {mark}")
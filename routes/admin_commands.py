@@ -12,6 +12,10 @@ from sqlalchemy import select
 
 from db.models import User
 from db.session import get_session  # ваш общий фабричный get_session
+from services.delivery import get_delivery
+from services.message_store import get_message_store
+from services.render_coalescer import get_render_coalescer
+from services.user_cache import get_user_cache
 
 log = logging.getLogger("admin_commands")
 router = Router()
@@ -84,6 +88,9 @@ async def _run_and_report(message: types.Message, title: str, script_key: str, *
     script_path = (PROJECT_CWD / SCRIPTS[script_key]).resolve()
 
     rc, out, err = await _run_script(script_path, *args, timeout=timeout)
+    # скрипты пишут в БД из своего процесса (импорт пересоздаёт пользователей, выдаёт админку) —
+    # кэш мидлвари перечитает игроков из БД, не дожидаясь USER_CACHE_TTL
+    get_user_cache().invalidate()
 
     status = "✅ Успех" if rc == 0 else f"❌ Ошибка (rc={rc})"
 
@@ -173,4 +180,47 @@ async def admin_sync_rituals(message: types.Message):
         title="Обработка RESOLVED ритуалов: перевод PENDING → DONE и уведомления",
         script_key="sync_rituals",
         timeout=None,
-    )
\ No newline at end of file
+    )
+
+# =========================
+# 7) /admin_delivery_stats
+# =========================
+@router.message(Command("admin_delivery_stats"))
+async def admin_delivery_stats(message: types.Message):
+    if not await _is_admin(message.from_user.id):
+        await message.answer("Команда доступна только администраторам.")
+        return
+    stats = get_delivery().stats()
+    lines = [f"<code>{html.escape(k)}</code>: {v if v is not None else '—'}" for k, v in stats.items()]
+    await message.answer("<b>Очередь доставки</b>\n" + "\n".join(lines), parse_mode="HTML")
+
+# =========================
+# 8) /admin_cache_stats
+# =========================
+@router.message(Command("admin_cache_stats"))
+async def admin_cache_stats(message: types.Message):
+    if not await _is_admin(message.from_user.id):
+        await message.answer("Команда доступна только администраторам.")
+        return
+    parts = []
+    for title, stats in (
+        ("Главные экраны (message store)", get_message_store().stats()),
+        ("Кэш пользователей", get_user_cache().stats()),
+        ("Схлопывание рендеров", get_render_coalescer().stats()),
+    ):
+        lines = [f"<code>{html.escape(k)}</code>: {v if v is not None else '—'}" for k, v in stats.items()]
+        parts.append(f"<b>{title}</b>\n" + "\n".join(lines))
+    await message.answer("\n\n".join(parts), parse_mode="HTML")
+
+# =========================
+# 9) /admin_cache_reset
+# =========================
+@router.message(Command("admin_cache_reset"))
+async def admin_cache_reset(message: types.Message):
+    """Сбрасывает кэш пользователей — после ручных правок users в БД или запуска скриптов мимо бота."""
+    if not await _is_admin(message.from_user.id):
+        await message.answer("Команда доступна только администраторам.")
+        return
+    size = get_user_cache().stats()["size"]
+    get_user_cache().invalidate()
+    await message.answer(f"Кэш пользователей сброшен (записей: {size}).")
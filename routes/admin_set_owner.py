@@ -7,9 +7,9 @@ from typing import Optional, List
 from aiogram import types, Router
 from aiogram.filters import Command
 from sqlalchemy import select, update, and_
-from sqlalchemy.orm import selectinload
 
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, District, Action, ActionStatus
 from services.notify import notify_user
 from utils.get_last_cycle_finished import read_last_cycle_finished
@@ -91,7 +91,7 @@ async def set_district_owner_cmd(message: types.Message):
         # 4) pending on-point действия по району до cutoff
         q = (
             select(Action)
-            .options(selectinload(Action.owner))
+            .options(*load_profile("action_owner"))
             .where(
                 Action.status == ActionStatus.PENDING,
                 Action.district_id == did,
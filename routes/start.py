@@ -6,9 +6,9 @@ import logging
 from aiogram import types, Router
 from aiogram.filters import CommandStart, CommandObject
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, Action, ActionType, ActionStatus
 from screens.registration_screen import RegistrationScreen, RegistrationSuccessScreen
 from screens.settings_action import SettingsActionScreen
@@ -61,10 +61,7 @@ async def start_with_payload(message: types.Message, command: CommandObject, sta
         parent: Action | None = (
             await session.execute(
                 select(Action)
-                .options(
-                    selectinload(Action.owner),
-                    selectinload(Action.district),
-                )
+                .options(*load_profile("action_notify"))
                 .where(Action.id == parent_id)
             )
         ).scalars().first()
@@ -1,33 +1,36 @@
 # screens/base.py (замените _render целиком)
-import os
 import logging
 from typing import Any, Dict, Tuple, Optional
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
 from aiogram.exceptions import TelegramBadRequest
 
 from config import load_config
 from keyboards.renderer import KeyboardRenderer
 from keyboards.spec import KeyboardSpec
+from screens.templates import TemplateRegistry
+from services.delivery import PRIORITY_INTERACTIVE, PRIORITY_NOTICE, deliver
 from services.message_store import get_message, set_message, clear_message
+from services.render_coalescer import get_render_coalescer
+from utils.callback import payload_store
 from utils.render import content_hash
 from aiogram import types
 
 _config = load_config()
 _keyboard_renderer = KeyboardRenderer()
+_template_registries: Dict[str, TemplateRegistry] = {}
 
 
-def camel_to_snake(name: str) -> str:
-    out = []
-    for i, ch in enumerate(name):
-        if ch.isupper() and i and (not name[i - 1].isupper()):
-            out.append("_")
-        out.append(ch.lower())
-    return "".join(out)
+def get_template_registry(template_root: Optional[str] = None) -> TemplateRegistry:
+    root = template_root or _config.template_root
+    registry = _template_registries.get(root)
+    if registry is None:
+        registry = _template_registries[root] = TemplateRegistry(root)
+    return registry
 
 
 class BaseScreen:
     template_root: str = _config.template_root
-    _env_cache: Dict[Tuple[str, str], Environment] = {}
+    # False — у экрана нет своего шаблона (не проверяется при старте)
+    template_required: bool = True
 
     async def run(self, *args: Any, **kwargs: Any) -> Any:
         args, kwargs = await self._apply_stage(self._pre_render, *args, **kwargs)
@@ -40,22 +43,7 @@ class BaseScreen:
 
     async def _render(self, *args: Any, **kwargs: Any) -> Optional[Any]:
         localization = kwargs.get("localization", _config.default_localization)
-        class_snake = camel_to_snake(self.__class__.__name__)
-        env = self._get_env(localization)
-
-        candidates = [class_snake, f"{class_snake}.j2", f"{class_snake}.txt.j2"]
-        template = None
-        for name in candidates:
-            try:
-                template = env.get_template(name)
-                break
-            except TemplateNotFound:
-                continue
-        if template is None:
-            raise FileNotFoundError(
-                f"Template not found for {self.__class__.__name__} "
-                f"in {self.template_root}/{localization}/ among {candidates}"
-            )
+        template = get_template_registry(self.template_root).get(type(self), localization)
         rendered = template.render(**kwargs)
 
         # Клавиатура (если задали спецификацию)
@@ -63,6 +51,8 @@ class BaseScreen:
         keyboard_spec: KeyboardSpec | None = kwargs.get("keyboard")
         if keyboard_spec is not None:
             reply_markup = _keyboard_renderer.build(keyboard_spec, kwargs)
+            # параметры, не влезшие в callback_data, — в БД до отправки (кнопку разберёт любой процесс)
+            await payload_store.flush()
 
         message: types.Message | None = kwargs.get("message")
 
@@ -93,67 +83,80 @@ class BaseScreen:
         c_hash = content_hash(rendered, reply_markup)
 
         # Нотификация — всегда новое сообщение, не трогаем main
+        # Всё уходит через общую очередь доставки (services.delivery): ответ на действие
+        # пользователя — интерактивный приоритет, push без message — delivery_priority (по умолчанию notice)
         if render_kind == "notice" or force_new:
             if message:
-                sent = await message.answer(rendered, **send_kwargs)
+                sent = await deliver(
+                    lambda: message.answer(rendered, **send_kwargs),
+                    chat_id=chat_id,
+                    priority=kwargs.get("delivery_priority", PRIORITY_INTERACTIVE),
+                )
             else:
                 bot = message.bot if message else kwargs.get("bot")
                 if bot is None:
                     raise ValueError("Нужен bot или message")
-                sent = await bot.send_message(
+                sent = await deliver(
+                    lambda: bot.send_message(chat_id=chat_id, text=rendered, **send_kwargs),
+                    chat_id=chat_id,
+                    priority=kwargs.get("delivery_priority", PRIORITY_NOTICE),
+                )
+            if not no_store:
+                set_message(chat_id, persist_key, render_kind, sent.message_id, c_hash)
+            return {"rendered_text": rendered, "_result": sent, "reply_markup": reply_markup}
+
+        # Попытка редактирования "main": рендеры одного экрана схлопываются
+        # (services.render_coalescer) — в полёте не больше одного edit/send на (chat_id, persist_key)
+        async def edit_or_send() -> Dict[str, Any]:
+            stored = await get_message(chat_id, persist_key, "main")
+            logging.info(f"persist_key={persist_key}, stored={stored}")
+            if stored:
+                last_id, ts, prev_hash = stored
+                # если контент не поменялся — ничего не делаем
+                if prev_hash == c_hash:
+                    logging.info("Skip edit: content not changed (%s)", persist_key)
+                    return {"rendered_text": rendered, "_result": None, "reply_markup": reply_markup}
+
+                age_ok = (ts is None) or ((__import__("time").time() - ts) <= max_age)
+                if age_ok:
+                    try:
+                        edited = await deliver(
+                            lambda: message.bot.edit_message_text(
                                 chat_id=chat_id,
+                                message_id=last_id,
                                 text=rendered,
-                                **send_kwargs,
-                            )
+                                parse_mode=send_kwargs["parse_mode"],
+                                disable_web_page_preview=send_kwargs["disable_web_page_preview"],
+                                reply_markup=send_kwargs.get("reply_markup"),
+                            ),
+                            chat_id=chat_id,
+                            priority=PRIORITY_INTERACTIVE,
+                        )
+                        set_message(chat_id, persist_key, "main", edited.message_id, c_hash)
+                        return {"rendered_text": rendered, "_result": edited, "reply_markup": reply_markup}
+                    except TelegramBadRequest as e:
+                        # Частые случаи: "message is not modified", "message to edit not found", "message can't be edited"
+                        logging.warning("Edit failed (%s), fallback to send: %s", persist_key, e)
+
+            # Если нечего редактировать или не вышло — отправляем новое и сохраняем
+            sent = await deliver(
+                lambda: message.answer(rendered, **send_kwargs),
+                chat_id=chat_id,
+                priority=PRIORITY_INTERACTIVE,
+            )
             if not no_store:
-                set_message(chat_id, persist_key, render_kind, sent.message_id, c_hash)
+                set_message(chat_id, persist_key, "main", sent.message_id, c_hash)
             return {"rendered_text": rendered, "_result": sent, "reply_markup": reply_markup}
 
-        # Попытка редактирования "main"
-        stored = get_message(chat_id, persist_key, "main")
-        logging.info(f"persist_key={persist_key}, stored={stored}")
-        if stored:
-            last_id, ts, prev_hash = stored
-            # если контент не поменялся — ничего не делаем
-            if prev_hash == c_hash:
-                logging.info("Skip edit: content not changed (%s)", persist_key)
-                return {"rendered_text": rendered, "_result": None, "reply_markup": reply_markup}
-
-            age_ok = (ts is None) or ((__import__("time").time() - ts) <= max_age)
-            if age_ok:
-                try:
-                    edited = await message.bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=last_id,
-                        text=rendered,
-                        parse_mode=send_kwargs["parse_mode"],
-                        disable_web_page_preview=send_kwargs["disable_web_page_preview"],
-                        reply_markup=send_kwargs.get("reply_markup"),
-                    )
-                    set_message(chat_id, persist_key, "main", edited.message_id, c_hash)
-                    return {"rendered_text": rendered, "_result": edited, "reply_markup": reply_markup}
-                except TelegramBadRequest as e:
-                    # Частые случаи: "message is not modified", "message to edit not found", "message can't be edited"
-                    logging.warning("Edit failed (%s), fallback to send: %s", persist_key, e)
-
-        # Если нечего редактировать или не вышло — отправляем новое и сохраняем
-        sent = await message.answer(rendered, **send_kwargs)
-        if not no_store:
-            set_message(chat_id, persist_key, "main", sent.message_id, c_hash)
-        return {"rendered_text": rendered, "_result": sent, "reply_markup": reply_markup}
+        result = await get_render_coalescer().submit((chat_id, persist_key), edit_or_send)
+        if result is None:
+            logging.info("Skip render: superseded by a newer one (%s)", persist_key)
+            return {"rendered_text": rendered, "_result": None, "reply_markup": reply_markup}
+        return result
 
     async def _post_render(self, *args: Any, **kwargs: Any) -> Optional[Any]:
         return None
 
-    def _get_env(self, localization: str) -> Environment:
-        key = (self.template_root, localization)
-        env = self._env_cache.get(key)
-        if env is None:
-            folder = os.path.join(self.template_root, localization)
-            env = Environment(loader=FileSystemLoader(folder), autoescape=False)
-            self._env_cache[key] = env
-        return env
-
     async def _apply_stage(self, stage, *args: Any, **kwargs: Any) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
         ret = await stage(*args, **kwargs)
         if ret is None:
@@ -4,9 +4,9 @@ from typing import List
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, District, Politician
 from .base import BaseScreen
 from keyboards.presets import district_list_kb
@@ -48,7 +48,7 @@ class DistrictList(BaseScreen):
             rows: List[District] = (
                 await session.execute(
                     select(District)
-                    .options(selectinload(District.owner))
+                    .options(*load_profile("district_owner"))
                     .order_by(District.id)
                 )
             ).scalars().all()
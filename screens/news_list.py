@@ -5,10 +5,10 @@ from typing import List
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
 from datetime import timezone
 
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import News
 from .base import BaseScreen
 from keyboards.presets import news_list_kb  # см. ниже
@@ -80,7 +80,7 @@ class NewsList(BaseScreen):
             # Запрашиваем конкретную порцию новостей
             stmt = (
                 select(News)
-                .options(selectinload(News.action))
+                .options(*load_profile("news_action"))
                 .order_by(News.created_at.desc())
                 .limit(PAGE_SIZE)
                 .offset(page * PAGE_SIZE)
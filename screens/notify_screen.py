@@ -80,6 +80,8 @@ class AdminWhoWonScreen(BaseScreen):
     Простой экран уведомления: заголовок + текст.
     Шлёт как notice (всегда новое сообщение).
     """
+    template_required = False  # шаблона admin_who_won_screen пока нет; экран нигде не вызывается
+
     async def _pre_render(
         self,
         message: types.Message | None = None,
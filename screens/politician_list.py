@@ -6,9 +6,9 @@ from typing import List, Optional
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, Politician, Action, ActionStatus, ActionType
 from keyboards.spec import KeyboardSpec, KeyboardParams
 from .base import BaseScreen
@@ -51,7 +51,7 @@ class PoliticianActionList(BaseScreen):
             rows = (
                 await session.execute(
                     select(Politician)
-                    .options(selectinload(Politician.district))
+                    .options(*load_profile("politician_district"))
                     .order_by(
                         Politician.district_id.is_(None),  # non-null сначала, NULL — в конец
                         Politician.district_id.asc(),
@@ -2,6 +2,7 @@ import logging
 from aiogram import types
 from sqlalchemy import select, func
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, District, Action, ActionStatus, ActionType
 from keyboards.spec import KeyboardParams, KeyboardSpec
 from .base import BaseScreen
@@ -19,7 +20,7 @@ class ProfileScreen(BaseScreen):
         logging.info("StatusScreen for tg_id=%s", tg_id)
 
         async with get_session() as session:
-            user = await User.get_by_tg_id(session, tg_id)
+            user = await User.get_by_tg_id(session, tg_id, options=load_profile("profile_screen"))
             if user is None:
                 user = await User.create(
                     session=session,
@@ -29,6 +30,7 @@ class ProfileScreen(BaseScreen):
                     last_name=(actor or message.from_user).last_name,
                     language_code=(actor or message.from_user).language_code,
                 )
+                await session.refresh(user, attribute_names=["scouts_districts"])
 
             # --- Районы ---
             districts = await District.get_by_owner(session, user.id)
@@ -36,11 +38,12 @@ class ProfileScreen(BaseScreen):
             districts_view = [f"{d.name} — ОК: {d.control_points}" for d in districts]
 
             # --- Разведка: список из M2M и "сейчас скаутится" по pending-экшену ---
-            scouts = list(user.scouts_districts)  # lazy="selectin" подтянет внутри сессии
+            scouts = list(user.scouts_districts)  # профиль profile_screen
             scouts_view = [f"{d.name}" for d in scouts]
 
             current_scout_stmt = (
                 select(Action)
+                .options(*load_profile("action_district"))
                 .where(
                     Action.owner_id == user.id,
                     Action.status == ActionStatus.PENDING,
@@ -5,9 +5,9 @@ from typing import List, Optional
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 from config import load_config
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import User, District, ActionStatus, ActionType, Action, Politician
 from keyboards.spec import KeyboardSpec, KeyboardParams
 from .base import BaseScreen
@@ -60,7 +60,7 @@ class DistrictActionList(BaseScreen):
             rows: List[District] = (
                 await session.execute(
                     select(District)
-                    .options(selectinload(District.owner))       # если хочешь показывать владельца
+                    .options(*load_profile("district_owner"))
                     .order_by(District.id)        # сортировка по имени/ид
                 )
             ).scalars().all()
@@ -168,12 +168,7 @@ class SettingsActionScreen(BaseScreen):
 
                 query = (
                     select(Action)
-                    .options(
-                        selectinload(Action.support_actions),
-                        selectinload(Action.parent_action),
-                        selectinload(Action.owner),
-                        selectinload(Action.district),
-                    )
+                    .options(*load_profile("action_card"))
                     .where(Action.owner_id == user.id)
                     .order_by(Action.updated_at.desc(), Action.id.desc())
                 )
@@ -256,17 +251,15 @@ class SettingsActionScreen(BaseScreen):
 
                 action_obj = actions_list[idx]
             else:
-                # Одиночный режим — достаём по id при необходимости
-                if not action_obj and action_id:
+                # Одиночный режим — достаём по id; переданный объект (из другой сессии, без связей)
+                # перечитываем с профилем карточки
+                if action_obj is not None:
+                    action_id = action_obj.id
+                if action_id:
                     action_obj = (
                         await session.execute(
                             select(Action)
-                            .options(
-                                selectinload(Action.support_actions),
-                                selectinload(Action.parent_action),
-                                selectinload(Action.owner),
-                                selectinload(Action.district),
-                            )
+                            .options(*load_profile("action_card"))
                             .where(Action.id == action_id)
                         )
                     ).scalars().first()
@@ -0,0 +1,137 @@
+# screens/templates.py
+"""
+Реестр шаблонов экранов.
+
+Экран ищет шаблон templates/<loc>/<snake_name>[.j2|.txt.j2], где snake_name —
+camel_to_snake(имя класса). Имя резолвится один раз и запоминается вместе
+со скомпилированным шаблоном; при старте бота preload_screen_templates() делает
+это для всех экранов и падает, если у какого-то экрана нет шаблона.
+
+- TEMPLATES_AUTO_RELOAD=1 — проверять изменения файлов при каждом рендере (для разработки);
+  по умолчанию выключено: шаблоны меняются только вместе с деплоем.
+- TEMPLATES_BYTECODE_CACHE=1 (по умолчанию) — байткод шаблонов кэшируется на диске
+  (TEMPLATES_CACHE_DIR, по умолчанию во временном каталоге), первый рендер после
+  перезапуска не компилирует шаблоны заново.
+"""
+import importlib
+import logging
+import os
+import pkgutil
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, TemplateNotFound
+
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "0").lower() in ("1", "true", "yes")
+TEMPLATES_BYTECODE_CACHE = os.getenv("TEMPLATES_BYTECODE_CACHE", "1").lower() in ("1", "true", "yes")
+TEMPLATES_CACHE_DIR = os.getenv("TEMPLATES_CACHE_DIR") or None
+
+
+def camel_to_snake(name: str) -> str:
+    out = []
+    for i, ch in enumerate(name):
+        if ch.isupper() and i and (not name[i - 1].isupper()):
+            out.append("_")
+        out.append(ch.lower())
+    return "".join(out)
+
+
+def template_candidates(screen_cls: type) -> List[str]:
+    class_snake = camel_to_snake(screen_cls.__name__)
+    return [class_snake, f"{class_snake}.j2", f"{class_snake}.txt.j2"]
+
+
+class TemplateRegistry:
+    def __init__(
+        self,
+        template_root: str,
+        *,
+        auto_reload: bool = TEMPLATES_AUTO_RELOAD,
+        bytecode_cache: bool = TEMPLATES_BYTECODE_CACHE,
+        cache_dir: Optional[str] = TEMPLATES_CACHE_DIR,
+    ):
+        self.template_root = template_root
+        self.auto_reload = auto_reload
+        self._bcc = None
+        if bytecode_cache:
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._bcc = FileSystemBytecodeCache(cache_dir)
+        self._envs: Dict[str, Environment] = {}
+        # (имя класса экрана, loc) → (имя файла шаблона, скомпилированный шаблон)
+        self._resolved: Dict[Tuple[str, str], Tuple[str, Template]] = {}
+
+    def env(self, localization: str) -> Environment:
+        env = self._envs.get(localization)
+        if env is None:
+            env = Environment(
+                loader=FileSystemLoader(os.path.join(self.template_root, localization)),
+                autoescape=False,
+                auto_reload=self.auto_reload,
+                bytecode_cache=self._bcc,
+            )
+            self._envs[localization] = env
+        return env
+
+    def get(self, screen_cls: type, localization: str) -> Template:
+        """Шаблон экрана; FileNotFoundError, если его нет."""
+        key = (screen_cls.__name__, localization)
+        hit = self._resolved.get(key)
+        if hit is not None:
+            name, template = hit
+            # с auto_reload отдаём через окружение — оно само проверит, не изменился ли файл
+            return self.env(localization).get_template(name) if self.auto_reload else template
+
+        env = self.env(localization)
+        candidates = template_candidates(screen_cls)
+        for name in candidates:
+            try:
+                template = env.get_template(name)
+            except TemplateNotFound:
+                continue
+            self._resolved[key] = (name, template)
+            return template
+        raise FileNotFoundError(
+            f"Template not found for {screen_cls.__name__} "
+            f"in {self.template_root}/{localization}/ among {candidates}"
+        )
+
+
+def load_all_screens() -> None:
+    """Импортирует все модули пакета screens, чтобы были видны все классы экранов."""
+    package = importlib.import_module("screens")
+    for m in pkgutil.walk_packages(package.__path__, package.__name__ + "."):
+        importlib.import_module(m.name)
+
+
+def _all_subclasses(cls: type) -> Iterable[type]:
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _all_subclasses(sub)
+
+
+def preload_screen_templates(localization: Optional[str] = None) -> int:
+    """
+    Компилирует шаблоны всех экранов заранее (вызывать при старте бота).
+    Если у экрана, рендерящего шаблон, его нет — RuntimeError со списком экранов.
+    """
+    from screens.base import BaseScreen, _config, get_template_registry
+
+    load_all_screens()
+    loc = localization or _config.default_localization
+    registry = get_template_registry()
+    missing: List[str] = []
+    screens: List[Type] = []
+    for cls in dict.fromkeys(_all_subclasses(BaseScreen)):
+        if not cls.template_required:
+            continue
+        screens.append(cls)
+        try:
+            registry.get(cls, loc)
+        except FileNotFoundError:
+            missing.append(f"{cls.__module__}.{cls.__name__} ({' | '.join(template_candidates(cls))})")
+    if missing:
+        raise RuntimeError(
+            f"Нет шаблонов в {registry.template_root}/{loc}/ для экранов: " + "; ".join(missing)
+        )
+    logging.info("Screen templates: загружено %d (%s, auto_reload=%s)", len(screens), loc, registry.auto_reload)
+    return len(screens)
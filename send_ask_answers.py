@@ -6,7 +6,6 @@ from sqlalchemy import select, update
 from db.models import User, Action, ActionStatus
 from datetime import datetime, timezone
 import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
 from sqlalchemy import select
@@ -15,6 +14,7 @@ from sqlalchemy.orm import sessionmaker
 
 from db.models import User
 from services.notify import notify_user
+from utils.sheets import OUTBOX_KEY_COLUMN, ensure_header as ensure_sheet_header, get_client, get_worksheet
 
 load_dotenv()
 
@@ -22,7 +22,6 @@ load_dotenv()
 SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 SA_PATH = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./game.db")
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
 # ====== logging ======
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
@@ -47,18 +46,13 @@ def truthy(x) -> bool:
     return s in {"true", "1", "yes", "y", "да"}
 
 
-def get_ws(gc: gspread.Client, spreadsheet_id: str, title: str) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
-    return sh.worksheet(title)
+def get_ws(spreadsheet_id: str, title: str) -> gspread.Worksheet:
+    return get_worksheet(title, spreadsheet_id=spreadsheet_id)
 
 
 def ensure_header(ws: gspread.Worksheet) -> None:
-    row = ws.row_values(1)
-    if row != HEADER:
-        if row:
-            ws.update("A1", [HEADER])
-        else:
-            ws.append_row(HEADER)
+    # в этот лист пишет и outbox бота — его служебная колонка outbox_key допустима
+    ensure_sheet_header(ws, HEADER, allow_extra=(OUTBOX_KEY_COLUMN,))
 
 
 def idx(header: list[str], name: str) -> int:
@@ -71,9 +65,8 @@ def idx(header: list[str], name: str) -> int:
 # ====== core ======
 async def send_ready_answers():
     # 1) Sheets
-    creds = Credentials.from_service_account_file(SA_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
-    ws = get_ws(gc, SPREADSHEET_ID, SHEET_NAME)
+    get_client(SA_PATH)
+    ws = get_ws(SPREADSHEET_ID, SHEET_NAME)
     ensure_header(ws)
 
     values = ws.get_all_values()
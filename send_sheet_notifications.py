@@ -4,7 +4,6 @@ import logging
 import os
 
 import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
 from sqlalchemy import select
@@ -13,6 +12,7 @@ from sqlalchemy.orm import sessionmaker
 
 from db.models import User
 from services.notify import notify_user
+from utils.sheets import ensure_header as ensure_sheet_header, get_client, get_worksheet
 
 load_dotenv()
 
@@ -20,7 +20,6 @@ load_dotenv()
 SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 SA_PATH = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./game.db")
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
 # ===== logging =====
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
@@ -43,17 +42,11 @@ def truthy(x) -> bool:
     s = str(x).strip().lower()
     return s in {"true", "1", "yes", "y", "да"}
 
-def get_ws(gc: gspread.Client, spreadsheet_id: str, title: str) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
-    return sh.worksheet(title)
+def get_ws(spreadsheet_id: str, title: str) -> gspread.Worksheet:
+    return get_worksheet(title, spreadsheet_id=spreadsheet_id)
 
 def ensure_header(ws: gspread.Worksheet) -> None:
-    row = ws.row_values(1)
-    if row != HEADER:
-        if row:
-            ws.update("A1", [HEADER])
-        else:
-            ws.append_row(HEADER)
+    ensure_sheet_header(ws, HEADER)
 
 def idx(header: list[str], name: str) -> int:
     try:
@@ -64,9 +57,8 @@ def idx(header: list[str], name: str) -> int:
 # ===== core =====
 async def send_sheet_notifications() -> None:
     # 1) Sheets
-    creds = Credentials.from_service_account_file(SA_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
-    ws = get_ws(gc, SPREADSHEET_ID, SHEET_NAME)
+    get_client(SA_PATH)
+    ws = get_ws(SPREADSHEET_ID, SHEET_NAME)
     ensure_header(ws)
 
     values = ws.get_all_values()
@@ -0,0 +1,368 @@
+# services/combat.py
+"""
+Чистый (без БД, бота и файлов) резолв боёв игрового цикла.
+
+На вход — снимок районов, игроков и pending-действий attack/defend + CombatRates,
+на выход — CombatResult: смены владельцев, остаток обороны, новые control_points,
+закрытые действия, новости, уведомления и RAW-протоколы боёв.
+Загрузка снимка и сохранение результата — в commands.py.
+"""
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен — есть чистый Python-фолбэк
+    np = None
+
+log = logging.getLogger("game_cycle")
+
+ATTACK_KIND = "attack"
+DEFENSE_KIND = "defend"
+
+RESOURCE_FIELDS = ("force", "money", "influence", "information")
+# меньше этого numpy не окупает накладные расходы на создание массивов
+NUMPY_MIN_BATCH = 64
+
+
+@dataclass(frozen=True)
+class CombatRates:
+    attack: Dict[str, float]
+    defense: Dict[str, float]
+    on_point_bonus: int = 20
+
+    @staticmethod
+    def load(path: str) -> "CombatRates":
+        p = Path(path)
+        if not p.exists():
+            raise FileNotFoundError(f"Combat rates file not found: {p}")
+        data = json.loads(p.read_text(encoding="utf-8"))
+        log.info("Загружены курсы конверсии из %s", p)
+        log.debug("Курсы атаки: %s", data.get("attack"))
+        log.debug("Курсы обороны: %s", data.get("defense"))
+        return CombatRates(
+            attack=data.get("attack", {}),
+            defense=data.get("defense", {}),
+            on_point_bonus=int(data.get("on_point_bonus", 20)),
+        )
+
+
+def resources_to_points(kind: str, action, rates: CombatRates) -> int:
+    """Конвертирует ресурсы экшена в очки (учёт on_point)."""
+    table = rates.attack if kind == ATTACK_KIND else rates.defense
+    force_w = float(table.get("force", 0))
+    money_w = float(table.get("money", 0))
+    infl_w = float(table.get("influence", 0))
+    info_w = float(table.get("information", 0))
+
+    pts = (
+        max(0, int(action.force)) * force_w
+        + max(0, int(action.money)) * money_w
+        + max(0, int(action.influence)) * infl_w
+        + max(0, int(action.information)) * info_w
+    )
+    pts = int(round(pts))
+    if action.on_point:
+        pts += rates.on_point_bonus
+    return max(0, pts)
+
+
+def _weights(kind: str, rates: CombatRates) -> tuple[float, ...]:
+    table = rates.attack if kind == ATTACK_KIND else rates.defense
+    return tuple(float(table.get(f, 0)) for f in RESOURCE_FIELDS)
+
+
+def score_actions(kind: str, actions: Sequence, rates: CombatRates) -> List[int]:
+    """
+    Пакетный resources_to_points: очки для всех actions одного вида за один проход.
+    С numpy — векторно по массиву (N, 4), без него — циклом с заранее посчитанными весами.
+    Округление то же (round half to even), результат совпадает с resources_to_points.
+    """
+    if not actions:
+        return []
+    force_w, money_w, infl_w, info_w = _weights(kind, rates)
+    bonus = int(rates.on_point_bonus)
+
+    if np is not None and len(actions) >= NUMPY_MIN_BATCH:
+        res = np.array(
+            [(a.force, a.money, a.influence, a.information) for a in actions], dtype=np.int64
+        )
+        res = np.maximum(res, 0).astype(np.float64)
+        # поэлементно и в том же порядке, что и resources_to_points — без расхождений во float
+        pts = res[:, 0] * force_w + res[:, 1] * money_w + res[:, 2] * infl_w + res[:, 3] * info_w
+        pts = np.rint(pts).astype(np.int64)
+        pts += np.fromiter((bool(a.on_point) for a in actions), dtype=np.bool_, count=len(actions)) * bonus
+        return np.maximum(pts, 0).tolist()
+
+    out: List[int] = []
+    for a in actions:
+        pts = int(round(
+            max(0, int(a.force)) * force_w
+            + max(0, int(a.money)) * money_w
+            + max(0, int(a.influence)) * infl_w
+            + max(0, int(a.information)) * info_w
+        ))
+        if a.on_point:
+            pts += bonus
+        out.append(max(0, pts))
+    return out
+
+
+# ===========================
+#         Снимок
+# ===========================
+@dataclass(frozen=True)
+class PlayerSnapshot:
+    id: int
+    tg_id: Optional[int]
+    name: str
+    faction: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DistrictSnapshot:
+    id: int
+    name: str
+    owner_id: int
+    control_points: int
+
+
+@dataclass(frozen=True)
+class ActionSnapshot:
+    id: int
+    kind: str
+    owner_id: int
+    district_id: int
+    force: int = 0
+    money: int = 0
+    influence: int = 0
+    information: int = 0
+    on_point: bool = False
+
+
+@dataclass
+class CombatSnapshot:
+    districts: Dict[int, DistrictSnapshot]
+    players: Dict[int, PlayerSnapshot]
+    defenses: List[ActionSnapshot]  # в порядке применения (по id)
+    attacks: List[ActionSnapshot]   # в порядке применения (по created_at)
+
+
+# ===========================
+#         Результат
+# ===========================
+@dataclass(frozen=True)
+class CombatNews:
+    title: str
+    body: str
+    action_id: Optional[int] = None
+    district_id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class CombatNotice:
+    user_id: int
+    tg_id: Optional[int]
+    title: str
+    body: str
+
+
+@dataclass(frozen=True)
+class OwnershipChange:
+    district_id: int
+    old_owner_id: int
+    new_owner_id: int
+    action_id: int
+
+
+@dataclass
+class CombatResult:
+    defense_pool: Dict[int, int] = field(default_factory=dict)        # оборона до атак
+    remaining_defense: Dict[int, int] = field(default_factory=dict)   # оборона после атак
+    control_points: Dict[int, int] = field(default_factory=dict)      # новые CP (только изменённые)
+    owners: Dict[int, int] = field(default_factory=dict)              # новые владельцы (только изменённые)
+    ownership_changes: List[OwnershipChange] = field(default_factory=list)
+    closed_action_ids: List[int] = field(default_factory=list)
+    news: List[CombatNews] = field(default_factory=list)
+    notices: List[CombatNotice] = field(default_factory=list)
+    raw_rows: List[str] = field(default_factory=list)                 # RAW-протоколы захватов
+
+
+def _notice(player: PlayerSnapshot, title: str, body: str) -> CombatNotice:
+    return CombatNotice(user_id=player.id, tg_id=player.tg_id, title=title, body=body)
+
+
+# ===========================
+#           Резолв
+# ===========================
+def resolve_combat(snapshot: CombatSnapshot, rates: CombatRates, contested: Iterable[int]) -> CombatResult:
+    """
+    Оборона → атаки → остаток обороны в CP, целиком в памяти.
+    Спорные районы пропускаются: их CP не трогаются, действия остаются PENDING.
+    """
+    contested_set = set(contested)
+    result = CombatResult()
+    owners: Dict[int, int] = {did: d.owner_id for did, d in snapshot.districts.items()}
+    cp: Dict[int, int] = {did: int(d.control_points) for did, d in snapshot.districts.items()}
+
+    points: Dict[int, int] = dict(zip(
+        (a.id for a in snapshot.defenses), score_actions(DEFENSE_KIND, snapshot.defenses, rates)
+    ))
+    points.update(zip(
+        (a.id for a in snapshot.attacks), score_actions(ATTACK_KIND, snapshot.attacks, rates)
+    ))
+
+    # --- 1) Стартовая оборона из control_points + pending defense ---
+    defense_pool: Dict[int, int] = defaultdict(int)
+    for did, d in snapshot.districts.items():
+        if did in contested_set:
+            continue
+        if d.control_points > 0:
+            defense_pool[did] += int(d.control_points)
+            cp[did] = 0
+
+    for a in snapshot.defenses:
+        did = a.district_id
+        if did is None or did in contested_set:
+            continue
+        pts = points[a.id]
+        defense_pool[did] += pts
+        result.closed_action_ids.append(a.id)
+        log.debug("DEF@%s: +%d очков (action #%s)", did, pts, a.id)
+
+        d = snapshot.districts.get(did)
+        owner = snapshot.players.get(d.owner_id) if d else None
+        defender = snapshot.players.get(a.owner_id)
+        if d and owner and owner.tg_id and defender:
+            result.notices.append(_notice(
+                owner,
+                "🛡️ Район усилен защитой",
+                f"Ваш район <b>{d.name}</b> защищён игроком <b>{defender.name}</b> "
+                f"на <b>{pts}</b> очков контроля.",
+            ))
+
+    result.defense_pool = dict(defense_pool)
+
+    # --- 2) Атаки по районам (в порядке первой атаки на район) ---
+    by_district: Dict[int, List[ActionSnapshot]] = defaultdict(list)
+    for a in snapshot.attacks:
+        if a.district_id:
+            by_district[a.district_id].append(a)
+
+    for district_id, attack_list in by_district.items():
+        if district_id in contested_set:
+            log.info("Район %s спорный — атаки пропущены (%d шт.)", district_id, len(attack_list))
+            continue
+
+        d = snapshot.districts.get(district_id)
+        if not d:
+            log.warning("Не найден район %s — пропущено %d атак", district_id, len(attack_list))
+            result.closed_action_ids.extend(a.id for a in attack_list)
+            continue
+
+        current_def = int(defense_pool.get(district_id, 0))
+        log.info("Район '%s' стартовая оборона: %d", d.name, current_def)
+
+        for a in attack_list:
+            power_pts = points[a.id]
+            attacker = snapshot.players.get(a.owner_id)
+            attacker_name = attacker.name if attacker else "Неизвестный"
+            attacker_faction = (attacker.faction or "без фракции") if attacker else "неизвестно"
+
+            defender = snapshot.players.get(owners[district_id])
+            defender_name = defender.name if defender else "—"
+            def_before = current_def
+            log.debug("ATK@%s by %s: %d pts vs def %d", district_id, attacker_name, power_pts, current_def)
+
+            if power_pts <= current_def:
+                current_def -= power_pts
+                result.news.append(CombatNews(
+                    title=f"Отражена атака на район '{d.name}'",
+                    body=(
+                        f"Атака игрока {attacker_name} ({power_pts} очков) была отражена. "
+                        f"Фракция атакующего: {attacker_faction}. "
+                        f"Текущая оборона района: {current_def}."
+                    ),
+                    action_id=a.id,
+                    district_id=district_id,
+                ))
+                if attacker and defender:
+                    result.notices.append(_notice(
+                        attacker,
+                        "❌ Атака отражена",
+                        f"Район <b>{d.name}</b> не взят. "
+                        f"Ваши очки: <b>{power_pts}</b>. "
+                        f"Оставшаяся оборона района: <b>{current_def}</b>.",
+                    ))
+                    result.notices.append(_notice(
+                        defender,
+                        "🛡️ Атака отражена",
+                        f"Ваш район <b>{d.name}</b> отбил атаку ({power_pts} очков). "
+                        f"Текущая оборона: <b>{current_def}</b>.",
+                    ))
+            else:
+                overflow = power_pts - current_def
+                result.ownership_changes.append(OwnershipChange(
+                    district_id=district_id,
+                    old_owner_id=owners[district_id],
+                    new_owner_id=a.owner_id,
+                    action_id=a.id,
+                ))
+                owners[district_id] = a.owner_id
+                current_def = overflow
+
+                result.news.append(CombatNews(
+                    title=f"Район '{d.name}' захвачен!",
+                    body=(
+                        f"Атака игрока {attacker_name} ({power_pts} очков) прорвала оборону района. "
+                        f"Фракция захватившего: {attacker_faction}. "
+                        f"Новый владелец — {attacker_name}. Остаток {overflow} очков укрепил оборону района."
+                    ),
+                    action_id=a.id,
+                    district_id=district_id,
+                ))
+                if attacker and defender:
+                    result.notices.append(_notice(
+                        attacker,
+                        "✅ Район захвачен",
+                        f"Вы захватили район <b>{d.name}</b>! "
+                        f"Прорыв силой <b>{power_pts}</b>. "
+                        f"Остаток <b>{overflow}</b> стал обороной района.",
+                    ))
+                    result.notices.append(_notice(
+                        defender,
+                        "⚠️ Потеря района",
+                        "Ваш район <b>{}</b> был атакован {} и утерян.".format(d.name, attacker_name),
+                    ))
+                result.raw_rows.append(
+                    f'Бой за район "{d.name}". '
+                    f'Нападающий: "{attacker_name}". '
+                    f'Оборонявшийся: "{defender_name}". '
+                    f'Победил: "{attacker_name}". '
+                    f'Силы: атака {power_pts} против обороны {def_before}. '
+                    f'Остаток {overflow} пошёл в оборону района.'
+                )
+            result.closed_action_ids.append(a.id)
+
+        defense_pool[district_id] = current_def
+        log.info("Район '%s' остаточная оборона после атак: %d", d.name, current_def)
+
+    result.remaining_defense = dict(defense_pool)
+
+    # --- 3) Остаток обороны → control_points ---
+    for district_id, remaining_def in defense_pool.items():
+        if remaining_def <= 0 or district_id in contested_set or district_id not in cp:
+            continue
+        cp[district_id] += int(remaining_def)
+
+    for did, d in snapshot.districts.items():
+        if cp[did] != d.control_points:
+            result.control_points[did] = cp[did]
+        if owners[did] != d.owner_id:
+            result.owners[did] = owners[did]
+
+    return result
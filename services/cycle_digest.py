@@ -0,0 +1,159 @@
+# services/cycle_digest.py
+"""
+Сводка уведомлений за игровой цикл.
+
+Шаги цикла не шлют сообщения сами, а складывают записи в CycleDigest по tg_id.
+В конце цикла каждому игроку уходит одно сводное сообщение (или несколько частей,
+если не влезает в лимит Telegram). Рассылка ставится в общую очередь доставки
+(services.delivery) с массовым приоритетом — лимиты Telegram соблюдает она.
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+
+from services.delivery import PRIORITY_BULK
+from services.notify import notify_user
+
+log = logging.getLogger("game_cycle")
+
+# Лимит Telegram — 4096 символов после разбора разметки; оставляем запас под заголовок и HTML-теги
+DIGEST_CHUNK_LIMIT = 3500
+DIGEST_TITLE = "🗓 Итоги игрового цикла"
+
+# тег, сущность (&amp; / &#39;) или кусок текста — резать строку можно только между ними
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|[^<&]+|[<&]")
+_TAG_NAME = re.compile(r"</?\s*(\w+)")
+
+
+@dataclass(frozen=True)
+class DigestEntry:
+    title: str
+    body: str
+
+    def render(self) -> str:
+        return f"<b>{self.title}</b>\n{self.body.strip()}"
+
+
+def _truncate_html(text: str, limit: int) -> str:
+    """
+    Обрезает строку с HTML-разметкой до limit символов (с «…»): не режет теги и сущности
+    и закрывает открытые теги — иначе Telegram отклонит всё сообщение (parse_mode=HTML).
+    """
+    if len(text) <= limit:
+        return text
+    out: List[str] = []
+    open_tags: List[str] = []
+    size = 0
+    for m in _HTML_TOKEN.finditer(text):
+        tok = m.group()
+        room = limit - 1 - size - sum(len(t) + 3 for t in open_tags)  # 1 — под «…», + закрывающие теги
+        name = _TAG_NAME.match(tok) if tok.startswith("<") and len(tok) > 1 else None
+        if name is None:
+            if len(tok) > room:
+                # текст режем посимвольно, сущность или одиночный символ — целиком или никак
+                if not tok.startswith("&") and room > 0:
+                    out.append(tok[:room])
+                break
+        elif tok.startswith("</"):
+            if open_tags and open_tags[-1] == name.group(1).lower():
+                open_tags.pop()
+        else:
+            if len(tok) + len(name.group(1)) + 3 > room:
+                break
+            open_tags.append(name.group(1).lower())
+        out.append(tok)
+        size += len(tok)
+    return "".join(out) + "…" + "".join(f"</{t}>" for t in reversed(open_tags))
+
+
+def _pack(blocks: List[str], limit: int, sep: str) -> List[str]:
+    """Жадно склеивает блоки через sep в куски не длиннее limit."""
+    chunks: List[str] = []
+    cur = ""
+    for block in blocks:
+        candidate = f"{cur}{sep}{block}" if cur else block
+        if len(candidate) <= limit:
+            cur = candidate
+            continue
+        if cur:
+            chunks.append(cur)
+        cur = block
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+class CycleDigest:
+    """Копит уведомления цикла по tg_id и рассылает по одному сводному сообщению на игрока."""
+
+    def __init__(self, title: str = DIGEST_TITLE, chunk_limit: int = DIGEST_CHUNK_LIMIT):
+        self.title = title
+        self.chunk_limit = chunk_limit
+        self._entries: Dict[int, List[DigestEntry]] = {}
+
+    def __len__(self) -> int:
+        """Количество получателей."""
+        return len(self._entries)
+
+    @property
+    def entries_count(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def add(self, tg_id: Optional[int], title: str, body: str) -> None:
+        if not tg_id:
+            return
+        self._entries.setdefault(int(tg_id), []).append(DigestEntry(title=title, body=body))
+
+    def mark(self) -> Dict[int, int]:
+        return {tg_id: len(entries) for tg_id, entries in self._entries.items()}
+
+    def rollback_to(self, mark: Dict[int, int]) -> None:
+        """Отбрасывает уведомления, добавленные после mark (шаг откатился)."""
+        for tg_id in list(self._entries):
+            if tg_id in mark:
+                del self._entries[tg_id][mark[tg_id]:]
+            else:
+                del self._entries[tg_id]
+
+    def render(self, tg_id: int) -> List[str]:
+        """Тело сводки для игрока, разбитое на части не длиннее chunk_limit."""
+        limit = self.chunk_limit
+        blocks: List[str] = []
+        for entry in self._entries.get(tg_id, []):
+            text = entry.render()
+            if len(text) <= limit:
+                blocks.append(text)
+                continue
+            # слишком длинная запись (например, много районов) — режем по строкам
+            lines = [_truncate_html(ln, limit) for ln in text.split("\n")]
+            blocks.extend(_pack(lines, limit, "\n"))
+        return _pack(blocks, limit, "\n\n")
+
+    async def send(self, bot: Bot) -> int:
+        """
+        Рассылает сводки всем получателям. Части одной сводки уходят по порядку,
+        разные игроки — параллельно. Возвращает число отправленных сообщений
+        (неудачные отправки не считаются).
+        """
+        sent = 0
+
+        async def _send_one(tg_id: int) -> None:
+            nonlocal sent
+            chunks = self.render(tg_id)
+            for i, body in enumerate(chunks, start=1):
+                title = self.title if len(chunks) == 1 else f"{self.title} ({i}/{len(chunks)})"
+                ok = await notify_user(
+                    bot, tg_id, title=title, body=body,
+                    persist_key=f"digest:{tg_id}", priority=PRIORITY_BULK,
+                )
+                if ok:
+                    sent += 1
+                else:
+                    log.warning("Не удалось отправить сводку цикла (tg_id=%s, часть %d/%d)", tg_id, i, len(chunks))
+
+        await asyncio.gather(*(_send_one(tg_id) for tg_id in self._entries))
+        return sent
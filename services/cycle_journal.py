@@ -0,0 +1,217 @@
+# services/cycle_journal.py
+"""
+Журнал игрового цикла и замок от параллельного запуска.
+
+run_game_cycle() (CYCLE_TX_MODE=steps) коммитит после каждого шага, поэтому упавший
+на шаге 5 цикл оставляет шаги A–4.5 применёнными. Журнал (таблицы game_cycles / game_cycle_steps)
+помнит, какие шаги завершены и что они вернули (например, список спорных районов),
+и повторный запуск продолжает с первого невыполненного шага, а не начисляет ресурсы
+второй раз. Запись шага в журнале фиксируется тем же COMMIT, что и его изменения:
+между ними нет окна, в котором шаг применён, а в журнале не отмечен.
+
+- CYCLE_RESUME=0 — не продолжать незавершённый цикл, а начать новый (старый помечается abandoned);
+- CYCLE_LOCK_TTL (сек, по умолчанию 15 мин) — через сколько непродлённый замок считается протухшим.
+  Замок продлевается после каждого шага, так что TTL должен быть больше самого долгого шага.
+  Замок процесса, которого уже нет на этом хосте (kill -9, OOM), забирается сразу, без ожидания TTL.
+
+Новости и сводка закоммиченных шагов упавшего запуска уже записаны/разосланы (это делается
+в finally цикла), поэтому пропущенные шаги их не дублируют; новости откаченного шага отбрасываются.
+
+В режимах CYCLE_TX_MODE=savepoint/single шаги и их записи в журнале коммитятся одной
+транзакцией: упавший цикл откатывается целиком, и повторный запуск проходит все шаги заново.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import CycleLock, CycleRun, CycleRunStatus, CycleStep, now_utc
+
+log = logging.getLogger("game_cycle")
+
+CYCLE_RESUME = os.getenv("CYCLE_RESUME", "1").lower() in ("1", "true", "yes")
+CYCLE_LOCK_TTL = float(os.getenv("CYCLE_LOCK_TTL", str(15 * 60)))
+
+_LOCK_ID = 1
+
+
+class CycleLockedError(RuntimeError):
+    """Другой процесс уже выполняет игровой цикл."""
+
+
+# ===========================
+#          Замок
+# ===========================
+def _holder_is_dead(holder: str) -> bool:
+    """Держатель замка ("host:pid:время") — процесс на этом же хосте, которого уже нет."""
+    try:
+        host, pid, _ = holder.split(":", 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:  # PermissionError — процесс есть, но чужой
+        return False
+    return False
+
+
+async def acquire_cycle_lock(session: AsyncSession, *, ttl: float = CYCLE_LOCK_TTL) -> str:
+    """Берёт замок цикла; CycleLockedError, если он занят живым процессом. Возвращает holder."""
+    holder = f"{socket.gethostname()}:{os.getpid()}:{now_utc().isoformat()}"
+    session.add(CycleLock(id=_LOCK_ID, holder=holder))
+    try:
+        await session.commit()
+        return holder
+    except IntegrityError:
+        await session.rollback()
+
+    # замок занят: забираем только замок мёртвого процесса или протухший — одним условным UPDATE, без гонки
+    current = (await session.execute(
+        select(CycleLock.holder, CycleLock.acquired_at).where(CycleLock.id == _LOCK_ID)
+    )).first()
+    stale = CycleLock.acquired_at < now_utc() - timedelta(seconds=ttl)
+    dead = current is not None and _holder_is_dead(current.holder)
+    res = await session.execute(
+        update(CycleLock)
+        .where(CycleLock.id == _LOCK_ID, or_(CycleLock.holder == current.holder, stale) if dead else stale)
+        .values(holder=holder, acquired_at=now_utc())
+    )
+    if res.rowcount:
+        await session.commit()
+        if dead:
+            log.warning("Процесс-держатель замка цикла (%s) не найден — замок забран.", current.holder)
+        else:
+            log.warning("Замок цикла был протухшим (старше %ds) — забран.", int(ttl))
+        return holder
+    await session.rollback()
+    raise CycleLockedError(
+        f"Игровой цикл уже выполняется: {current.holder if current else '?'} "
+        f"с {current.acquired_at if current else '?'}"
+    )
+
+
+async def renew_cycle_lock(session: AsyncSession, holder: str) -> None:
+    """
+    Продлевает замок (в транзакции шага). CycleLockedError, если замок уже забрал другой
+    процесс (шаг шёл дольше CYCLE_LOCK_TTL) — тогда шаг откатывается, а не выполняется дважды.
+    """
+    res = await session.execute(
+        update(CycleLock)
+        .where(CycleLock.id == _LOCK_ID, CycleLock.holder == holder)
+        .values(acquired_at=now_utc())
+    )
+    if not res.rowcount:
+        raise CycleLockedError(f"Замок цикла {holder} перехвачен другим процессом")
+
+
+async def release_cycle_lock(session: AsyncSession, holder: str) -> None:
+    try:
+        await session.rollback()  # на случай, если сессия осталась в упавшей транзакции
+        await session.execute(delete(CycleLock).where(CycleLock.id == _LOCK_ID, CycleLock.holder == holder))
+        await session.commit()
+    except Exception:
+        log.exception("Не удалось снять замок цикла — снимется сам через CYCLE_LOCK_TTL")
+
+
+# ===========================
+#          Журнал
+# ===========================
+class CycleJournal:
+    def __init__(self, run: CycleRun, done: Dict[str, Optional[dict]], *, resumed: bool):
+        self.run = run
+        self.resumed = resumed
+        self._done = done
+
+    @property
+    def cycle_id(self) -> int:
+        return self.run.id
+
+    @property
+    def completed_steps(self) -> List[str]:
+        return list(self._done)
+
+    @classmethod
+    async def open(cls, session: AsyncSession, cycle_ts: str, *, resume: bool = CYCLE_RESUME) -> "CycleJournal":
+        """Продолжает последний незавершённый цикл (если resume) или заводит новый."""
+        unfinished = (await session.execute(
+            select(CycleRun)
+            .where(CycleRun.status.in_([CycleRunStatus.RUNNING, CycleRunStatus.FAILED]))
+            .order_by(CycleRun.id.desc())
+            .limit(1)
+        )).scalars().first()
+
+        if unfinished is not None and resume:
+            rows = (await session.execute(
+                select(CycleStep.step, CycleStep.output)
+                .where(CycleStep.cycle_id == unfinished.id)
+                .order_by(CycleStep.finished_at)
+            )).all()
+            unfinished.status = CycleRunStatus.RUNNING
+            unfinished.attempts += 1
+            unfinished.last_error = None
+            await session.commit()
+            done = {step: output for step, output in rows}
+            log.warning(
+                "Продолжаем незавершённый цикл %s (id=%d, попытка %d); уже выполнены шаги: %s",
+                unfinished.cycle_ts, unfinished.id, unfinished.attempts, ", ".join(done) or "—",
+            )
+            return cls(unfinished, done, resumed=True)
+
+        if unfinished is not None:
+            await session.execute(
+                update(CycleRun)
+                .where(CycleRun.status.in_([CycleRunStatus.RUNNING, CycleRunStatus.FAILED]))
+                .values(status=CycleRunStatus.ABANDONED, finished_at=now_utc())
+            )
+            log.warning("CYCLE_RESUME=0: незавершённый цикл %s помечен abandoned", unfinished.cycle_ts)
+        run = CycleRun(cycle_ts=cycle_ts)
+        session.add(run)
+        await session.commit()
+        return cls(run, {}, resumed=False)
+
+    def is_done(self, step: str) -> bool:
+        return step in self._done
+
+    def output(self, step: str) -> Optional[dict]:
+        return self._done.get(step)
+
+    async def complete(self, session: AsyncSession, step: str, output: Optional[dict] = None,
+                       *, duration_s: Optional[float] = None) -> None:
+        """
+        Отмечает шаг выполненным. session — та, в которой работал шаг: запись журнала
+        фиксируется (или откатывается) тем же COMMIT, что и изменения шага.
+        """
+        session.add(CycleStep(cycle_id=self.run.id, step=step, output=output, duration_s=duration_s))
+        await self._update_run(session, last_step=step)
+        self._done[step] = output
+
+    async def finish(self, session: AsyncSession) -> None:
+        await self._update_run(session, status=CycleRunStatus.DONE, finished_at=now_utc())
+
+    async def _update_run(self, session: AsyncSession, **values) -> None:
+        # UPDATE, а не правка self.run: run может принадлежать другой сессии (управляющей)
+        await session.execute(update(CycleRun).where(CycleRun.id == self.run.id).values(**values))
+        await session.commit()
+
+    async def fail(self, session: AsyncSession, error: BaseException) -> None:
+        try:
+            await session.rollback()
+            await session.execute(
+                update(CycleRun)
+                .where(CycleRun.id == self.run.id)
+                .values(status=CycleRunStatus.FAILED, last_error=f"{type(error).__name__}: {error}"[:2000])
+            )
+            await session.commit()
+        except Exception:
+            log.exception("Не удалось отметить цикл %s как failed", self.run.cycle_ts)
+
@@ -0,0 +1,187 @@
+# services/cycle_metrics.py
+"""
+Метрики игрового цикла по шагам.
+
+StepTimer (commands.py) открывает шаг в CycleMetrics, а счётчики пополняются:
+- SQL — событиями движка цикла (attach(engine)): число запросов, изменённые строки
+  (rowcount у INSERT/UPDATE/DELETE) и прочитанные строки (SELECT/RETURNING).
+  rows_read — best effort: у SQLAlchemy нет публичного события «строки выбраны», число
+  берётся из буфера async-адаптера курсора (_rows). Если драйвер его не отдаёт, rows_read
+  в отчёте — null (не 0) и в лог уходит предупреждение;
+- шагами — count("notifications") / count("sheets_calls") / count("messages_sent").
+Вложенные шаги учитываются и во внешнем (счётчики включающие).
+
+В конце цикла:
+- JSON-отчёт cycle_metrics_<CYCLE_TS>.json рядом с last_cycle_finished.txt
+  (по файлу на цикл — можно сравнивать недели между собой);
+- CYCLE_METRICS_PROM=<путь> — дополнительно файл в текстовом формате Prometheus
+  (для textfile collector у node_exporter), перезаписывается атомарно.
+"""
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+log = logging.getLogger("game_cycle")
+
+CYCLE_METRICS_PROM = os.getenv("CYCLE_METRICS_PROM") or None
+
+COUNTERS = ("statements", "rows_read", "rows_written", "notifications", "messages_sent", "sheets_calls")
+# описание неточных счётчиков — попадает в JSON-отчёт (schema)
+BEST_EFFORT = {
+    "rows_read": "строки из буфера курсора async-адаптера SQLAlchemy (внутренний атрибут); null — драйвер его не отдаёт",
+}
+
+
+@dataclass
+class StepMetrics:
+    name: str
+    depth: int
+    started_at: float
+    duration_s: float = 0.0
+    ok: bool = True
+    counters: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(COUNTERS, 0))
+
+
+class CycleMetrics:
+    def __init__(self, cycle_ts: str):
+        self.cycle_ts = cycle_ts
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.ok = True
+        self.steps: List[StepMetrics] = []
+        self.totals: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self._open: List[StepMetrics] = []
+        self._engines: List[Any] = []
+        # None — ещё не было SELECT; False — у курсора нет буфера, rows_read не посчитать
+        self.rows_read_available: Optional[bool] = None
+
+    # ----- шаги -----
+    def start_step(self, name: str) -> StepMetrics:
+        step = StepMetrics(name=name, depth=len(self._open), started_at=time.perf_counter())
+        self.steps.append(step)
+        self._open.append(step)
+        return step
+
+    def finish_step(self, step: StepMetrics, *, ok: bool = True) -> None:
+        step.duration_s = round(time.perf_counter() - step.started_at, 4)
+        step.ok = ok
+        if step in self._open:
+            self._open.remove(step)
+
+    def count(self, counter: str, n: int = 1) -> None:
+        if n <= 0:
+            return
+        self.totals[counter] += n
+        for step in self._open:
+            step.counters[counter] += n
+
+    # ----- SQL -----
+    def attach(self, engine) -> None:
+        """Подписывается на события движка (AsyncEngine или Engine)."""
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        self._engines.append(sync_engine)
+
+    def detach(self) -> None:
+        for sync_engine in self._engines:
+            event.remove(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        self._engines.clear()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.count("statements")
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+            rowcount = cursor.rowcount
+            if rowcount is None or rowcount < 0:
+                rowcount = len(parameters) if executemany else 0
+            self.count("rows_written", rowcount)
+        if cursor.description and self.rows_read_available is not False:
+            # async-адаптеры SQLAlchemy (aiosqlite, asyncpg) выбирают результат целиком при execute
+            rows = getattr(cursor, "_rows", None)
+            if rows is None:
+                self.rows_read_available = False
+                log.warning("Метрики цикла: курсор %s без буфера строк — rows_read не считается", type(cursor).__name__)
+            else:
+                self.rows_read_available = True
+                self.count("rows_read", len(rows))
+
+    # ----- отчёт -----
+    def finish(self, *, ok: bool) -> None:
+        self.ok = ok
+        self.finished_at = time.time()
+        for step in list(self._open):
+            self.finish_step(step, ok=False)
+        self.detach()
+
+    def _counters(self, counters: Dict[str, int]) -> Dict[str, Optional[int]]:
+        if self.rows_read_available is False:
+            return {**counters, "rows_read": None}
+        return dict(counters)
+
+    def to_dict(self) -> Dict[str, Any]:
+        steps = []
+        for s in self.steps:
+            item = {k: v for k, v in asdict(s).items() if k != "started_at"}
+            item["counters"] = self._counters(s.counters)
+            steps.append(item)
+        return {
+            "cycle_ts": self.cycle_ts,
+            "ok": self.ok,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_s": round((self.finished_at or time.time()) - self.started_at, 4),
+            "schema": {"best_effort": BEST_EFFORT},
+            "totals": self._counters(self.totals),
+            "steps": steps,
+        }
+
+    def write_json(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def metric(name: str, help_text: str, samples: List[tuple]) -> None:
+            lines.append(f"# HELP game_cycle_{name} {help_text}")
+            lines.append(f"# TYPE game_cycle_{name} gauge")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"game_cycle_{name}{{{label_str}}} {value}" if label_str else f"game_cycle_{name} {value}")
+
+        metric("last_run_timestamp_seconds", "Время окончания последнего цикла (unix).",
+               [({}, round(self.finished_at or time.time(), 3))])
+        metric("last_run_success", "1 — последний цикл завершился без ошибок.", [({}, int(self.ok))])
+        metric("duration_seconds", "Длительность цикла целиком.", [({}, self.to_dict()["duration_s"])])
+        # серия на имя шага: если шаг с тем же именем встретился дважды — суммируем
+        by_name: Dict[str, Dict[str, float]] = {}
+        for s in self.steps:
+            agg = by_name.setdefault(s.name, dict.fromkeys(("duration_s",) + COUNTERS, 0))
+            agg["duration_s"] = round(agg["duration_s"] + s.duration_s, 4)
+            for counter in COUNTERS:
+                agg[counter] += s.counters[counter]
+        metric("step_duration_seconds", "Длительность шага цикла.",
+               [({"step": name}, agg["duration_s"]) for name, agg in by_name.items()])
+        for counter in COUNTERS:
+            if counter == "rows_read" and self.rows_read_available is False:
+                continue  # нет данных — лучше отсутствующая серия, чем нули
+            metric(f"step_{counter}", f"Счётчик {counter} по шагу цикла (включая вложенные шаги).",
+                   [({"step": name}, agg[counter]) for name, agg in by_name.items()])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, path)  # textfile collector не должен увидеть файл наполовину
+        return path
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,283 @@
+# services/delivery.py
+"""
+Общая очередь исходящих сообщений бота.
+
+Все вызовы Bot API на отправку/редактирование идут через deliver():
+- asyncio.PriorityQueue + пул воркеров;
+- token bucket на весь бот и на каждый чат (лимиты Telegram: ~30 msg/s на бота, ~1 msg/s в чат);
+- классы приоритета: интерактивные ответы/правки идут раньше массовых рассылок;
+- TelegramRetryAfter: чат «замораживается» на retry_after, сообщение встаёт обратно в очередь;
+- метрики: глубина очереди, задержка (постановка → отправка) и длительность самого запроса.
+
+Очередь живёт в своём процессе: бот и скрипты (цикл, рассылки) лимитируются каждый отдельно.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+log = logging.getLogger("delivery")
+
+# Приоритеты (меньше — раньше)
+PRIORITY_INTERACTIVE = 0   # ответы и правки экранов на действия пользователя
+PRIORITY_NOTICE = 10       # одиночные push-уведомления
+PRIORITY_BULK = 20         # массовые рассылки (сводка цикла и т.п.)
+
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "8"))
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "28"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_CHAT_BURST = int(os.getenv("DELIVERY_CHAT_BURST", "3"))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))
+
+_LATENCY_WINDOW = 1000
+_MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Token bucket с резервированием «в долг»: reserve() сразу забирает токен и говорит, сколько ждать."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+    async def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class _Job:
+    call: Callable[[], Awaitable[Any]]
+    chat_id: Optional[int]
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    reserved: bool = False
+
+
+def _percentile(values: Deque[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    data = sorted(values)
+    return round(data[min(len(data) - 1, int(q * len(data)))] * 1000, 1)
+
+
+class DeliveryService:
+    def __init__(
+        self,
+        *,
+        workers: int = DELIVERY_WORKERS,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        chat_rate: float = DELIVERY_CHAT_RATE,
+        chat_burst: int = DELIVERY_CHAT_BURST,
+        max_retries: int = DELIVERY_MAX_RETRIES,
+    ):
+        self.workers = max(1, workers)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, burst=max(1, int(global_rate)))
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = count()
+        # метрики
+        self._deferred = 0
+        self._in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latency: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._send_time: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    # ----- жизненный цикл -----
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        # первый вызов или новый event loop (скрипты с asyncio.run) — поднимаем воркеры заново
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        self._deferred = 0
+        self._in_flight = 0
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        log.info("Delivery: запущено воркеров %d", self.workers)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки уже поставленных сообщений и гасит воркеры."""
+        if not self._tasks or self._queue is None:
+            return
+
+        async def _drain() -> None:
+            while True:
+                await self._queue.join()
+                if not self._deferred:  # отложенные (flood control) ещё вернутся в очередь
+                    return
+                await asyncio.sleep(0.05)
+
+        try:
+            await asyncio.wait_for(_drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Delivery: очередь не опустела за %.1fs (осталось %d)", timeout, self._queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        log.info("Delivery: остановлено; %s", self.stats())
+
+    # ----- постановка в очередь -----
+    async def submit(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        *,
+        chat_id: Optional[int] = None,
+        priority: int = PRIORITY_NOTICE,
+    ) -> Any:
+        """Ставит вызов Bot API в очередь и ждёт его результата (исключения пробрасываются вызывающему)."""
+        self._ensure_started()
+        job = _Job(call=call, chat_id=chat_id, future=self._loop.create_future())
+        self._put(priority, next(self._seq), job)
+        return await job.future
+
+    def _put(self, priority: int, seq: int, job: _Job) -> None:
+        self._queue.put_nowait((priority, seq, job))
+
+    def _defer(self, priority: int, seq: int, job: _Job, delay: float) -> None:
+        self._deferred += 1
+
+        def _back() -> None:
+            self._deferred -= 1
+            self._put(priority, seq, job)
+
+        self._loop.call_later(delay, _back)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    # ----- воркер -----
+    async def _worker(self, n: int) -> None:
+        while True:
+            priority, seq, job = await self._queue.get()
+            try:
+                if job.future.done():  # вызывающий уже отменил ожидание
+                    continue
+                if job.chat_id is not None and not job.reserved:
+                    wait = self._chat_bucket(job.chat_id).reserve()
+                    job.reserved = True
+                    # интерактив не задерживаем (токен всё равно списан — подождут рассылки в этот чат)
+                    if wait > 0 and priority > PRIORITY_INTERACTIVE:
+                        self._defer(priority, seq, job, wait)
+                        continue
+                await self._global.acquire()
+                await self._execute(priority, seq, job)
+            except Exception:
+                log.exception("Delivery worker #%d: непредвиденная ошибка", n)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, priority: int, seq: int, job: _Job) -> None:
+        started = time.monotonic()
+        self._in_flight += 1
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            job.attempts += 1
+            self.retried += 1
+            bucket = self._chat_bucket(job.chat_id) if job.chat_id is not None else self._global
+            bucket.block(e.retry_after)
+            if job.attempts > self.max_retries:
+                self.failed += 1
+                job.future.set_exception(e)
+                return
+            log.warning(
+                "Delivery: flood control для chat_id=%s, повтор через %ss (попытка %d)",
+                job.chat_id, e.retry_after, job.attempts,
+            )
+            job.reserved = False
+            self._defer(priority, seq, job, e.retry_after)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            done = time.monotonic()
+            self.sent += 1
+            self._send_time.append(done - started)
+            self._latency.append(done - job.enqueued_at)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._in_flight -= 1
+
+    # ----- метрики -----
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "deferred": self._deferred,
+            "in_flight": self._in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_ms_p50": _percentile(self._latency, 0.50),
+            "latency_ms_p95": _percentile(self._latency, 0.95),
+            "send_ms_p50": _percentile(self._send_time, 0.50),
+            "send_ms_p95": _percentile(self._send_time, 0.95),
+        }
+
+
+_service: Optional[DeliveryService] = None
+
+
+def get_delivery() -> DeliveryService:
+    global _service
+    if _service is None:
+        _service = DeliveryService()
+    return _service
+
+
+async def deliver(
+    call: Callable[[], Awaitable[Any]],
+    *,
+    chat_id: Optional[int] = None,
+    priority: int = PRIORITY_NOTICE,
+) -> Any:
+    """
+    Отправка через общую очередь:
+        sent = await deliver(lambda: bot.send_message(chat_id, text), chat_id=chat_id)
+    """
+    return await get_delivery().submit(call, chat_id=chat_id, priority=priority)
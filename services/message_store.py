@@ -1,16 +1,254 @@
+# services/message_store.py
+"""
+Где лежит «главный экран» чата: (chat_id, persist_key, kind) → (message_id, ts, content_hash).
+По нему BaseScreen редактирует сообщение на месте и пропускает отправку без изменений.
+
+Два уровня:
+- память: LRU (MESSAGE_STORE_SIZE записей) с TTL (MESSAGE_STORE_TTL, по умолчанию 48ч —
+  как allow_edit_age_sec: более старое сообщение всё равно не редактируется);
+- БД (таблица screen_messages, MESSAGE_STORE_BACKEND=db): записи kind="main" пишутся
+  фоном пачками (write-behind), при промахе памяти читаются оттуда — после перезапуска
+  бот продолжает редактировать те же сообщения. Уведомления (notice) живут только в памяти.
+
+Фоновая запись работает, пока запущен флашер (бот: start()/stop() в app.py);
+в скриптах без флашера хранилище ведёт себя как раньше — только память.
+"""
 from __future__ import annotations
+
+import asyncio
+import logging
+import os
 import time
-from typing import Optional, Dict, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete, tuple_
+
+from db.models import ScreenMessage
+from db.session import SessionLocal
+
+log = logging.getLogger("message_store")
+
+MESSAGE_STORE_BACKEND = os.getenv("MESSAGE_STORE_BACKEND", "db").lower()  # db | memory
+MESSAGE_STORE_SIZE = int(os.getenv("MESSAGE_STORE_SIZE", "50000"))
+MESSAGE_STORE_TTL = float(os.getenv("MESSAGE_STORE_TTL", "172800"))
+MESSAGE_STORE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_STORE_FLUSH_INTERVAL", "2"))
+_PRUNE_EVERY_SEC = 3600
+_DURABLE_KINDS = frozenset({"main"})
+_FLUSH_CHUNK = 500
+
+Key = Tuple[int, str, str]       # (chat_id, persist_key, kind), kind: "main" | "notice"
+Entry = Tuple[int, float, str]   # (message_id, ts, content_hash)
+
+_ABSENT = object()  # в БД записи нет — не ходим туда повторно до истечения TTL
+
+
+class MemoryTier:
+    """LRU + TTL; хранит и «отрицательные» записи (_ABSENT)."""
+
+    def __init__(self, *, max_size: int = MESSAGE_STORE_SIZE, ttl: float = MESSAGE_STORE_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._items: "OrderedDict[Key, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Key) -> Any:
+        """Entry, _ABSENT или None (в памяти ничего нет)."""
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if time.time() - item[0] >= self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key: Key, value: Any) -> None:
+        ts = value[1] if isinstance(value, tuple) else time.time()
+        self._items[key] = (ts, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+class DbTier:
+    """Постоянный уровень на таблице screen_messages (своя сессия — не мешает сессии апдейта)."""
+
+    async def load(self, key: Key) -> Optional[Entry]:
+        async with SessionLocal() as session:
+            row = await session.get(ScreenMessage, key)
+            if row is None:
+                return None
+            return row.message_id, row.sent_ts, row.content_hash
+
+    async def write(self, batch: Dict[Key, Optional[Entry]]) -> None:
+        """Пачка upsert-ов (None — удалить): delete по ключам + insert, одной транзакцией."""
+        items = list(batch.items())
+        async with SessionLocal() as session:
+            for i in range(0, len(items), _FLUSH_CHUNK):
+                chunk = items[i:i + _FLUSH_CHUNK]
+                await session.execute(
+                    delete(ScreenMessage).where(
+                        tuple_(ScreenMessage.chat_id, ScreenMessage.persist_key, ScreenMessage.kind)
+                        .in_([k for k, _ in chunk])
+                    )
+                )
+                session.add_all([
+                    ScreenMessage(
+                        chat_id=k[0], persist_key=k[1], kind=k[2],
+                        message_id=v[0], sent_ts=v[1], content_hash=v[2],
+                    )
+                    for k, v in chunk if v is not None
+                ])
+                await session.flush()
+            await session.commit()
+
+    async def prune(self, older_than: float) -> int:
+        async with SessionLocal() as session:
+            res = await session.execute(delete(ScreenMessage).where(ScreenMessage.sent_ts < older_than))
+            await session.commit()
+            return res.rowcount or 0
+
+
+class MessageStore:
+    def __init__(self, memory: MemoryTier, durable: Optional[DbTier] = None,
+                 *, flush_interval: float = MESSAGE_STORE_FLUSH_INTERVAL):
+        self.memory = memory
+        self.durable = durable
+        self.flush_interval = flush_interval
+        self._pending: Dict[Key, Optional[Entry]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._last_prune = 0.0
+        # метрики
+        self.hits = 0
+        self.misses = 0
+        self.durable_hits = 0
+        self.durable_errors = 0
+        self.flushed = 0
+
+    # ----- API -----
+    async def get(self, chat_id: int, persist_key: str, kind: str) -> Optional[Entry]:
+        key = (chat_id, persist_key, kind)
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return None if value is _ABSENT else value
+        self.misses += 1
+        if self.durable is None or kind not in _DURABLE_KINDS:
+            return None
+        if key in self._pending:  # ещё не записано, но уже удалено/вытеснено из памяти
+            return self._pending[key]
+        try:
+            entry = await self.durable.load(key)
+        except Exception as e:
+            self.durable_errors += 1
+            log.warning("Message store: чтение из БД не удалось (%s): %s", key, e)
+            return None
+        if entry is not None:
+            self.durable_hits += 1
+        self.memory.put(key, entry if entry is not None else _ABSENT)
+        return entry
+
+    def set(self, chat_id: int, persist_key: str, kind: str, message_id: int, content_hash: str) -> None:
+        key = (chat_id, persist_key, kind)
+        entry = (message_id, time.time(), content_hash)
+        self.memory.put(key, entry)
+        self._queue(key, entry)
+
+    def clear(self, chat_id: int, persist_key: str, kind: str) -> None:
+        key = (chat_id, persist_key, kind)
+        self.memory.put(key, _ABSENT)
+        self._queue(key, None)
+
+    def _queue(self, key: Key, entry: Optional[Entry]) -> None:
+        if self._task is not None and key[2] in _DURABLE_KINDS:
+            self._pending[key] = entry
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": "db" if self.durable else "memory",
+            "size": len(self.memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "durable_hits": self.durable_hits,
+            "durable_errors": self.durable_errors,
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+        }
+
+    # ----- фоновая запись -----
+    async def flush(self) -> int:
+        if not self._pending or self.durable is None:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            await self.durable.write(batch)
+        except Exception:
+            log.exception("Message store: запись %d записей в БД не удалась — повторим", len(batch))
+            # вернём в очередь, не затирая более свежие изменения
+            for k, v in batch.items():
+                self._pending.setdefault(k, v)
+            return 0
+        self.flushed += len(batch)
+        return len(batch)
+
+    def start(self) -> None:
+        if self.durable is None or self._task is not None:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="message-store-flusher")
+        log.info("Message store: фоновая запись запущена (интервал %.1fs)", self.flush_interval)
+
+    async def stop(self) -> None:
+        """Останавливает флашер и дописывает хвост."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            now = time.time()
+            if now - self._last_prune >= _PRUNE_EVERY_SEC:
+                self._last_prune = now
+                try:
+                    removed = await self.durable.prune(now - self.memory.ttl)
+                    if removed:
+                        log.info("Message store: удалено устаревших записей: %d", removed)
+                except Exception:
+                    log.exception("Message store: очистка устаревших записей не удалась")
+
+
+_store: Optional[MessageStore] = None
+
+
+def get_message_store() -> MessageStore:
+    global _store
+    if _store is None:
+        durable = DbTier() if MESSAGE_STORE_BACKEND == "db" else None
+        _store = MessageStore(MemoryTier(), durable)
+    return _store
 
-# Ключ = (chat_id, persist_key, kind), где kind: "main" | "notice"
-_Store: Dict[Tuple[int, str, str], Tuple[int, float, str]] = {}
-# value = (message_id, ts, content_hash)
 
 def set_message(chat_id: int, persist_key: str, kind: str, message_id: int, content_hash: str) -> None:
-    _Store[(chat_id, persist_key, kind)] = (message_id, time.time(), content_hash)
+    get_message_store().set(chat_id, persist_key, kind, message_id, content_hash)
+
+
+async def get_message(chat_id: int, persist_key: str, kind: str) -> Optional[Entry]:
+    return await get_message_store().get(chat_id, persist_key, kind)
 
-def get_message(chat_id: int, persist_key: str, kind: str) -> Optional[Tuple[int, float, str]]:
-    return _Store.get((chat_id, persist_key, kind))
 
 def clear_message(chat_id: int, persist_key: str, kind: str) -> None:
-    _Store.pop((chat_id, persist_key, kind), None)
+    get_message_store().clear(chat_id, persist_key, kind)
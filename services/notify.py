@@ -2,6 +2,7 @@
 from typing import Optional
 from aiogram import Bot
 from screens.notify_screen import NotifyScreen
+from services.delivery import PRIORITY_NOTICE
 import logging
 
 
@@ -13,10 +14,13 @@ async def notify_user(
     body: str,
     parse_mode: Optional[str] = "HTML",
     persist_key: str | None = None,
-):
+    priority: int = PRIORITY_NOTICE,
+) -> bool:
     """
     Отправляет пользователю push‑уведомление (в его личку с ботом).
     Требует: BaseScreen._render умеет работать с chat_id и bot.
+    Сообщение идёт через общую очередь доставки с приоритетом priority (см. services.delivery).
+    Ошибку не пробрасывает: возвращает True, если сообщение отправлено.
     """
     try:
         screen = NotifyScreen()
@@ -31,6 +35,9 @@ async def notify_user(
             force_new=True,
             persist_key=persist_key or f"notify:{user_tg_id}",
             disable_web_page_preview=True,
+            delivery_priority=priority,
         )
     except Exception as ex:
         logging.error(f"Error during notify: {ex}")
+        return False
+    return True
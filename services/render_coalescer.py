@@ -0,0 +1,80 @@
+# services/render_coalescer.py
+"""
+Схлопывание рендеров одного экрана: на (chat_id, persist_key) в полёте не больше одного
+edit/send, а рендеры, пришедшие пока он идёт, сводятся к последнему.
+
+Пять быстрых нажатий «+» на SettingsActionScreen: первое редактирует сообщение сразу,
+второе–четвёртое ждут и оказываются устаревшими (возвращают None, как при «контент
+не изменился»), пятое редактирует сообщение до итогового состояния. Вместо пяти
+edit_message_text — два, без «message is not modified» и флуд-ошибок.
+
+RENDER_COALESCE_WINDOW_MS (по умолчанию 0) — пауза перед захватом слота: нажатия,
+пришедшие в это окно, схлопываются ещё до первого edit.
+"""
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+RENDER_COALESCE_WINDOW_MS = float(os.getenv("RENDER_COALESCE_WINDOW_MS", "0"))
+
+T = TypeVar("T")
+
+
+@dataclass
+class _Slot:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    generation: int = 0
+    users: int = 0
+
+
+class RenderCoalescer:
+    def __init__(self, *, window_sec: float = RENDER_COALESCE_WINDOW_MS / 1000):
+        self.window_sec = window_sec
+        self._slots: Dict[Hashable, _Slot] = {}
+        # метрики
+        self.submitted = 0
+        self.coalesced = 0
+
+    async def submit(self, key: Hashable, job: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Выполняет job, если к моменту захвата слота он всё ещё последний для key;
+        иначе возвращает None — его состояние покажет более поздний рендер.
+        """
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+        slot.generation += 1
+        slot.users += 1
+        my_generation = slot.generation
+        self.submitted += 1
+        try:
+            if self.window_sec > 0:
+                await asyncio.sleep(self.window_sec)
+            async with slot.lock:
+                if my_generation != slot.generation:
+                    self.coalesced += 1
+                    return None
+                return await job()
+        finally:
+            slot.users -= 1
+            if slot.users == 0:
+                self._slots.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "active_keys": len(self._slots),
+            "window_ms": self.window_sec * 1000,
+        }
+
+
+_coalescer: Optional[RenderCoalescer] = None
+
+
+def get_render_coalescer() -> RenderCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = RenderCoalescer()
+    return _coalescer
@@ -0,0 +1,183 @@
+# services/sheets_outbox.py
+"""
+Фоновая запись в Google Sheets из outbox-таблицы (db.models.SheetsOutbox).
+
+Хендлеры не ходят в Sheets сами: они кладут строку в outbox той же транзакцией,
+что и изменения в БД. Флашер раз в SHEETS_OUTBOX_INTERVAL секунд забирает
+ожидающие строки, группирует по листам и пишет одним append_rows на лист.
+Ошибка записи — повтор с экспоненциальной паузой, после SHEETS_OUTBOX_MAX_ATTEMPTS — FAILED.
+
+Идемпотентность на стороне Sheets: ключ строки пишется в служебную колонку outbox_key
+(utils.sheets.OUTBOX_KEY_COLUMN), которую флашер добавляет в конец шапки листов RAW, rituals,
+news_to_print и ask_and_answer. Тем, кто правит эти листы, её нельзя удалять или переставлять.
+Попытка фиксируется в БД (attempts, next_attempt_at) ДО append_rows, поэтому строка,
+которую уже пытались записать (ошибка/таймаут после успешного append, падение процесса
+до commit), при повторе сверяется с колонкой outbox_key и не дописывается второй раз.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import gspread
+from sqlalchemy import select
+
+from db.models import OutboxStatus, SheetsOutbox, now_utc
+from db.session import get_session
+from utils import ask_and_answer, news_to_print, raw_body_input, rituals
+from utils.sheets import OUTBOX_KEY_COLUMN, append_rows, get_header, set_header
+
+log = logging.getLogger("sheets_outbox")
+
+SHEETS_OUTBOX_INTERVAL = float(os.getenv("SHEETS_OUTBOX_INTERVAL", "5"))
+SHEETS_OUTBOX_BATCH = int(os.getenv("SHEETS_OUTBOX_BATCH", "500"))
+SHEETS_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SHEETS_OUTBOX_MAX_ATTEMPTS", "8"))
+_MAX_BACKOFF_SEC = 600
+
+# Лист → функция, открывающая его (с созданием/починкой шапки, как при одиночной записи)
+_OPENERS: Dict[str, Callable[[], gspread.Worksheet]] = {
+    "RAW": lambda: raw_body_input._open_ws("RAW")[0],
+    "rituals": lambda: rituals._open_ws(None, "rituals", rituals.RITUALS_HEADER),
+    "news_to_print": news_to_print._open_news_to_print,
+    "ask_and_answer": lambda: ask_and_answer._open_ws(None, "ask_and_answer"),
+}
+
+
+def _rows_for_header(header: List[str], payloads: List[dict]) -> List[list]:
+    """Раскладывает payload-ы по текущей шапке листа; незнакомые колонки — пустые."""
+    keys = [h.strip().lower() for h in header]
+    return [[p.get(k, "") for k in keys] for p in payloads]
+
+
+def _key_column_header(ws: gspread.Worksheet) -> List[str]:
+    """Шапка листа с колонкой outbox_key (добавляется в конец, если её нет)."""
+    header = get_header(ws)
+    if OUTBOX_KEY_COLUMN not in (h.strip().lower() for h in header):
+        header = get_header(ws, refresh=True)
+        if OUTBOX_KEY_COLUMN not in (h.strip().lower() for h in header):
+            header = header + [OUTBOX_KEY_COLUMN]
+            set_header(ws, header)
+    return header
+
+
+def _append_payloads(worksheet: str, keyed: List[Tuple[str, dict]], *, check_existing: bool) -> int:
+    """
+    Синхронная запись пачки строк в один лист (вызывается через asyncio.to_thread).
+    check_existing — среди строк есть повторные попытки: ключи, уже записанные в колонку
+    outbox_key, пропускаются. Возвращает число пропущенных строк.
+    """
+    ws = _OPENERS[worksheet]()
+    header = _key_column_header(ws)
+    skipped = 0
+    if check_existing:
+        col = [h.strip().lower() for h in header].index(OUTBOX_KEY_COLUMN) + 1
+        present = set(ws.col_values(col)[1:])
+        fresh = [(key, payload) for key, payload in keyed if key not in present]
+        skipped = len(keyed) - len(fresh)
+        keyed = fresh
+    if keyed:
+        payloads = [{**payload, OUTBOX_KEY_COLUMN: key} for key, payload in keyed]
+        append_rows(ws, _rows_for_header(header, payloads))
+    return skipped
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(_MAX_BACKOFF_SEC, SHEETS_OUTBOX_INTERVAL * 2 ** attempts))
+
+
+async def flush_outbox(limit: int = SHEETS_OUTBOX_BATCH) -> int:
+    """Один проход флашера. Возвращает число записанных строк."""
+    written = 0
+    async with get_session() as session:
+        items: List[SheetsOutbox] = list((await session.execute(
+            select(SheetsOutbox)
+            .where(
+                SheetsOutbox.status == OutboxStatus.PENDING,
+                SheetsOutbox.next_attempt_at <= now_utc(),
+            )
+            .order_by(SheetsOutbox.id)
+            .limit(limit)
+        )).scalars().all())
+        if not items:
+            return 0
+
+        by_sheet: Dict[str, List[SheetsOutbox]] = defaultdict(list)
+        for item in items:
+            by_sheet[item.worksheet].append(item)
+
+        for worksheet, group in by_sheet.items():
+            if worksheet not in _OPENERS:
+                log.error("Outbox: неизвестный лист '%s' — строки помечены FAILED: %s", worksheet, [i.id for i in group])
+                for item in group:
+                    item.status = OutboxStatus.FAILED
+                    item.last_error = f"unknown worksheet: {worksheet}"
+                await session.commit()
+                continue
+            # попытку фиксируем до записи: если append пройдёт, а мы не успеем отметить SENT,
+            # следующий проход увидит attempts > 0 и сверится с колонкой outbox_key
+            retry = any(item.attempts > 0 for item in group)
+            now = now_utc()
+            for item in group:
+                item.attempts += 1
+                item.next_attempt_at = now + _backoff(item.attempts)
+            await session.commit()
+            try:
+                skipped = await asyncio.to_thread(
+                    _append_payloads, worksheet,
+                    [(i.idempotency_key, i.payload) for i in group],
+                    check_existing=retry,
+                )
+            except Exception as e:
+                log.warning("Outbox: запись в '%s' не удалась (%d строк): %s", worksheet, len(group), e)
+                for item in group:
+                    item.last_error = str(e)[:1000]
+                    if item.attempts >= SHEETS_OUTBOX_MAX_ATTEMPTS:
+                        item.status = OutboxStatus.FAILED
+            else:
+                now = now_utc()
+                for item in group:
+                    item.status = OutboxStatus.SENT
+                    item.sent_at = now
+                written += len(group) - skipped
+                log.info("Outbox: записано в '%s' строк: %d (уже были в листе: %d)", worksheet, len(group) - skipped, skipped)
+            # фиксируем по листу, чтобы успешная запись не повторилась из-за сбоя на следующем
+            await session.commit()
+    return written
+
+
+class SheetsOutboxFlusher:
+    """Фоновая задача бота: периодически вызывает flush_outbox()."""
+
+    def __init__(self, interval: float = SHEETS_OUTBOX_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="sheets-outbox-flusher")
+            log.info("Outbox: флашер запущен (интервал %.1fs)", self.interval)
+
+    async def stop(self) -> None:
+        """Останавливает цикл и делает последний проход, чтобы не оставлять хвост."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await flush_outbox() >= SHEETS_OUTBOX_BATCH:
+                    pass  # очередь длиннее пачки — дочитываем без паузы
+            except Exception:
+                log.exception("Outbox: проход флашера упал")
+            if self._stopping.is_set():
+                return
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
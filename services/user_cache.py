@@ -0,0 +1,112 @@
+# services/user_cache.py
+"""
+Кэш «известных» пользователей бота: tg_id → (users.id, is_admin, language_code).
+
+UserRegistrationMiddleware ходит в БД только на промахе (новый игрок, захват
+placeholder-записи или истёкшая запись), остальные апдейты обслуживаются из памяти.
+Кэш ограничен по размеру (LRU) и по времени жизни записи (TTL) — правки из других
+процессов (скрипты, ручные изменения в БД) подхватываются не позже USER_CACHE_TTL.
+Код, меняющий пользователей в процессе бота, сбрасывает запись через invalidate() —
+только после COMMIT, иначе чтение до фиксации вернуло бы в кэш старые данные:
+User.update_by_tg_id / update_by_username / delete_by_tg_id отмечают изменённых в
+session.info, и их сбрасывает обработчик after_commit ниже; захват placeholder-записи
+в мидлвари, админ-скрипты (после каждого _run_and_report) и /admin_cache_reset
+сбрасывают кэш сами после своей фиксации.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db.models import USERS_CHANGED_KEY
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    user_id: int
+    tg_id: int
+    is_admin: bool
+    language_code: Optional[str]
+
+    @classmethod
+    def from_user(cls, user) -> "UserIdentity":
+        return cls(
+            user_id=user.id,
+            tg_id=user.tg_id,
+            is_admin=bool(user.is_admin),
+            language_code=user.language_code,
+        )
+
+
+class UserCache:
+    def __init__(self, *, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._items: "OrderedDict[int, Tuple[float, UserIdentity]]" = OrderedDict()
+        # метрики
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tg_id: int) -> Optional[UserIdentity]:
+        item = self._items.get(tg_id)
+        if item is None or time.monotonic() - item[0] >= self.ttl:
+            if item is not None:
+                del self._items[tg_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(tg_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, identity: UserIdentity) -> None:
+        self._items[identity.tg_id] = (time.monotonic(), identity)
+        self._items.move_to_end(identity.tg_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, tg_id: Optional[int] = None) -> None:
+        """Сбрасывает запись игрока (или весь кэш, если tg_id не задан)."""
+        if tg_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(tg_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
+
+
+_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        _cache = UserCache()
+    return _cache
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    """Сбрасывает записи пользователей, изменённых в только что зафиксированной транзакции."""
+    changed = session.info.pop(USERS_CHANGED_KEY, None)
+    if not changed:
+        return
+    cache = get_user_cache()
+    if None in changed:
+        cache.invalidate()
+        return
+    for tg_id in changed:
+        cache.invalidate(tg_id)
@@ -6,7 +6,6 @@ import asyncio
 from typing import List, Set, Tuple, Optional
 
 import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
@@ -15,6 +14,7 @@ from sqlalchemy import select, update
 from db.session import Base  # noqa
 from db.models import Action, ActionStatus, User
 from services.notify import notify_user
+from utils.sheets import append_rows, ensure_header, get_client, get_worksheet
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 log = logging.getLogger("sync_news")
@@ -24,7 +24,6 @@ load_dotenv()
 SPREADSHEET_ID = os.environ["SPREADSHEET_ID"]
 SA_PATH = os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
 DB_URL = os.environ["DATABASE_URL"]
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
 # ─────────── Utils ───────────
 def norm_text(s: str) -> str:
@@ -43,23 +42,17 @@ def truthy(x) -> bool:
     s = str(x).strip().lower()
     return s in {"true", "1", "yes", "y", "да"}
 
-def get_ws(gc: gspread.Client, spreadsheet_id: str, title: str) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
-    return sh.worksheet(title)
+def get_ws(spreadsheet_id: str, title: str) -> gspread.Worksheet:
+    return get_worksheet(title, spreadsheet_id=spreadsheet_id)
 
 NEEDED_NEWS_HEADER = ["id","title","body","media_urls","action_id","created_at","updated_at","action__name"]
 
 def ensure_news_header(ws_news):
-    header = ws_news.row_values(1)
-    if header != NEEDED_NEWS_HEADER:
-        if header:
-            ws_news.update("A1", [NEEDED_NEWS_HEADER])
-        else:
-            ws_news.append_row(NEEDED_NEWS_HEADER)
+    ensure_header(ws_news, NEEDED_NEWS_HEADER)
 
 def append_rows_news(ws_news, rows):
     if rows:
-        ws_news.append_rows(rows, value_input_option="USER_ENTERED")
+        append_rows(ws_news, rows)
 
 def existing_news_keys(ws_news) -> Set[str]:
     rows = ws_news.get_all_values()
@@ -80,12 +73,12 @@ def existing_news_keys(ws_news) -> Set[str]:
     return keys
 
 # ─────────── Перенос: news_to_print → news ───────────
-def sync_news_to_print_to_news(gc) -> Tuple[int, List[int]]:
+def sync_news_to_print_to_news() -> Tuple[int, List[int]]:
     """
     Возвращает (сколько добавлено, список action_id для постобработки).
     """
-    ws_src = get_ws(gc, SPREADSHEET_ID, "news_to_print")
-    ws_dst = get_ws(gc, SPREADSHEET_ID, "news")
+    ws_src = get_ws(SPREADSHEET_ID, "news_to_print")
+    ws_dst = get_ws(SPREADSHEET_ID, "news")
 
     ensure_news_header(ws_dst)
     already = existing_news_keys(ws_dst)
@@ -137,9 +130,9 @@ def sync_news_to_print_to_news(gc) -> Tuple[int, List[int]]:
     return len(out), action_ids
 
 # ─────────── Перенос: RAW → news ───────────
-def sync_raw_to_news(gc) -> int:
-    ws_src = get_ws(gc, SPREADSHEET_ID, "RAW")
-    ws_dst = get_ws(gc, SPREADSHEET_ID, "news")
+def sync_raw_to_news() -> int:
+    ws_src = get_ws(SPREADSHEET_ID, "RAW")
+    ws_dst = get_ws(SPREADSHEET_ID, "news")
 
     ensure_news_header(ws_dst)
     already = existing_news_keys(ws_dst)
@@ -236,14 +229,13 @@ async def process_actions_done_and_notify(session: AsyncSession, action_ids: Lis
 
 # ─────────── main ───────────
 async def amain():
-    creds = Credentials.from_service_account_file(SA_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
+    get_client(SA_PATH)
 
     engine = create_async_engine(DB_URL, echo=False, pool_pre_ping=True)
     Session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-    added_np, action_ids = sync_news_to_print_to_news(gc)
-    added_raw = sync_raw_to_news(gc)
+    added_np, action_ids = sync_news_to_print_to_news()
+    added_raw = sync_raw_to_news()
 
     if action_ids:
         async with Session() as session:
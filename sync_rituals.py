@@ -4,28 +4,27 @@ import asyncio
 import logging
 from typing import Sequence, Dict, Any
 
-import gspread
 from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
 
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
 
 # ========= ВАШИ ИМПОРТЫ БД (проверьте пути) =========
 from db.session import get_session
+from db.loaders import load_profile
 from db.models import Action, User  # проверьте, что User у Action -> owner / user
 from db.models import ActionStatus  # Enum со значениями PENDING, DONE
 # ====================================================
 
 # Опционально уведомление в Telegram
 from aiogram import Bot
+from services.delivery import PRIORITY_BULK, deliver
+from utils.sheets import get_client, get_header, get_worksheet
 
 
 load_dotenv()
 log = logging.getLogger("sync_rituals")
 logging.basicConfig(level=logging.INFO)
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
 # ====== bot (как в game_cycle.py) ======
 try:
@@ -55,7 +54,7 @@ def _index_headers(ws) -> Dict[str, int]:
     Возвращает map {'title': 0, 'user': 1, ...} по реальным индексам колонок (0-based).
     Бросит ValueError, если не найдена нужная колонка.
     """
-    header = ws.row_values(1)
+    header = get_header(ws)
     name_to_idx: Dict[str, int] = {}
     for i, name in enumerate(header):
         key = name.strip()
@@ -79,18 +78,15 @@ async def _notify_user(bot: Bot, tg_id: int, action: Action) -> None:
         f"{txt[:1000]}"  # ограничим, чтобы не улететь в лимиты
     )
     try:
-        await bot.send_message(tg_id, msg, parse_mode="HTML")
+        await deliver(lambda: bot.send_message(tg_id, msg, parse_mode="HTML"), chat_id=tg_id, priority=PRIORITY_BULK)
     except Exception as e:
         log.warning("Не удалось отправить сообщение tg_id=%s: %s", tg_id, e)
 
 
 async def main() -> int:
     # Инициализация Google Sheets
-    creds = Credentials.from_service_account_file(CREDS_PATH, scopes=SCOPES)
-    gc = gspread.authorize(creds)
-
-    sh = gc.open_by_key(SHEET_ID)
-    ws = sh.worksheet(RITUALS_SHEET_TITLE)
+    get_client(CREDS_PATH)
+    ws = get_worksheet(RITUALS_SHEET_TITLE, spreadsheet_id=SHEET_ID)
 
     headers_idx = _index_headers(ws)
     # Считаем ВСЕ значения (в т.ч. пустые) и пройдём по строкам, начиная со 2-й
@@ -139,7 +135,7 @@ async def main() -> int:
         # Забираем действия пачкой
         q = await session.execute(
             select(Action)
-            .options(joinedload(Action.owner))  # подгрузим владельца (User)
+            .options(*load_profile("action_notify"))  # владелец (User) и район
             .where(Action.id.in_(action_ids))
         )
         actions_by_id: Dict[int, Action] = {a.id: a for a in q.scalars().all()}
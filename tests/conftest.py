@@ -0,0 +1,70 @@
+# tests/conftest.py
+"""
+Общие фикстуры: окружение бота и БД в памяти (aiosqlite).
+
+pytest-asyncio не нужен: тесты синхронные и гоняют корутины через run(), один
+event loop на тест. Синглтоны, привязанные к loop (очередь доставки, схлопывание
+рендеров, кэш сообщений), сбрасываются перед каждым тестом.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# до импорта модулей бота: config.load_config() и db.session читают окружение при импорте
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite://"
+os.environ["TEMPLATE_ROOT"] = str(ROOT / "templates")
+os.environ.setdefault("DEFAULT_LOCALIZATION", "ru")
+
+import pytest  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import db.instrumentation as instrumentation  # noqa: E402
+from db.models import Base  # noqa: E402
+from db.session import SessionLocal  # noqa: E402
+from services import delivery, message_store, render_coalescer  # noqa: E402
+
+
+class Database:
+    """Движок в памяти на один тест; run() выполняет корутину в loop теста."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # sql_scope() считает запросы только при включённом инструментировании
+    monkeypatch.setattr(instrumentation, "SQL_INSTRUMENTATION", True)
+    monkeypatch.setattr(delivery, "_service", None)
+    monkeypatch.setattr(message_store, "_store", None)
+    monkeypatch.setattr(render_coalescer, "_coalescer", None)
+
+    loop = asyncio.new_event_loop()
+    database = Database(loop)
+    instrumentation.instrument_engine(database.engine)
+    old_bind = SessionLocal.kw.get("bind")
+    SessionLocal.configure(bind=database.engine)
+
+    async def create_all():
+        async with database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    database.run(create_all())
+    try:
+        yield database
+    finally:
+        SessionLocal.configure(bind=old_bind)
+        if delivery._service is not None:
+            database.run(delivery._service.stop())
+        database.run(database.engine.dispose())
+        loop.close()
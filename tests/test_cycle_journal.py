@@ -0,0 +1,157 @@
+# tests/test_cycle_journal.py
+"""
+Продолжение упавшего игрового цикла по журналу (CYCLE_TX_MODE=steps).
+
+Цикл гоняется целиком (commands.run_game_cycle) на SQLite-файле: изменения шага и его
+строка в журнале фиксируются одним COMMIT, поэтому падение между ними откатывает шаг,
+и повторный запуск начисляет ресурсы ровно один раз. Замок цикла мёртвого процесса
+забирается сразу, живого — только по истечении TTL.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import commands
+from db.models import Base, CycleLock, CycleRun, CycleRunStatus, CycleStep, District, User, now_utc
+from db.session import SessionLocal
+from services.cycle_journal import CycleJournal, CycleLockedError, acquire_cycle_lock, renew_cycle_lock
+
+from .conftest import ROOT
+
+
+async def _seed(url: str) -> None:
+    """Игрок с базовыми ресурсами и двумя районами (без tg_id — сводка цикла не рассылается)."""
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal.configure(bind=engine)
+    try:
+        async with SessionLocal() as session:
+            user = User(username="owner", base_money=7, base_force=2)
+            session.add(user)
+            await session.flush()
+            session.add_all([District(name=f"D{i}", owner_id=user.id, base_force=3) for i in range(2)])
+            await session.commit()
+    finally:
+        await engine.dispose()
+
+
+async def _state(url: str):
+    engine = create_async_engine(url)
+    SessionLocal.configure(bind=engine)
+    try:
+        async with SessionLocal() as session:
+            user = (await session.execute(select(User))).scalar_one()
+            runs = (await session.execute(select(CycleRun.status, CycleRun.attempts))).all()
+            steps = (await session.execute(select(CycleStep.step))).scalars().all()
+            resources = {name: getattr(user, name) for name in commands.RESOURCE_NAMES}
+            return resources, runs, steps
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def cycle_db(tmp_path, monkeypatch):
+    """Отдельный SQLite-файл на запуск цикла; файлы цикла (XLSX, метрики) — во временной папке."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(commands, "CYCLE_TX_MODE", "steps")
+    monkeypatch.setattr(commands, "COMBAT_RATES_PATH", str(ROOT / "config" / "combat_rates.json"))
+    old_bind = SessionLocal.kw.get("bind")
+
+    def make(name: str) -> str:
+        url = f"sqlite+aiosqlite:///{tmp_path / name}"
+        asyncio.run(_seed(url))
+        return url
+
+    yield make
+    SessionLocal.configure(bind=old_bind)
+
+
+def _run_cycle(monkeypatch, url: str) -> None:
+    monkeypatch.setattr(commands, "DATABASE_URL", url)
+    asyncio.run(commands.run_game_cycle())
+
+
+def test_crash_before_journal_commit_does_not_grant_twice(cycle_db, monkeypatch):
+    expected_url = cycle_db("expected.db")
+    _run_cycle(monkeypatch, expected_url)
+    expected, _, _ = asyncio.run(_state(expected_url))
+
+    url = cycle_db("resumed.db")
+    before, _, _ = asyncio.run(_state(url))
+    complete = CycleJournal.complete
+
+    async def crash_on_grant(self, session, step, *args, **kwargs):
+        # шаг 5 уже выполнил свой UPDATE и commit(), но строка журнала ещё не зафиксирована
+        if step == "5":
+            raise RuntimeError("killed between step and journal")
+        return await complete(self, session, step, *args, **kwargs)
+
+    monkeypatch.setattr(CycleJournal, "complete", crash_on_grant)
+    with pytest.raises(RuntimeError, match="killed"):
+        _run_cycle(monkeypatch, url)
+
+    crashed, runs, steps = asyncio.run(_state(url))
+    assert runs == [(CycleRunStatus.FAILED, 1)]
+    assert "5" not in steps
+    # базовые ресурсы (шаг 4.5) закоммичены, начисление с районов (шаг 5) откачено вместе с журналом
+    assert crashed != before and crashed != expected
+
+    monkeypatch.setattr(CycleJournal, "complete", complete)
+    _run_cycle(monkeypatch, url)
+
+    resumed, runs, steps = asyncio.run(_state(url))
+    assert runs == [(CycleRunStatus.DONE, 2)]
+    assert sorted(steps) == sorted(set(steps))
+    assert resumed == expected
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+async def _hold_lock(holder: str, age: timedelta = timedelta(0)) -> None:
+    async with SessionLocal() as session:
+        session.add(CycleLock(id=1, holder=holder, acquired_at=now_utc() - age))
+        await session.commit()
+
+
+async def _acquire() -> str:
+    async with SessionLocal() as session:
+        return await acquire_cycle_lock(session, ttl=600)
+
+
+def test_lock_of_dead_process_is_taken_over(db):
+    db.run(_hold_lock(f"{socket.gethostname()}:{_dead_pid()}:2020-01-01T00:00:00"))
+    holder = db.run(_acquire())
+    assert holder.startswith(f"{socket.gethostname()}:")
+
+
+def test_lock_of_live_process_blocks_until_ttl(db):
+    live = f"{socket.gethostname()}:{os.getppid()}:2020-01-01T00:00:00"
+    db.run(_hold_lock(live))
+    with pytest.raises(CycleLockedError):
+        db.run(_acquire())
+
+    async def expire_and_renew():
+        async with SessionLocal() as session:
+            lock = await session.get(CycleLock, 1)
+            lock.acquired_at = now_utc() - timedelta(hours=1)
+            await session.commit()
+        holder = await _acquire()
+        async with SessionLocal() as session:
+            await renew_cycle_lock(session, holder)
+            # прежний держатель свой замок продлить уже не может
+            with pytest.raises(CycleLockedError):
+                await renew_cycle_lock(session, live)
+
+    db.run(expire_and_renew())
@@ -0,0 +1,129 @@
+# tests/test_screen_queries.py
+"""
+Бюджет SQL-запросов ключевых экранов (профиль, список действий, лента новостей).
+
+Экран рендерится целиком (BaseScreen.run) под sql_scope, отправка в Telegram —
+заглушка. Число запросов не должно расти с историей игрока: связи моделей
+не грузятся неявно (lazy="raise_on_sql"), а нужное подгружают профили db.loaders.
+"""
+from datetime import timedelta
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from db.instrumentation import sql_scope
+from db.models import Action, ActionStatus, ActionType, District, News, User, now_utc, user_scouts_districts
+from db.session import SessionLocal
+from services import message_store
+from screens.news_list import NewsList
+from screens.profile import ProfileScreen
+from screens.settings_action import SettingsActionScreen
+
+TG_ID = 1001
+
+# Фактическое число запросов на рендер (включая чтение id прошлого сообщения из кэша);
+# рост — повод разобраться, уменьшение — повод поправить бюджет
+PROFILE_BUDGET = 7
+SETTINGS_ACTION_BUDGET = 5
+NEWS_LIST_BUDGET = 3
+
+
+class FakeMessage:
+    """Минимум aiogram.types.Message, который нужен BaseScreen: чат, автор и answer()."""
+
+    _ids = count(1)
+
+    def __init__(self, tg_id: int = TG_ID):
+        self.from_user = SimpleNamespace(
+            id=tg_id, username="player", first_name="Player", last_name=None, language_code="ru",
+        )
+        self.chat = SimpleNamespace(id=tg_id)
+        self.bot = None
+        self.sent = []
+
+    async def answer(self, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=next(self._ids))
+
+
+async def _seed_player() -> None:
+    """Игрок и соперник, районы у обоих, разведка двух районов."""
+    async with SessionLocal() as session:
+        user = User(tg_id=TG_ID, username="player", in_game_name="P1", money=10, available_actions=3)
+        other = User(tg_id=TG_ID + 1, username="other")
+        session.add_all([user, other])
+        await session.flush()
+
+        districts = [District(name=f"D{i}", owner_id=user.id if i % 2 else other.id) for i in range(6)]
+        session.add_all(districts)
+        await session.flush()
+        await session.execute(
+            user_scouts_districts.insert(),
+            [{"user_id": user.id, "district_id": d.id} for d in districts[:2]],
+        )
+        await session.commit()
+
+
+async def _add_history(history: int) -> None:
+    """history действий игрока (к каждому — поддержка соперника и новость)."""
+    t0 = now_utc() - timedelta(days=7)
+    async with SessionLocal() as session:
+        user = (await session.execute(select(User).where(User.tg_id == TG_ID))).scalar_one()
+        other = (await session.execute(select(User).where(User.tg_id == TG_ID + 1))).scalar_one()
+        districts = (await session.execute(select(District).order_by(District.id))).scalars().all()
+        offset = (await session.execute(select(func.count(Action.id)))).scalar_one()
+
+        statuses = [ActionStatus.PENDING, ActionStatus.DONE, ActionStatus.FAILED, ActionStatus.DRAFT]
+        for i in range(history):
+            action = Action(
+                owner_id=user.id, kind="attack", title=f"A{i}", status=statuses[i % len(statuses)],
+                type=ActionType.INDIVIDUAL, district_id=districts[i % len(districts)].id,
+                created_at=t0 + timedelta(minutes=offset + i), updated_at=t0 + timedelta(minutes=offset + i),
+            )
+            session.add(action)
+            await session.flush()
+            session.add(Action(
+                owner_id=other.id, kind="attack", status=ActionStatus.PENDING, type=ActionType.SUPPORT,
+                parent_action_id=action.id, district_id=action.district_id,
+            ))
+            session.add(News(
+                title=f"N{i}", body="body", action_id=action.id, created_at=t0 + timedelta(minutes=offset + i),
+            ))
+        await session.commit()
+
+
+async def _render(screen, **kwargs) -> int:
+    # холодный кэш сообщений — как при первом апдейте после старта: id прошлого сообщения читается из БД
+    message_store._store = None
+    message = FakeMessage()
+    with sql_scope(f"test:{type(screen).__name__}") as scope:
+        await screen.run(message=message, actor=message.from_user, state=None, **kwargs)
+    assert message.sent, "экран ничего не отправил"
+    return scope.statements
+
+
+SCREENS = [
+    pytest.param(ProfileScreen, {}, PROFILE_BUDGET, id="profile"),
+    pytest.param(SettingsActionScreen, {"is_list": True}, SETTINGS_ACTION_BUDGET, id="settings_action"),
+    pytest.param(NewsList, {}, NEWS_LIST_BUDGET, id="news_list"),
+]
+
+
+@pytest.mark.parametrize("screen_cls, kwargs, budget", SCREENS)
+def test_screen_statement_budget(db, screen_cls, kwargs, budget):
+    db.run(_seed_player())
+    db.run(_add_history(5))
+    statements = db.run(_render(screen_cls(), **kwargs))
+    assert statements <= budget
+
+
+@pytest.mark.parametrize("screen_cls, kwargs, budget", SCREENS)
+def test_screen_statements_do_not_grow_with_history(db, screen_cls, kwargs, budget):
+    db.run(_seed_player())
+    db.run(_add_history(2))
+    short = db.run(_render(screen_cls(), **kwargs))
+    db.run(_add_history(40))
+    long = db.run(_render(screen_cls(), **kwargs))
+    assert long == short
@@ -0,0 +1,62 @@
+# tests/test_session_scope.py
+"""
+Скоуп сессии на апдейт (db.session.session_scope): get_session() внутри скоупа делят
+одну сессию, но ошибка в одном блоке откатывает только его SAVEPOINT — остальная работа
+апдейта и загруженные мидлварью объекты остаются.
+"""
+from sqlalchemy import select
+
+from db.models import User
+from db.session import get_session, session_scope, SessionLocal
+
+
+async def _seed() -> None:
+    async with SessionLocal() as session:
+        session.add_all([User(tg_id=1, money=10), User(tg_id=2, money=20)])
+        await session.commit()
+
+
+async def _money(tg_id: int) -> int:
+    async with SessionLocal() as session:
+        return (await session.execute(select(User.money).where(User.tg_id == tg_id))).scalar_one()
+
+
+def test_failed_block_rolls_back_only_its_savepoint(db):
+    db.run(_seed())
+
+    async def update():
+        async with session_scope() as scope:
+            # как UserRegistrationMiddleware: объект живёт весь апдейт
+            user = (await scope.session.execute(select(User).where(User.tg_id == 1))).scalar_one()
+            user.money = 11  # работа апдейта вне блока, ещё не зафиксирована
+
+            try:
+                async with get_session() as session:
+                    other = (await session.execute(select(User).where(User.tg_id == 2))).scalar_one()
+                    other.money = 0
+                    await session.flush()
+                    raise RuntimeError("option failed")
+            except RuntimeError:
+                pass  # опции ловят и логируют такие ошибки
+
+            # без ленивой догрузки (MissingGreenlet): объект не просрочен откатом блока
+            assert user.money == 11
+
+    db.run(update())
+    assert db.run(_money(1)) == 11
+    assert db.run(_money(2)) == 20
+
+
+def test_block_commit_is_kept(db):
+    db.run(_seed())
+
+    async def update():
+        async with session_scope():
+            async with get_session() as session:
+                user = (await session.execute(select(User).where(User.tg_id == 2))).scalar_one()
+                user.money = 25
+                await session.commit()
+            assert user.money == 25
+
+    db.run(update())
+    assert db.run(_money(2)) == 25
@@ -0,0 +1,63 @@
+# tests/test_user_cache.py
+"""
+Кэш пользователей мидлвари (services.user_cache) сбрасывается только после COMMIT:
+чтение между правкой и фиксацией не должно вернуть в кэш старые данные.
+"""
+from services import user_cache
+from services.user_cache import UserCache, UserIdentity, get_user_cache
+
+from db.models import User
+from db.session import SessionLocal
+
+TG_ID = 2001
+
+
+def _cached() -> UserCache:
+    cache = get_user_cache()
+    cache.put(UserIdentity(user_id=1, tg_id=TG_ID, is_admin=False, language_code="ru"))
+    return cache
+
+
+def test_update_invalidates_after_commit(db, monkeypatch):
+    monkeypatch.setattr(user_cache, "_cache", None)
+
+    async def scenario():
+        async with SessionLocal() as session:
+            session.add(User(tg_id=TG_ID))
+            await session.commit()
+
+        cache = _cached()
+        seen_before_commit = []
+        async with SessionLocal() as session:
+            commit = session.commit
+
+            async def commit_and_check():
+                # правка уже выполнена, COMMIT ещё нет — запись кэша пока на месте
+                seen_before_commit.append(cache.get(TG_ID))
+                await commit()
+
+            monkeypatch.setattr(session, "commit", commit_and_check)
+            assert await User.update_by_tg_id(session, TG_ID, is_admin=True)
+
+        assert seen_before_commit[0] is not None
+        assert cache.get(TG_ID) is None
+
+    db.run(scenario())
+
+
+def test_update_by_username_resets_whole_cache(db, monkeypatch):
+    monkeypatch.setattr(user_cache, "_cache", None)
+
+    async def scenario():
+        async with SessionLocal() as session:
+            session.add(User(tg_id=TG_ID, username="player"))
+            await session.commit()
+            cache = _cached()
+            # коммит без правок через User.* кэш не трогает
+            await session.commit()
+            assert cache.get(TG_ID) is not None
+
+            assert await User.update_by_username(session, "player", is_admin=True)
+        assert cache.stats()["size"] == 0
+
+    db.run(scenario())
@@ -1,11 +1,8 @@
 # utils/ask_and_answer.py
-import os
 from typing import Optional, Sequence
 import gspread
-from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
 
-load_dotenv()
+from utils.sheets import OUTBOX_KEY_COLUMN, append_rows, ensure_header, get_client, get_worksheet
 
 # колонки листа строго в таком порядке:
 AA_HEADER: Sequence[str] = (
@@ -18,42 +15,30 @@ OLD_HEADER: Sequence[str] = (
     "username", "in_game_name", "question", "answer", "answered", "sent_to_user"
 )
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-
-def _ensure_header(ws: gspread.Worksheet) -> None:
-    header = ws.row_values(1)
-
-    # уже новый формат — ок
-    if header == list(NEW_HEADER):
-        return
-
-    # если старый формат — расширим колонками и обновим шапку
-    if header == list(OLD_HEADER):
-        cur_cols = ws.col_count
-        need_cols = len(NEW_HEADER)
-        if cur_cols < need_cols:
-            ws.add_cols(need_cols - cur_cols)
-        ws.update("A1", [list(NEW_HEADER)])
-        return
-
-    # иначе просто выставляем правильную шапку (создастся/перезапишется)
-    cur_cols = ws.col_count
-    need_cols = len(NEW_HEADER)
-    if cur_cols < need_cols:
-        ws.add_cols(need_cols - cur_cols)
-    ws.update("A1", [list(NEW_HEADER)])
+def _open_ws(spreadsheet_id: Optional[str], title: str) -> gspread.Worksheet:
+    ws = get_worksheet(title, spreadsheet_id=spreadsheet_id, create_header=NEW_HEADER)
+    # старый формат (без action_id) и любая другая шапка приводятся к NEW_HEADER
+    # (колонку outbox_key справа дописывает outbox — она не несовпадение)
+    ensure_header(ws, NEW_HEADER, allow_extra=(OUTBOX_KEY_COLUMN,))
+    return ws
 
-def _open_ws(gc: gspread.Client, spreadsheet_id: str, title: str) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
-    try:
-        ws = sh.worksheet(title)
-    except gspread.WorksheetNotFound:
-        ws = sh.add_worksheet(title=title, rows=1, cols=len(NEW_HEADER))
-        ws.update("A1", [list(NEW_HEADER)])
-        return ws
 
-    _ensure_header(ws)
-    return ws
+def ask_and_answer_payload(
+    username: str,
+    in_game_name: str,
+    question: str,
+    action_id: Optional[int] = None,
+) -> dict:
+    """Значения строки листа 'ask_and_answer' по колонкам."""
+    return {
+        "username": (username or "").strip(),
+        "in_game_name": (in_game_name or "").strip(),
+        "question": (question or "").strip(),
+        "answer": "",
+        "answered": "FALSE",
+        "sent_to_user": "FALSE",
+        "action_id": str(action_id or ""),  # как текст; при желании можно писать числом
+    }
 
 
 def append_ask_and_answer(
@@ -69,24 +54,12 @@ def append_ask_and_answer(
     Добавляет строку в лист 'ask_and_answer' с колонками:
     username, in_game_name, question, answer="", answered=FALSE, sent_to_user=FALSE, action_id
     """
-    spreadsheet_id = spreadsheet_id or os.environ["SPREADSHEET_ID"]
-    service_account_path = service_account_path or os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-
-    creds = Credentials.from_service_account_file(service_account_path, scopes=SCOPES)
-    gc = gspread.authorize(creds)
-
-    ws = _open_ws(gc, spreadsheet_id, "ask_and_answer")
+    get_client(service_account_path)  # общий клиент процесса (путь учитывается при первом вызове)
+    ws = _open_ws(spreadsheet_id, "ask_and_answer")
 
-    row = [
-        (username or "").strip(),
-        (in_game_name or "").strip(),
-        (question or "").strip(),
-        "",        # answer
-        "FALSE",   # answered
-        "FALSE",   # sent_to_user
-        str(action_id or ""),  # action_id (как текст; при желании можно писать числом)
-    ]
-    ws.append_row(row, value_input_option="USER_ENTERED")
+    payload = ask_and_answer_payload(username, in_game_name, question, action_id)
+    row = [payload[h] for h in NEW_HEADER]
+    append_rows(ws, [row])
 
 
 if __name__ == "__main__":
@@ -1,15 +1,275 @@
 # utils/callback.py
-from urllib.parse import parse_qsl
+"""
+callback_data кнопок.
+
+Компактный формат (его пишет KeyboardRenderer):
+    ~<id опции>|<поле>|<поле>...     например "~Q2xk|a1234|lF"
+- id опции — 4 символа base64 от crc32 ключа (стабилен между перезапусками, не зависит от порядка регистрации);
+- поле — короткий код имени из FIELD_CODES (или "!имя=") и значение с типом:
+  целое как есть, T/F — bool, N — None, 'строка, f-float, j-json;
+- не влезло в лимит Telegram (64 байта) — параметры кладутся в хранилище, в кнопке
+  остаётся ссылка: "~<id>*<токен>". Токен — хэш параметров, хранилище — таблица
+  callback_payloads (TTL CALLBACK_PAYLOAD_TTL) с LRU в памяти перед ней: кнопку,
+  построенную циклом или до перезапуска бота, бот разберёт. BaseScreen._render
+  записывает новые параметры (flush) до отправки сообщения, разбор ссылки —
+  resolve_callback_data() (async: промах памяти идёт в БД).
+
+Старый формат key?x=1&y=2 (кнопки в уже отправленных сообщениях) по-прежнему разбирается.
+"""
+import base64
+import hashlib
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, quote, unquote
 import json
 
+from sqlalchemy import delete, select
+
+from db.models import CallbackPayload, now_utc
+from db.session import SessionLocal
+
+CALLBACK_DATA_LIMIT = 64
+CALLBACK_PAYLOAD_TTL = float(os.getenv("CALLBACK_PAYLOAD_TTL", "86400"))
+CALLBACK_PAYLOAD_MAX = int(os.getenv("CALLBACK_PAYLOAD_MAX", "50000"))
+_PRUNE_EVERY_SEC = 3600
+
+_PREFIX = "~"
+_SEP = "|"
+_REF = "*"
+
+# Коды имён параметров. Только дописывать: коды уже живут в отправленных кнопках.
+FIELD_CODES: Dict[str, str] = {
+    "action_id": "a",
+    "is_list": "l",
+    "status": "s",
+    "move": "m",
+    "page": "p",
+    "action": "k",
+}
+_FIELD_NAMES: Dict[str, str] = {code: name for name, code in FIELD_CODES.items()}
+
+_KEYS_BY_ID: Dict[str, str] = {}
+
+
+def option_id(key: str) -> str:
+    """Короткий стабильный id ключа опции (24 бита crc32 → 4 символа base64url)."""
+    return base64.urlsafe_b64encode((zlib.crc32(key.encode("utf-8")) & 0xFFFFFF).to_bytes(3, "big")).decode()
+
+
+def register_callback_key(key: str) -> str:
+    """Регистрирует ключ опции для разбора компактного формата (вызывается из @option)."""
+    oid = option_id(key)
+    other = _KEYS_BY_ID.get(oid)
+    if other is not None and other != key:
+        raise RuntimeError(f"Option id collision: '{key}' and '{other}' → {oid}")
+    _KEYS_BY_ID[oid] = key
+    return oid
+
+
+class PayloadStore:
+    """
+    Параметры, не влезшие в callback_data: таблица callback_payloads + LRU/TTL в памяти.
+    put() синхронный (его зовёт KeyboardRenderer) — запись в БД откладывается до flush().
+    """
+
+    def __init__(self, *, max_size: int = CALLBACK_PAYLOAD_MAX, ttl: float = CALLBACK_PAYLOAD_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._last_prune = 0.0
+
+    @staticmethod
+    def token_for(params: Mapping[str, Any]) -> str:
+        """Токен — хэш параметров: одна и та же кнопка при каждом рендере даёт ту же ссылку."""
+        raw = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return base64.urlsafe_b64encode(hashlib.blake2b(raw.encode("utf-8"), digest_size=6).digest()).decode()
+
+    def put(self, params: Mapping[str, Any]) -> str:
+        params = dict(params)
+        token = self.token_for(params)
+        self._remember(token, params)
+        try:
+            json.dumps(params)
+        except TypeError:
+            logging.warning("Callback payload %s не сериализуется в JSON — хранится только в памяти процесса", token)
+        else:
+            self._pending[token] = params
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Только память процесса (без БД)."""
+        item = self._items.get(token)
+        if item is None or time.monotonic() - item[0] >= self.ttl:
+            self._items.pop(token, None)
+            return None
+        self._items.move_to_end(token)
+        return dict(item[1])
+
+    async def load(self, token: str) -> Optional[Dict[str, Any]]:
+        """Память, на промахе — таблица callback_payloads."""
+        params = self.get(token)
+        if params is not None:
+            return params
+        try:
+            async with SessionLocal() as session:
+                params = (await session.execute(
+                    select(CallbackPayload.params)
+                    .where(CallbackPayload.token == token, CallbackPayload.expires_at > now_utc())
+                )).scalar_one_or_none()
+        except Exception:
+            logging.exception("Callback payload %s: не удалось прочитать из БД", token)
+            return None
+        if params is None:
+            return None
+        self._remember(token, params)
+        return dict(params)
+
+    async def flush(self) -> int:
+        """Пишет новые параметры в БД (перед отправкой сообщения с кнопками). Ошибка — повтор в следующий раз."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        expires_at = now_utc() + timedelta(seconds=self.ttl)
+        try:
+            async with SessionLocal() as session:
+                # повторный рендер той же кнопки продлевает срок жизни
+                await session.execute(delete(CallbackPayload).where(CallbackPayload.token.in_(list(pending))))
+                session.add_all(
+                    CallbackPayload(token=token, params=params, expires_at=expires_at)
+                    for token, params in pending.items()
+                )
+                if time.monotonic() - self._last_prune >= _PRUNE_EVERY_SEC:
+                    await session.execute(delete(CallbackPayload).where(CallbackPayload.expires_at <= now_utc()))
+                    self._last_prune = time.monotonic()
+                await session.commit()
+        except Exception:
+            logging.exception("Callback payloads: не удалось записать в БД (%d шт.)", len(pending))
+            self._pending = {**pending, **self._pending}
+            return 0
+        return len(pending)
+
+    def _remember(self, token: str, params: Dict[str, Any]) -> None:
+        self._items[token] = (time.monotonic(), dict(params))
+        self._items.move_to_end(token)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+payload_store = PayloadStore()
+
+
+def _encode_value(v: Any) -> str:
+    if v is None:
+        return "N"
+    if isinstance(v, bool):
+        return "T" if v else "F"
+    if isinstance(v, int):
+        return str(v)
+    if isinstance(v, float):
+        return f"f{v!r}"
+    if isinstance(v, str):
+        return "'" + quote(v, safe="")
+    return "j" + quote(json.dumps(v, ensure_ascii=False, separators=(",", ":")), safe="")
+
+
+def _decode_value(t: str) -> Any:
+    head = t[:1]
+    if head == "'":
+        return unquote(t[1:])
+    if head == "T":
+        return True
+    if head == "F":
+        return False
+    if head == "N":
+        return None
+    if head == "f":
+        return float(t[1:])
+    if head == "j":
+        return json.loads(unquote(t[1:]))
+    return int(t)
+
+
+def encode_callback_data(key: str, params: Optional[Mapping[str, Any]] = None) -> str:
+    """callback_data для кнопки опции key с параметрами params."""
+    head = _PREFIX + option_id(key)
+    fields = []
+    for name, v in (params or {}).items():
+        code = FIELD_CODES.get(name)
+        fields.append((code if code else "!" + quote(name, safe="") + "=") + _encode_value(v))
+    data = _SEP.join([head, *fields])
+    if len(data.encode("utf-8")) <= CALLBACK_DATA_LIMIT:
+        return data
+    return head + _REF + payload_store.put(params)
+
+
+def _split_ref(data: str) -> Tuple[Optional[str], Optional[str]]:
+    """Для ссылки "~<id>*<токен>" — (ключ опции, токен), иначе (None, None)."""
+    if not data.startswith(_PREFIX) or _REF not in data:
+        return None, None
+    oid, ref = data[len(_PREFIX):].split(_REF, 1)
+    return _KEYS_BY_ID.get(oid), ref
+
+
+async def resolve_callback_data(data: str):
+    """parse_callback_data() с разбором ссылок на хранилище (из памяти или из БД)."""
+    key, ref = _split_ref(data or "")
+    if key is None:
+        return parse_callback_data(data)
+    kwargs = await payload_store.load(ref)
+    if kwargs is None:
+        logging.warning("Callback payload %s для %s не найден (истёк CALLBACK_PAYLOAD_TTL)", ref, key)
+        return key, {}
+    return key, kwargs
+
+
+def _decode_compact(data: str) -> Tuple[str, Dict[str, Any]]:
+    body = data[len(_PREFIX):]
+    ref = None
+    if _REF in body:
+        body, ref = body.split(_REF, 1)
+    oid, *fields = body.split(_SEP)
+    key = _KEYS_BY_ID.get(oid)
+    if key is None:
+        return data, {}
+
+    if ref is not None:
+        kwargs = payload_store.get(ref)
+        if kwargs is None:
+            logging.warning("Callback payload %s для %s не найден в памяти — нужен resolve_callback_data()", ref, key)
+            return key, {}
+        return key, kwargs
+
+    kwargs: Dict[str, Any] = {}
+    for f in fields:
+        if f.startswith("!"):
+            name, _, token = f[1:].partition("=")
+            name = unquote(name)
+        else:
+            name, token = _FIELD_NAMES.get(f[:1], f[:1]), f[1:]
+        try:
+            kwargs[name] = _decode_value(token)
+        except ValueError:
+            logging.warning("Callback %s: не разобрано поле %r", key, f)
+    return key, kwargs
+
+
 def parse_callback_data(data: str):
     """
-    Возвращает (key, kwargs). Поддерживает формат key?x=1&y=2.
-    Автоприведение типов: int, float, bool, json.
+    Возвращает (key, kwargs). Компактный формат (~...) или старый key?x=1&y=2
+    (для старого — автоприведение типов: int, float, bool, json).
     """
     if not data:
         return "", {}
 
+    if data.startswith(_PREFIX):
+        return _decode_compact(data)
+
     if "?" not in data:
         return data, {}
 
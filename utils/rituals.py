@@ -1,11 +1,8 @@
 # utils/rituals.py
-import os
 from typing import Optional, Sequence
 import gspread
-from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
 
-load_dotenv()
+from utils.sheets import OUTBOX_KEY_COLUMN, append_rows, ensure_header, get_client, get_worksheet
 
 # Шапка листа "rituals" строго в таком виде и порядке:
 RITUALS_HEADER: Sequence[str] = (
@@ -17,35 +14,32 @@ RITUALS_HEADER: Sequence[str] = (
     "action_id"
 )
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-
-
-def _ensure_header(ws: gspread.Worksheet, header: Sequence[str]) -> None:
-    current = ws.row_values(1)
-
-    # если шапка совпадает — ничего не делаем
-    if current == list(header):
-        return
-
-    # иначе выставляем правильную шапку (создастся/перезапишется)
-    cur_cols = ws.col_count
-    need_cols = len(header)
-    if cur_cols < need_cols:
-        ws.add_cols(need_cols - cur_cols)
-    ws.update("A1", [list(header)])
 
+def _open_ws(spreadsheet_id: Optional[str], title: str, header: Sequence[str]) -> gspread.Worksheet:
+    ws = get_worksheet(title, spreadsheet_id=spreadsheet_id, create_header=header)
+    # шапка — из кэша; при несовпадении перечитываем и при необходимости перезаписываем
+    # (колонку outbox_key справа дописывает outbox — она не несовпадение)
+    ensure_header(ws, header, allow_extra=(OUTBOX_KEY_COLUMN,))
+    return ws
 
-def _open_ws(gc: gspread.Client, spreadsheet_id: str, title: str, header: Sequence[str]) -> gspread.Worksheet:
-    sh = gc.open_by_key(spreadsheet_id)
-    try:
-        ws = sh.worksheet(title)
-    except gspread.WorksheetNotFound:
-        ws = sh.add_worksheet(title=title, rows=1, cols=len(header))
-        ws.update("A1", [list(header)])
-        return ws
 
-    _ensure_header(ws, header)
-    return ws
+def ritual_row_payload(
+    *,
+    action_title: str,
+    action_user_in_game_name: str,
+    action_text: str,
+    created_at: str = None,
+    action_id: int = None
+) -> dict:
+    """Значения строки листа 'rituals' по колонкам (ключи — имена колонок в нижнем регистре)."""
+    return {
+        "title": (action_title or "").strip(),
+        "user": (action_user_in_game_name or "").strip(),
+        "text": (action_text or "").strip(),
+        "created_at": str(created_at),
+        "resolved": "FALSE",
+        "action_id": action_id,
+    }
 
 
 def append_ritual(
@@ -63,23 +57,18 @@ def append_ritual(
     Добавляет строку в лист 'rituals' с колонками:
     action.title, action.user.in_game_name, action.text, RESOLVED
     """
-    spreadsheet_id = spreadsheet_id or os.environ["SPREADSHEET_ID"]
-    service_account_path = service_account_path or os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-
-    creds = Credentials.from_service_account_file(service_account_path, scopes=SCOPES)
-    gc = gspread.authorize(creds)
-
-    ws = _open_ws(gc, spreadsheet_id, worksheet_title, RITUALS_HEADER)
-
-    row = [
-        (action_title or "").strip(),
-        (action_user_in_game_name or "").strip(),
-        (action_text or "").strip(),
-        str(created_at),
-        "FALSE",
-        action_id
-    ]
-    ws.append_row(row, value_input_option="USER_ENTERED")
+    get_client(service_account_path)  # общий клиент процесса (путь учитывается при первом вызове)
+    ws = _open_ws(spreadsheet_id, worksheet_title, RITUALS_HEADER)
+
+    payload = ritual_row_payload(
+        action_title=action_title,
+        action_user_in_game_name=action_user_in_game_name,
+        action_text=action_text,
+        created_at=created_at,
+        action_id=action_id,
+    )
+    row = [payload[h.lower()] for h in RITUALS_HEADER]
+    append_rows(ws, [row])
 
 
 if __name__ == "__main__":
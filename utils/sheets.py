@@ -0,0 +1,177 @@
+# utils/sheets.py
+"""
+Общий слой доступа к Google Sheets.
+
+- один авторизованный gspread.Client на процесс (его requests.Session переиспользуется между вызовами);
+- кэш Spreadsheet/Worksheet по (spreadsheet_id, title) — без повторных open_by_key/worksheet;
+- кэш шапок (row_values(1)) с TTL; при несовпадении шапки или ошибке записи кэш листа сбрасывается.
+
+Вызовы синхронные (gspread), поэтому из async-кода — через asyncio.to_thread; кэши защищены локом.
+
+Служебная колонка OUTBOX_KEY_COLUMN ("outbox_key") — ключ строки, записанной из outbox
+(services.sheets_outbox). Её добавляет флашер в конец шапки листов RAW, rituals,
+news_to_print и ask_and_answer; правя эти листы руками, колонку не удаляйте и не переставляйте —
+по ней повторная запись не дублирует строки.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, MutableMapping, Optional, Sequence, Tuple
+
+import gspread
+from gspread.utils import a1_to_rowcol
+from dotenv import load_dotenv
+from google.oauth2.service_account import Credentials
+
+log = logging.getLogger("sheets")
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+HEADER_TTL_SEC = float(os.getenv("SHEETS_HEADER_TTL", "300"))
+OUTBOX_KEY_COLUMN = "outbox_key"
+
+_lock = threading.RLock()
+_client: Optional[gspread.Client] = None
+_spreadsheets: Dict[str, gspread.Spreadsheet] = {}
+_worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+_headers: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+
+
+def _getenv_required(key: str) -> str:
+    v = os.getenv(key)
+    if not v:
+        raise RuntimeError(f"ENV '{key}' не задан. Добавьте его в .env или установите в окружении.")
+    return v
+
+
+def get_client(service_account_path: Optional[str] = None) -> gspread.Client:
+    """Авторизованный клиент (создаётся один раз на процесс)."""
+    global _client
+    with _lock:
+        if _client is None:
+            load_dotenv()
+            sa_path = service_account_path or _getenv_required("GOOGLE_APPLICATION_CREDENTIALS")
+            creds = Credentials.from_service_account_file(sa_path, scopes=SCOPES)
+            _client = gspread.authorize(creds)
+        return _client
+
+
+def get_spreadsheet(spreadsheet_id: Optional[str] = None) -> gspread.Spreadsheet:
+    load_dotenv()
+    sid = spreadsheet_id or _getenv_required("SPREADSHEET_ID")
+    with _lock:
+        sh = _spreadsheets.get(sid)
+        if sh is None:
+            sh = _spreadsheets[sid] = get_client().open_by_key(sid)
+        return sh
+
+
+def _key(ws: gspread.Worksheet) -> Tuple[str, str]:
+    return ws.spreadsheet_id, ws.title
+
+
+def get_worksheet(
+    title: str,
+    *,
+    spreadsheet_id: Optional[str] = None,
+    create_header: Optional[Sequence[str]] = None,
+) -> gspread.Worksheet:
+    """
+    Лист по названию (из кэша). Если листа нет и задан create_header — создаёт его с этой шапкой,
+    иначе пробрасывает gspread.WorksheetNotFound.
+    """
+    sh = get_spreadsheet(spreadsheet_id)
+    with _lock:
+        ws = _worksheets.get((sh.id, title))
+        if ws is not None:
+            return ws
+        try:
+            ws = sh.worksheet(title)
+        except gspread.WorksheetNotFound:
+            if create_header is None:
+                raise
+            ws = sh.add_worksheet(title=title, rows=1, cols=len(create_header))
+            ws.update("A1", [list(create_header)])
+            _headers[_key(ws)] = (time.monotonic(), list(create_header))
+        _worksheets[_key(ws)] = ws
+        return ws
+
+
+def get_header(ws: gspread.Worksheet, *, refresh: bool = False) -> List[str]:
+    """Шапка листа (row_values(1)) из кэша с TTL."""
+    key = _key(ws)
+    with _lock:
+        cached = _headers.get(key)
+        if not refresh and cached and time.monotonic() - cached[0] < HEADER_TTL_SEC:
+            return list(cached[1])
+    header = ws.row_values(1)
+    with _lock:
+        _headers[key] = (time.monotonic(), list(header))
+    return list(header)
+
+
+def set_header(ws: gspread.Worksheet, header: Sequence[str]) -> None:
+    """Записывает шапку (A1) и кладёт её в кэш; при нехватке колонок — добавляет их."""
+    if ws.col_count < len(header):
+        ws.add_cols(len(header) - ws.col_count)
+    ws.update("A1", [list(header)])
+    with _lock:
+        _headers[_key(ws)] = (time.monotonic(), list(header))
+
+
+def ensure_header(ws: gspread.Worksheet, expected: Sequence[str], *, allow_extra: Sequence[str] = ()) -> List[str]:
+    """
+    Проверяет шапку по кэшу; при несовпадении перечитывает её с сервера
+    (кэш мог устареть — лист правят руками) и только потом перезаписывает.
+    allow_extra — служебные колонки, которые могут стоять справа от expected
+    (например, OUTBOX_KEY_COLUMN у листов, куда пишет outbox); любые другие лишние
+    колонки считаются несовпадением.
+    """
+    expected = list(expected)
+
+    def matches(header: List[str]) -> bool:
+        return header[:len(expected)] == expected and all(h in allow_extra for h in header[len(expected):])
+
+    header = get_header(ws)
+    if matches(header):
+        return header
+    header = get_header(ws, refresh=True)
+    if not matches(header):
+        set_header(ws, expected)
+        return expected
+    return header
+
+
+def invalidate(ws: Optional[gspread.Worksheet] = None) -> None:
+    """Сбрасывает кэш листа (или весь кэш, если ws не задан)."""
+    with _lock:
+        if ws is None:
+            _spreadsheets.clear()
+            _worksheets.clear()
+            _headers.clear()
+            return
+        _worksheets.pop(_key(ws), None)
+        _headers.pop(_key(ws), None)
+
+
+def appended_row_numbers(response: MutableMapping) -> List[int]:
+    """
+    1-based номера строк, добавленных append_rows — из updates.updatedRange ответа
+    (например, "RAW!A120:H122" → [120, 121, 122]), без перечитывания листа.
+    """
+    updated = (response or {}).get("updates", {}).get("updatedRange")
+    if not updated:
+        return []
+    cells = updated.rsplit("!", 1)[-1].split(":")
+    first = a1_to_rowcol(cells[0])[0]
+    last = a1_to_rowcol(cells[-1])[0]
+    return list(range(first, last + 1))
+
+
+def append_rows(ws: gspread.Worksheet, rows: List[list]) -> MutableMapping:
+    """append_rows с USER_ENTERED; при ошибке сбрасывает кэш листа (лист могли переименовать/удалить)."""
+    try:
+        return ws.append_rows(rows, value_input_option="USER_ENTERED")
+    except Exception:
+        invalidate(ws)
+        raise